@@ -1,7 +1,17 @@
+import os
+import sys
 import torch
 from diffusers import AutoencoderKL
 from tqdm import tqdm
 
+try:
+    from efficient_diffusion_loader.tile_plan import TilePlan
+except ImportError:
+    # Not installed (pip install -e .): use the src/ copy next to this file,
+    # so the script works from any working directory
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    from efficient_diffusion_loader.tile_plan import TilePlan
+
 class TiledVAEWrapper:
     def __init__(self, vae: AutoencoderKL, tile_size=512, overlap=32):
         self.vae = vae
@@ -37,57 +47,36 @@ class TiledVAEWrapper:
 
         # 2. Grid Calculation
         # We define a sliding window over the latent space
-        grid_rows = self._get_grid(height, self.latent_tile_size, self.latent_overlap)
-        grid_cols = self._get_grid(width, self.latent_tile_size, self.latent_overlap)
+        plan = self._get_plan(latents.shape)
 
         # 3. Fractional Batch Loop 
-        print(f"Starting Tiled Decode: {len(grid_rows) * len(grid_cols)} tiles...")
+        print(f"Starting Tiled Decode: {len(plan)} tiles...")
         
-        for h_start in tqdm(grid_rows):
-            for w_start in grid_cols:
-                # Define latent crop coordinates
-                h_end = min(h_start + self.latent_tile_size, height)
-                w_end = min(w_start + self.latent_tile_size, width)
-                
-                # Adjust start if we hit the edge to keep tile size constant
-                h_start = max(0, h_end - self.latent_tile_size)
-                w_start = max(0, w_end - self.latent_tile_size)
-
-                # Crop Latent (Fractional Batch)
-                latent_tile = latents[:, :, h_start:h_end, w_start:w_end]
-                
-                # Move to GPU for inference
-                latent_tile = latent_tile.to(self.vae.device)
-
-                # Decode the specific tile
-                with torch.no_grad():
-                    decoded_tile = self.vae.decode(latent_tile).sample
-
-                # Move back to CPU for storage 
-                decoded_tile = decoded_tile.to('cpu')
-
-                # Calculate Pixel Coordinates for placement
-                px_h_start = h_start * self.scale_factor
-                px_h_end = h_end * self.scale_factor
-                px_w_start = w_start * self.scale_factor
-                px_w_end = w_end * self.scale_factor
-
-                # Accumulate into buffer (Simple addition for now, blending comes next)
-                decoded_buffer[:, :, px_h_start:px_h_end, px_w_start:px_w_end] += decoded_tile
-                count_buffer[:, :, px_h_start:px_h_end, px_w_start:px_w_end] += 1
+        for tile in tqdm(plan):
+            # Crop Latent (Fractional Batch)
+            latent_tile = latents[:, :, tile.h_start:tile.h_end, tile.w_start:tile.w_end]
+            
+            # Move to GPU for inference
+            latent_tile = latent_tile.to(self.vae.device)
+
+            # Decode the specific tile
+            with torch.no_grad():
+                decoded_tile = self.vae.decode(latent_tile).sample
+
+            # Move back to CPU for storage 
+            decoded_tile = decoded_tile.to('cpu')
+
+            # Accumulate into buffer (Simple addition for now, blending comes next)
+            decoded_buffer[:, :, tile.px_h_start:tile.px_h_end, tile.px_w_start:tile.px_w_end] += decoded_tile
+            count_buffer[:, :, tile.px_h_start:tile.px_h_end, tile.px_w_start:tile.px_w_end] += 1
 
         # 4. Normalize by overlap count to blend seams
         final_image = decoded_buffer / count_buffer
         return final_image
 
-    def _get_grid(self, dim_size, tile_size, overlap):
-        """Helper to generate start indices"""
-        grid = []
-        pos = 0
-        while pos < dim_size:
-            grid.append(pos)
-            pos += (tile_size - overlap)
-        return grid
+    def _get_plan(self, latent_shape):
+        """Helper to build the de-duplicated tile windows"""
+        return TilePlan(latent_shape, self.latent_tile_size, self.latent_overlap, scale_factor=self.scale_factor)
 
     def decode_with_blending(self, latents: torch.Tensor):
         batch, channels, height, width = latents.shape
@@ -102,45 +91,31 @@ class TiledVAEWrapper:
         # We do this ONCE to save compute
         tile_mask = self._get_gaussian_mask(self.tile_size, self.tile_size)
 
-        grid_rows = self._get_grid(height, self.latent_tile_size, self.latent_overlap)
-        grid_cols = self._get_grid(width, self.latent_tile_size, self.latent_overlap)
+        plan = self._get_plan(latents.shape)
         
         print(f"Orchestrating Tiled Decode with Gaussian Blending...")
 
-        for h_start in tqdm(grid_rows):
-            for w_start in grid_cols:
-                # ... [Coordinate logic remains the same as previous step] ...
-                h_end = min(h_start + self.latent_tile_size, height)
-                w_end = min(w_start + self.latent_tile_size, width)
-                h_start = max(0, h_end - self.latent_tile_size)
-                w_start = max(0, w_end - self.latent_tile_size)
-
-                # Crop Latent
-                latent_tile = latents[:, :, h_start:h_end, w_start:w_end].to(self.vae.device)
-
-                # Decode
-                with torch.no_grad():
-                    decoded_tile = self.vae.decode(latent_tile).sample
-                
-                # --- CRITICAL CHANGE ---
-                # Apply the weight mask to the decoded tile
-                weighted_tile = decoded_tile * tile_mask
-
-                # Move to CPU
-                weighted_tile = weighted_tile.to('cpu')
-                mask_cpu = tile_mask.to('cpu')
-
-                # Calculate Pixel Coordinates
-                px_h_start = h_start * self.scale_factor
-                px_w_start = w_start * self.scale_factor
-                px_h_end = px_h_start + self.tile_size
-                px_w_end = px_w_start + self.tile_size
-
-                # Accumulate Weighted Tile
-                decoded_buffer[:, :, px_h_start:px_h_end, px_w_start:px_w_end] += weighted_tile
-                
-                # Accumulate Weights (so we can normalize later)
-                weight_buffer[:, :, px_h_start:px_h_end, px_w_start:px_w_end] += mask_cpu
+        for tile in tqdm(plan):
+            # Crop Latent
+            latent_tile = latents[:, :, tile.h_start:tile.h_end, tile.w_start:tile.w_end].to(self.vae.device)
+
+            # Decode
+            with torch.no_grad():
+                decoded_tile = self.vae.decode(latent_tile).sample
+            
+            # --- CRITICAL CHANGE ---
+            # Apply the weight mask to the decoded tile
+            weighted_tile = decoded_tile * tile_mask
+
+            # Move to CPU
+            weighted_tile = weighted_tile.to('cpu')
+            mask_cpu = tile_mask.to('cpu')
+
+            # Accumulate Weighted Tile
+            decoded_buffer[:, :, tile.px_h_start:tile.px_h_end, tile.px_w_start:tile.px_w_end] += weighted_tile
+            
+            # Accumulate Weights (so we can normalize later)
+            weight_buffer[:, :, tile.px_h_start:tile.px_h_end, tile.px_w_start:tile.px_w_end] += mask_cpu
 
         # Normalize: (Tile A * Weight A + Tile B * Weight B) / (Weight A + Weight B)
         # Add small epsilon to avoid division by zero
@@ -1,13 +1,14 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import Response
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from io import BytesIO
-from PIL import Image
-import torch
-import zipfile
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import json
+import os
 
-# Import all modules
-from efficient_diffusion_loader import EdgeForgePipeline, PromptExpander, AutoLabeler, LayoutAugmenter
+# Lazy package: torch / diffusers / ultralytics are only imported by the loaders below
+import efficient_diffusion_loader as edl
+from efficient_diffusion_loader import metrics
 
 app = FastAPI(title="EdgeForge AI API", version="0.1.0")
 
@@ -19,107 +20,621 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Samples per diffusion call in the batch factory
+GENERATION_MICRO_BATCH = 2
+# /generate dynamic batching: concurrent single-shot requests share one diffusion call.
+# A batch closes after GENERATE_MAX_WAIT seconds or GENERATE_MAX_BATCH requests (1 = off)
+GENERATE_MAX_BATCH = int(os.environ.get("EDGEFORGE_GENERATE_MAX_BATCH", 4))
+GENERATE_MAX_WAIT = float(os.environ.get("EDGEFORGE_GENERATE_WAIT_MS", 25)) / 1000
+# Deterministic /generate results are cached on disk, keyed by content (LRU, size-bounded)
+RESULT_CACHE_DIR = os.environ.get("EDGEFORGE_RESULT_CACHE_DIR", os.path.expanduser("~/.cache/edgeforge/results"))
+RESULT_CACHE_MB = float(os.environ.get("EDGEFORGE_RESULT_CACHE_MB", 2048))
+# Background batch jobs run one at a time (they share the device); results live here
+JOB_RESULTS_DIR = os.environ.get("EDGEFORGE_JOB_DIR")
+# Image encoding threads (batch encode stage + /generate encoder pool)
+ENCODE_WORKERS = int(os.environ.get("EDGEFORGE_ENCODE_WORKERS", max(2, min(4, os.cpu_count() or 1))))
+# Chrome traces of profiled requests (temp dir if unset); the newest EDGEFORGE_MAX_TRACES are kept
+TRACE_DIR = os.environ.get("EDGEFORGE_TRACE_DIR")
+MAX_TRACES = int(os.environ.get("EDGEFORGE_MAX_TRACES", 16))
+# Worker processes for layout remixing / Canny (0 = inline on the request thread).
+# One core stays with the server process, which drives the device and encodes.
+CPU_WORKERS = int(os.environ.get("EDGEFORGE_CPU_WORKERS", max(0, min(4, (os.cpu_count() or 1) - 1))))
+
+# Multi-worker serving, e.g. gunicorn --preload -k uvicorn.workers.UvicornWorker -w 4:
+# EDGEFORGE_PRELOAD=1 maps the weights once in the master process (CPU only, no CUDA)
+# and every forked worker reuses those models instead of loading its own copy.
+if os.environ.get("EDGEFORGE_PRELOAD") == "1":
+    edl.EdgeForgePipeline.load_models()
+    edl.AutoLabeler.load_model()
+
 # Global Variables
 forge_pipeline = None
 director = None
 labeler = None
 layout_engine = None
+model_loader = None
+job_manager = None
+generate_batcher = None
+result_cache = None
+trace_store = None
+image_encoder = None
+cpu_executor = None
+
+def _load_forge_pipeline():
+    import torch
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return edl.EdgeForgePipeline(device=device)
+
+# Independent components, loaded concurrently. Keys are the global names above.
+COMPONENT_FACTORIES = {
+    "forge_pipeline": _load_forge_pipeline,
+    "labeler": lambda: edl.AutoLabeler(),
+    "director": lambda: edl.PromptExpander(),
+    "layout_engine": lambda: edl.LayoutAugmenter(), # Initialize Remix Engine
+    "cpu_executor": lambda: edl.CPUExecutor(workers=CPU_WORKERS).warm_up(), # Workers spawned now, not on the first batch
+}
+
+def _publish_component(name, component):
+    globals()[name] = component
 
 @app.on_event("startup")
 def load_models():
-    global forge_pipeline, director, labeler, layout_engine
+    global model_loader
     print("Loading EdgeForge Factory...")
-    director = PromptExpander()
-    labeler = AutoLabeler()
-    layout_engine = LayoutAugmenter() # Initialize Remix Engine
-    
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    forge_pipeline = EdgeForgePipeline(device=device)
-    print("Factory Ready! 🚀")
+    # Returns immediately: the server accepts /health while the models load
+    model_loader = edl.ComponentLoader(COMPONENT_FACTORIES, on_loaded=_publish_component).start()
+
+def _require_ready():
+    if model_loader is None or not model_loader.ready:
+        raise HTTPException(status_code=503, detail="EdgeForge engine is still loading, see /ready")
+
+def _engine_status():
+    if model_loader is None:
+        return {"state": "pending", "components": {}, "loaded": 0, "total": len(COMPONENT_FACTORIES), "elapsed": None}
+    status = model_loader.status()
+    load_times = getattr(forge_pipeline, "load_times", None)
+    if load_times:
+        status["components"]["forge_pipeline"]["breakdown"] = dict(load_times)
+    return status
+
+@app.get("/health")
+def health_endpoint():
+    """ Liveness: the API is up. Includes per-component load state and times. """
+    return _engine_status()
+
+@app.get("/ready")
+def ready_endpoint():
+    """ Readiness: 200 once every model is loaded, 503 while loading (or after a failed load) """
+    status = _engine_status()
+    if status["state"] != "ready":
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """ Prometheus text format: per-stage latency histograms, per-tile decode times, images, memory """
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+def build_batch_engine(base_edges, zip_file, defer_decode=False, on_written=None, check_cancelled=None, image_format=None,
+                       layouts=None):
+    """
+    Layout -> diffusion -> decode -> label -> encode -> zip, one stage each.
+    defer_decode: layout -> diffusion -> export -> zip, the archive holds latents
+    (decode them later in bulk with efficient_diffusion_loader.latents.decode_job)
+    image_format: edl.ImageFormat of images/train_XXXX.<ext> (PNG level 6 by default)
+    layouts: edl.PrecomputedLayouts of the batch (remixed ahead on the CPU pool);
+    without it every item is remixed inline
+
+    zip_file: anything with ZipFile.writestr (a job writes straight to its directory).
+    on_written(idx, names) is called once an item's files are written;
+    check_cancelled() runs before every new item and raises to stop the batch.
+    """
+
+    def remix(item):
+        if check_cancelled is not None:
+            check_cancelled()
+        # --- GEOMETRY STEP ---
+        # Randomly shift/scale/multiply the car edges
+        if layouts is not None:
+            return dict(item, control_image=layouts.get(item["idx"]))
+        return dict(item, control_image=layout_engine.augment(base_edges, max_objects=3))
+
+    def diffuse(items):
+        # --- GENERATION STEP ---
+        # One diffusion pass per micro-batch, one seeded generator per sample
+        print(f"[{items[0]['idx']+1}-{items[-1]['idx']+1}] Forging...")
+        latents = forge_pipeline.denoise_many(
+            prompts=[item['prompt'] for item in items],
+            control_images=[item['control_image'] for item in items], # Use the Remix!
+            seeds=[item['seed'] for item in items],
+        )
+        return [dict(item, latents=sample) for item, sample in zip(items, latents)]
+
+    def decode(item):
+        item.pop("control_image")
+        item["image"] = forge_pipeline.decode_latents(item.pop("latents"))
+        return item
+
+    def label(item):
+        # --- LABELING STEP ---
+        item["label"] = labeler.label_image(item["image"])
+        return item
+
+    if image_format is None:
+        image_format = edl.ImageFormat()
+
+    def encode(item):
+        # --- SAVE STEP ---
+        item["encoded"] = _get_image_encoder().encode(item.pop("image"), image_format)
+        return item
+
+    def write(item):
+        filename = f"train_{item['idx']:04d}"
+        names = [f"images/{filename}{image_format.extension}", f"labels/{filename}.txt"]
+        with metrics.timed("zip_write"):
+            zip_file.writestr(names[0], item["encoded"])
+            zip_file.writestr(names[1], item["label"])
+        metrics.record_images(1, endpoint="batch")
+        if on_written is not None:
+            on_written(item['idx'], names)
+        # Manifest entry
+        return {"image": names[0], "label": names[1], "bytes": len(item["encoded"]),
+                "prompt": item.get("prompt"), "seed": item.get("seed")}
+
+    def export(item):
+        # Records the remixed layout actually used for conditioning
+        with metrics.timed("latent_export"):
+            metadata = forge_pipeline.latent_metadata(item['prompt'], item['seed'], item.pop('control_image'))
+            metadata["constraints"] = item.get('constraints')
+            item["latent_file"] = edl.serialize_latents(item.pop("latents"), metadata)
+        return item
+
+    def write_latents(item):
+        filename = f"train_{item['idx']:04d}"
+        name = f"latents/{filename}.safetensors"
+        with metrics.timed("zip_write"):
+            zip_file.writestr(name, item["latent_file"])
+        metrics.record_images(1, endpoint="batch_latents")
+        if on_written is not None:
+            on_written(item['idx'], [name])
+        return {"latents": name, "bytes": len(item["latent_file"]), "prompt": item.get("prompt"), "seed": item.get("seed")}
+
+    if defer_decode:
+        return edl.StagedPipeline([
+            edl.Stage("layout", remix),
+            edl.Stage("diffusion", diffuse, batch_size=GENERATION_MICRO_BATCH),
+            edl.Stage("export", export),
+            edl.Stage("write", write_latents),
+        ], queue_size=GENERATION_MICRO_BATCH)
+
+    return edl.StagedPipeline([
+        edl.Stage("layout", remix),
+        edl.Stage("diffusion", diffuse, batch_size=GENERATION_MICRO_BATCH),
+        edl.Stage("decode", decode),
+        edl.Stage("label", label),
+        edl.Stage("encode", encode, workers=ENCODE_WORKERS), # zlib / libwebp / libjpeg release the GIL
+        edl.Stage("write", write), # ZipFile is not thread-safe: one writer
+    ], queue_size=GENERATION_MICRO_BATCH)
+
+def prepare_batch(image_bytes, intent, batch_size):
+    """ Base edges + prompt variations: the quick part, before any item is produced """
+    # 1. Load Base Layout
+    # Get base edges (The single car)
+    base_edges = forge_pipeline.preprocess_canny(image_bytes, executor=_get_cpu_executor())
+
+    # 2. Director: Get Prompt Variations
+    variations = director.generate_variations(intent, count=batch_size)
+    return base_edges, variations
+
+def run_batch(zip_file, base_edges, variations, defer_decode=False, endpoint="generate_batch", image_format=None,
+              **engine_kwargs):
+    """
+    The whole batch, blocking: shared by /generate_batch and the job worker.
+    Ends with manifest.json, then timing.json when the caller bound a request timing.
+    """
+    if image_format is None:
+        image_format = edl.ImageFormat()
+    # 3. Production Line
+    # Every step is its own stage with bounded queues in between: the device
+    # denoises the next micro-batch while the CPU labels / compresses the last one
+    print(f"Starting Batch Generation of {len(variations)} images...")
+    # Every remixed layout is submitted to the CPU pool now and is ready before
+    # diffusion asks for it; a variation's seed makes its layout reproducible
+    layouts = _get_cpu_executor().augment_many(
+        layout_engine, base_edges, [var.get("seed") for var in variations], max_objects=3
+    )
+    engine = build_batch_engine(base_edges, zip_file, defer_decode=defer_decode, image_format=image_format,
+                                layouts=layouts, **engine_kwargs)
+    timing = metrics.current_timing()
+    try:
+        items = engine.run(dict(var, idx=idx) for idx, var in enumerate(variations))
+    finally:
+        layouts.close()
+        # A profiled batch keeps its trace even when it fails or is cancelled
+        _save_trace(timing)
+    print(engine.report())
+    if engine.total_seconds:
+        metrics.REGISTRY.set_gauge("edgeforge_last_batch_images_per_second", len(variations) / engine.total_seconds)
+
+    zip_file.writestr("manifest.json", _manifest(None if defer_decode else image_format, items))
+    # The request's timing block travels with the results
+    if timing is not None:
+        zip_file.writestr("timing.json", json.dumps(_finish_timing(timing, endpoint), indent=2))
+    return engine
+
+def _manifest(image_format, items):
+    """ manifest.json: the output format (None = latents) + one entry per item """
+    return json.dumps({
+        "image_format": image_format.describe() if image_format is not None else None,
+        "latents": "safetensors" if image_format is None else None,
+        "count": len(items),
+        "items": items,
+    }, indent=2)
+
+def _finish_timing(timing, endpoint):
+    block = timing.finish().as_dict()
+    metrics.REGISTRY.observe("edgeforge_request_seconds", block["total_seconds"], endpoint=endpoint)
+    return block
+
+def _run_job(job, intent, image_bytes, batch_size, defer_decode, profile=False, image_format="png"):
+    with metrics.request_timing() as timing:
+        job.timing = timing
+        if profile:
+            timing.trace = _start_trace(f"job {job.id}")
+        try:
+            base_edges, variations = prepare_batch(image_bytes, intent, batch_size)
+            job.set_total(len(variations))
+            engine = run_batch(
+                job, base_edges, variations, defer_decode=defer_decode, endpoint="jobs",
+                image_format=edl.ImageFormat.parse(image_format),
+                on_written=job.item_done, check_cancelled=job.check_cancelled,
+            )
+        finally:
+            _save_trace(timing)
+    job.stages = engine.stats()["stages"]
+
+def _get_job_manager():
+    global job_manager
+    if job_manager is None:
+        job_manager = edl.JobManager(_run_job, results_dir=JOB_RESULTS_DIR)
+    return job_manager
+
+# --- PROFILING ---
+# A request sent with the X-EdgeForge-Profile: 1 header (or profile=true) records a
+# Chrome / Perfetto trace: stage spans + tiled VAE batches, plus torch.profiler ops and
+# kernels. Download it from /debug/traces/{id}. Unprofiled requests pay nothing extra.
+
+def _get_trace_store():
+    global trace_store
+    if trace_store is None:
+        trace_store = edl.TraceStore(TRACE_DIR, max_traces=MAX_TRACES)
+    return trace_store
+
+def _profile_requested(request, profile):
+    return profile or request.headers.get("X-EdgeForge-Profile", "").lower() in ("1", "true", "yes", "on")
+
+def _start_trace(name):
+    return _get_trace_store().register(edl.RequestTrace(name)).start()
+
+def _save_trace(timing):
+    if timing is not None and timing.trace is not None:
+        _get_trace_store().save(timing.trace)
+
+def _trace_headers(timing):
+    if timing.trace is None:
+        return None
+    return {"X-EdgeForge-Trace": timing.trace.id, "X-EdgeForge-Trace-Url": f"/debug/traces/{timing.trace.id}"}
+
+@app.get("/debug/traces")
+def list_traces_endpoint():
+    return _get_trace_store().list()
+
+@app.get("/debug/traces/{trace_id}")
+def trace_endpoint(trace_id: str):
+    """ The Chrome trace JSON: open it in chrome://tracing or ui.perfetto.dev """
+    store = _get_trace_store()
+    info = store.get(trace_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace '{trace_id}'")
+    path = store.path(trace_id)
+    if path is None:
+        raise HTTPException(status_code=409, detail=f"Trace '{trace_id}' is still recording")
+    return FileResponse(path, media_type="application/json", filename=f"edgeforge-trace-{trace_id}.json")
+
+def _new_archive(compression):
+    try:
+        return edl.ZipStream(compression=compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _image_format(spec):
+    try:
+        return edl.ImageFormat.parse(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _get_image_encoder():
+    global image_encoder
+    if image_encoder is None:
+        image_encoder = edl.ImageEncoder(workers=ENCODE_WORKERS)
+    return image_encoder
+
+def _get_cpu_executor():
+    global cpu_executor
+    if cpu_executor is None:
+        cpu_executor = edl.CPUExecutor(workers=CPU_WORKERS)
+    return cpu_executor
+
+def _zip_response(archive, filename, headers=None):
+    # Each entry goes out as soon as it is written; memory stays flat whatever the batch size
+    return StreamingResponse(
+        archive,
+        media_type="application/zip",
+        headers=dict(headers or {}, **{"Content-Disposition": f"attachment; filename={filename}"})
+    )
+
+def _prepare_single(image_bytes, intent, modifier_seed=None):
+    # Straight from the upload bytes: no temp file, cached by content hash
+    processed_edges = forge_pipeline.preprocess_canny(image_bytes, executor=_get_cpu_executor())
+    directive = director.expand(intent, seed=modifier_seed)
+    return directive, processed_edges
+
+def _generate_batched(requests):
+    """
+    DynamicBatcher batch_fn: [(prompt, edges, seed)] -> [PIL image], one diffusion
+    pass per group of same-sized layouts. Every sample keeps its own seeded
+    generator, so a request gets the same image whether it was batched or not.
+    """
+    results = [None] * len(requests)
+    groups = {}
+    for i, (_, edges, _) in enumerate(requests):
+        groups.setdefault(edges.size, []).append(i)
+    for indices in groups.values():
+        images = forge_pipeline.generate_many(
+            prompts=[requests[i][0] for i in indices],
+            control_images=[requests[i][1] for i in indices],
+            seeds=[requests[i][2] for i in indices],
+            micro_batch=len(indices),
+        )
+        for i, image in zip(indices, images):
+            results[i] = image
+    return results
+
+def _get_generate_batcher():
+    global generate_batcher
+    if generate_batcher is None:
+        generate_batcher = edl.DynamicBatcher(
+            _generate_batched, max_batch_size=GENERATE_MAX_BATCH, max_wait=GENERATE_MAX_WAIT, name="generate-batcher"
+        )
+    return generate_batcher
+
+def _get_result_cache():
+    global result_cache
+    if result_cache is None:
+        result_cache = edl.ResultCache(RESULT_CACHE_DIR, max_bytes=int(RESULT_CACHE_MB * 1024**2))
+    return result_cache
+
+def _result_fingerprint():
+    """ Models + settings: cached results from another configuration never match """
+    return {
+        "forge": forge_pipeline.fingerprint(),
+        "director": director.fingerprint(),
+        "labeler": getattr(labeler, "weights", None),
+    }
+
+def _lookup_result(image_bytes, intent, seed, image_format):
+    """
+    Deterministic mode: (cache key, modifier seed, cached (files, metadata) or None)
+    """
+    request = [edl.content_hash(image_bytes), intent, seed]
+    # Modifier picks are seeded from the request itself, so a resubmission repeats them
+    modifier_seed = int(edl.ResultCache.make_key(*request)[:16], 16)
+    key = edl.ResultCache.make_key(*request, str(image_format), _result_fingerprint())
+    return key, modifier_seed, _get_result_cache().get(key)
+
+def _write_single(zip_file, files):
+    for name, data in files.items():
+        zip_file.writestr(name, data)
 
 @app.post("/generate")
 async def generate_endpoint(
     intent: str = Form(...),
-    control_image: UploadFile = File(...)
+    control_image: UploadFile = File(...),
+    compression: str = Form("auto"),
+    seed: int = Form(42),
+    deterministic: bool = Form(False),
+    image_format: str = Form("png")
 ):
-    """ Single Shot Endpoint (No layout remixing) """
+    """
+    Single Shot Endpoint (No layout remixing)
+    deterministic=true seeds the prompt modifiers from the request and serves
+    repeats of the same (layout, intent, seed) from the on-disk result cache.
+    image_format: "png[:level]", "webp[:method]" (lossless), "jpeg[:quality]" or "npy"
+    """
+    _require_ready()
+    archive = _new_archive(compression)
+    image_format = _image_format(image_format)
     image_bytes = await control_image.read()
-    input_pil = Image.open(BytesIO(image_bytes)).convert("RGB")
-    input_pil.save("temp_input.png")
-    
-    processed_edges = forge_pipeline.preprocess_canny("temp_input.png")
-    directive = director.expand(intent)
-    
-    result_image = forge_pipeline.generate(
-        prompt=directive['prompt'],
-        control_image=processed_edges,
-        seed=42
+    with metrics.request_timing() as timing:
+        files, headers = await _generate_files(image_bytes, intent, seed, deterministic, image_format)
+
+    # Per-request timing: in the archive and, compact, in a header
+    block = _finish_timing(timing, "generate")
+    files["timing.json"] = json.dumps(block, indent=2).encode()
+    headers["X-EdgeForge-Timing"] = json.dumps(
+        {"total_seconds": round(block["total_seconds"], 4),
+         "stages": {name: round(entry["seconds"], 4) for name, entry in block["stages"].items()}},
+        separators=(",", ":")
     )
-    
-    label_text = labeler.label_image(result_image)
-    
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-        img_buffer = BytesIO()
-        result_image.save(img_buffer, format="PNG")
-        zip_file.writestr("generated_image.png", img_buffer.getvalue())
-        zip_file.writestr("generated_image.txt", label_text)
-        
-    zip_buffer.seek(0)
-    return Response(content=zip_buffer.getvalue(), media_type="application/zip")
+    return _zip_response(archive.produce(_write_single, files), "generated_image.zip", headers)
+
+async def _generate_files(image_bytes, intent, seed, deterministic, image_format):
+    """ /generate body: ({archive name: bytes}, response headers) """
+    key = modifier_seed = None
+    if deterministic:
+        key, modifier_seed, cached = await run_in_threadpool(_lookup_result, image_bytes, intent, seed, image_format)
+        if cached is not None:
+            # Cache hit: no model involved
+            files, _ = cached
+            return dict(files), {"X-EdgeForge-Cache": "hit"}
+
+    # Blocking GPU / CPU work goes to the thread pool: the event loop keeps serving /health
+    directive, processed_edges = await run_in_threadpool(_prepare_single, image_bytes, intent, modifier_seed)
+    # Diffusion joins whatever other /generate requests arrive within the batching window
+    result_image = await asyncio.wrap_future(
+        _get_generate_batcher().submit((directive['prompt'], processed_edges, seed))
+    )
+    # Encoding (encoder pool) overlaps labeling (request thread pool)
+    encoded = asyncio.wrap_future(_get_image_encoder().submit(result_image, image_format))
+    label_text = await run_in_threadpool(labeler.label_image, result_image)
+    image_name = f"generated_image{image_format.extension}"
+    files = {image_name: await encoded, "generated_image.txt": label_text.encode()}
+    metrics.record_images(1, endpoint="generate")
+    files["manifest.json"] = _manifest(image_format, [{
+        "image": image_name, "label": "generated_image.txt", "bytes": len(files[image_name]),
+        "prompt": directive['prompt'], "seed": seed,
+    }]).encode()
+
+    if not deterministic:
+        return files, {}
+    metadata = {"intent": intent, "prompt": directive['prompt'], "constraints": directive['constraints'], "seed": seed}
+    files["generated_image.json"] = json.dumps(dict(metadata, key=key), indent=2).encode()
+    await run_in_threadpool(_get_result_cache().put, key, files, metadata)
+    return files, {"X-EdgeForge-Cache": "miss"}
+
+@app.get("/generate/stats")
+def generate_stats_endpoint():
+    """ Dynamic batcher (queue-wait and batch-size histograms) and result cache (hit rate) """
+    return dict(_get_generate_batcher().stats(), result_cache=_get_result_cache().stats())
 
 @app.post("/generate_batch")
 async def generate_batch_endpoint(
+    request: Request,
     intent: str = Form(...),
     control_image: UploadFile = File(...),
-    batch_size: int = Form(5)
+    batch_size: int = Form(5),
+    defer_decode: bool = Form(False),
+    compression: str = Form("auto"),
+    profile: bool = Form(False),
+    image_format: str = Form("png")
 ):
-    """ Batch Factory Endpoint (WITH layout remixing) """
-    # 1. Load Base Layout
+    """
+    Batch Factory Endpoint (WITH layout remixing)
+    defer_decode=true skips decode/label/encode and returns latents/*.safetensors
+    compression: "stored", "deflated" or "auto" (store the PNGs, deflate the labels)
+    The ZIP is streamed: images/train_XXXX.png + labels/train_XXXX.txt are sent as each item
+    finishes. A failure halfway cuts the download short; for long batches prefer POST /jobs.
+    profile=true (or the X-EdgeForge-Profile: 1 header) records a trace, see X-EdgeForge-Trace-Url.
+    image_format: "png[:level]", "webp[:method]" (lossless), "jpeg[:quality]" or "npy"; see manifest.json
+    """
+    _require_ready()
+    archive = _new_archive(compression)
+    image_format = _image_format(image_format)
     image_bytes = await control_image.read()
-    input_pil = Image.open(BytesIO(image_bytes)).convert("RGB")
-    input_pil.save("temp_batch_input.png")
-    
-    # Get base edges (The single car)
-    base_edges = forge_pipeline.preprocess_canny("temp_batch_input.png")
+    # The producer thread inherits the timing: timing.json is the archive's last entry
+    with metrics.request_timing() as timing:
+        if _profile_requested(request, profile):
+            timing.trace = await run_in_threadpool(_start_trace, "generate_batch")
+        try:
+            base_edges, variations = await run_in_threadpool(prepare_batch, image_bytes, intent, batch_size)
+        except BaseException:
+            _save_trace(timing)
+            raise
+        # A client that disconnects stops the batch before its next item
+        archive.produce(
+            run_batch, base_edges, variations, defer_decode=defer_decode, image_format=image_format,
+            check_cancelled=archive.check_cancelled
+        )
+    return _zip_response(archive, "edgeforge_dataset.zip", _trace_headers(timing))
 
-    # 2. Director: Get Prompt Variations
-    variations = director.generate_variations(intent, count=batch_size)
-    
-    # 3. Production Loop
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-        
-        print(f"Starting Batch Generation of {batch_size} images...")
-        
-        for idx, var in enumerate(variations):
-            print(f"[{idx+1}/{batch_size}] Remixing & Forging...")
-
-            # --- GEOMETRY STEP ---
-            # Randomly shift/scale/multiply the car edges
-            remixed_edges = layout_engine.augment(base_edges, max_objects=3)
-            
-            # --- GENERATION STEP ---
-            img = forge_pipeline.generate(
-                prompt=var['prompt'],
-                control_image=remixed_edges, # Use the Remix!
-                seed=var['seed']
-            )
-            
-            # --- LABELING STEP ---
-            label_txt = labeler.label_image(img)
-            
-            # --- SAVE STEP ---
-            img_buffer = BytesIO()
-            img.save(img_buffer, format="PNG")
-            
-            filename = f"train_{idx:04d}"
-            zip_file.writestr(f"images/{filename}.png", img_buffer.getvalue())
-            zip_file.writestr(f"labels/{filename}.txt", label_txt)
-            
-    zip_buffer.seek(0)
-    return Response(
-        content=zip_buffer.getvalue(), 
-        media_type="application/zip",
-        headers={"Content-Disposition": "attachment; filename=edgeforge_dataset.zip"}
-    )
\ No newline at end of file
+# --- ASYNC JOBS ---
+# POST /jobs -> id; a background worker runs the batch, results are written per item
+# and can be downloaded while the rest of the batch is still running.
+
+def _require_job(job_id):
+    job = _get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def create_job_endpoint(
+    request: Request,
+    intent: str = Form(...),
+    control_image: UploadFile = File(...),
+    batch_size: int = Form(5),
+    defer_decode: bool = Form(False),
+    profile: bool = Form(False),
+    image_format: str = Form("png")
+):
+    """ Queues a batch (same form as /generate_batch) and returns its id right away """
+    _require_ready()
+    image_format = _image_format(image_format)
+    image_bytes = await control_image.read()
+    job = _get_job_manager().submit(
+        intent=intent, image_bytes=image_bytes, batch_size=batch_size, defer_decode=defer_decode,
+        profile=_profile_requested(request, profile), image_format=str(image_format)
+    )
+    return {"id": job.id, "state": job.state, "status_url": f"/jobs/{job.id}"}
+
+@app.get("/jobs")
+def list_jobs_endpoint():
+    return _get_job_manager().list()
+
+@app.get("/jobs/{job_id}")
+def job_status_endpoint(job_id: str):
+    """ State, per-item progress, measured images/sec and ETA """
+    return _require_job(job_id).status()
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job_endpoint(job_id: str):
+    """ Queued jobs never start; running jobs stop before their next item. Finished items are kept. """
+    if _get_job_manager().cancel(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return _require_job(job_id).status()
+
+@app.get("/jobs/{job_id}/results")
+def job_results_endpoint(job_id: str, since: int = 0):
+    """ Finished items from position `since` on (poll with since=<previous next>) """
+    job = _require_job(job_id)
+    items = job.status()["items"]
+    return {"state": job.state, "items": items[since:], "next": len(items)}
+
+@app.get("/jobs/{job_id}/results/{name:path}")
+def job_file_endpoint(job_id: str, name: str):
+    """ One result file, e.g. images/train_0003.png """
+    job = _require_job(job_id)
+    if name not in job.files:
+        raise HTTPException(status_code=404, detail=f"No result '{name}' (yet)")
+    return FileResponse(job.path(name))
+
+def _write_job_files(zip_file, job):
+    """
+    Every finished item, then manifest.json (+ timing.json) as /generate_batch ends.
+    Until the batch wrote its own manifest (running, cancelled or failed jobs) the
+    archive gets one listing the items so far, so it always records its format.
+    """
+    written = list(job.files)  # Before the items: a finished manifest covers all of them
+    items = job.status()["items"]
+    for item in items:
+        for name in item["files"]:
+            zip_file.write(job.path(name), name)
+
+    if "manifest.json" in written:
+        for name in ("manifest.json", "timing.json"):
+            if name in written:
+                zip_file.write(job.path(name), name)
+    else:
+        image_format = None
+        if not job.params.get("defer_decode"):
+            image_format = edl.ImageFormat.parse(job.params.get("image_format", "png"))
+        zip_file.writestr("manifest.json", _manifest(image_format, [
+            {"index": item["index"], "files": item["files"]} for item in sorted(items, key=lambda item: item["index"])
+        ]))
+
+@app.get("/jobs/{job_id}/archive")
+def job_archive_endpoint(job_id: str, compression: str = "auto"):
+    """ ZIP of every item finished so far (the whole dataset once the job completed) plus manifest.json """
+    job = _require_job(job_id)
+    archive = _new_archive(compression).produce(_write_job_files, job)
+    return _zip_response(archive, f"edgeforge_job_{job.id}.zip")
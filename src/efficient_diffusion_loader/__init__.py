@@ -1,7 +1,51 @@
-from .tiled_vae import TiledVAEWrapper
-from .pipeline import EdgeForgePipeline
-from .prompt_expander import PromptExpander
-from .labeler import AutoLabeler
-from .layout_engine import LayoutAugmenter  # <--- NEW
+import importlib
 
-__all__ = ["TiledVAEWrapper", "EdgeForgePipeline", "PromptExpander", "AutoLabeler", "LayoutAugmenter"]
\ No newline at end of file
+# Public name -> submodule. Submodules are imported on first attribute access, so
+# `import efficient_diffusion_loader` stays cheap (no torch / diffusers / ultralytics / cv2)
+_LAZY_IMPORTS = {
+    "TiledVAEWrapper": ".tiled_vae",
+    "TilePlan": ".tile_plan",
+    "EdgeForgePipeline": ".pipeline",
+    "PromptEmbeddingCache": ".prompt_cache",
+    "PromptExpander": ".prompt_expander",
+    "AutoLabeler": ".labeler",
+    "LayoutAugmenter": ".layout_engine",  # <--- NEW
+    "ComponentLoader": ".startup",
+    "ModelStore": ".model_store",
+    "get_model_store": ".model_store",
+    "Stage": ".staged",
+    "StagedPipeline": ".staged",
+    "decode_job": ".latents",
+    "save_latents": ".latents",
+    "load_latents": ".latents",
+    "serialize_latents": ".latents",
+    "Job": ".jobs",
+    "JobManager": ".jobs",
+    "JobCancelled": ".jobs",
+    "ZipStream": ".zip_stream",
+    "DynamicBatcher": ".batcher",
+    "Histogram": ".metrics",
+    "ImageFormat": ".image_format",
+    "ImageEncoder": ".image_format",
+    "RequestTrace": ".profiling",
+    "TraceStore": ".profiling",
+    "CPUExecutor": ".cpu_pool",
+    "SharedArray": ".cpu_pool",
+    "PrecomputedLayouts": ".cpu_pool",
+    "ResultCache": ".result_cache",
+    "content_hash": ".preprocessing",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # Cache on the package so __getattr__ only runs once per name
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,116 @@
+import os
+import torch
+
+# Calibrated estimators, shared by every wrapper around the same VAE weights
+_ESTIMATOR_CACHE = {}
+
+class VAEMemoryEstimator:
+    """
+    Predicts the activation memory of one vae.decode call on a tile.
+
+    The analytic model counts ~6 live feature maps of the widest decoder block at
+    output resolution plus the quadratic mid-block attention map. A short probe
+    decode on CUDA rescales it to what the allocator really reports.
+    """
+    PROBE_LATENT_SIZE = 32
+
+    def __init__(self, vae, scale_factor=8):
+        self.vae = vae
+        self.scale_factor = scale_factor
+        self.channels = max(getattr(vae.config, "block_out_channels", (512,)))
+        self.latent_channels = getattr(vae.config, "latent_channels", 4)
+        # Decoding always runs on float32 inputs (see TiledVAEWrapper._run_tile_batches)
+        self.element_size = 4
+        self.calibration = 1.0
+        self.calibrated = False
+
+    @classmethod
+    def for_vae(cls, vae, scale_factor=8):
+        """
+        Returns the cached (and, where possible, calibrated) estimator for this model/device/dtype.
+        """
+        model_id = getattr(vae.config, "_name_or_path", "") or repr(getattr(vae.config, "block_out_channels", ""))
+        key = (model_id, str(vae.device), str(vae.dtype))
+        estimator = _ESTIMATOR_CACHE.get(key)
+        if estimator is None:
+            estimator = cls(vae, scale_factor)
+            estimator.calibrate()
+            _ESTIMATOR_CACHE[key] = estimator
+        return estimator
+
+    def analytic_bytes(self, latent_h, latent_w, batch=1):
+        px_h, px_w = latent_h * self.scale_factor, latent_w * self.scale_factor
+        conv_bytes = 6 * self.channels * px_h * px_w * self.element_size
+        attn_bytes = (latent_h * latent_w) ** 2 * self.element_size
+        return batch * (conv_bytes + attn_bytes)
+
+    def estimate(self, latent_h, latent_w, batch=1):
+        return int(self.calibration * self.analytic_bytes(latent_h, latent_w, batch))
+
+    def calibrate(self):
+        """
+        Probe decode of a small tile. Only CUDA reports a reliable peak, elsewhere
+        the analytic model is kept as is.
+        """
+        device = torch.device(self.vae.device)
+        if device.type != "cuda":
+            return self
+
+        size = self.PROBE_LATENT_SIZE
+        probe = torch.zeros((1, self.latent_channels, size, size), device=device, dtype=torch.float32)
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        baseline = torch.cuda.memory_allocated(device)
+        with torch.no_grad():
+            self.vae.decode(probe)
+        torch.cuda.synchronize(device)
+        measured = torch.cuda.max_memory_allocated(device) - baseline
+
+        self.calibration = max(measured, 1) / float(self.analytic_bytes(size, size))
+        self.calibrated = True
+        print(f"Tiled VAE: calibrated memory estimator on {device} (x{self.calibration:.2f} vs analytic)")
+        return self
+
+def available_memory(device):
+    """
+    Bytes we can reasonably spend on decoding: free VRAM on CUDA, available RAM otherwise.
+    """
+    device = torch.device(device)
+    if device.type == "cuda":
+        free_bytes, _ = torch.cuda.mem_get_info(device)
+        return int(free_bytes * 0.8)  # Leave headroom for the allocator
+    try:
+        return int(os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") * 0.5)
+    except (ValueError, OSError, AttributeError):
+        return 4 * 1024**3  # Unknown platform: assume a modest 4 GB
+
+def choose_tile_config(estimator, latent_shape, budget, tile_sizes=(1024, 768, 512, 384, 256, 128)):
+    """
+    Picks the largest tile (in pixels) whose decode fits the budget, an overlap of
+    1/8 of the tile, and as many tiles per batch as the remaining budget allows.
+    Returns a dict describing the plan.
+    """
+    scale = estimator.scale_factor
+    latent_h, latent_w = int(latent_shape[-2]), int(latent_shape[-1])
+    batch = int(latent_shape[0]) if len(latent_shape) == 4 else 1
+
+    # Tiles larger than the image only waste memory
+    largest_useful = max(latent_h, latent_w) * scale
+    candidates = [size for size in tile_sizes if size <= largest_useful] or [min(tile_sizes)]
+
+    for tile_size in candidates:
+        tile_latent_h = min(tile_size // scale, latent_h)
+        tile_latent_w = min(tile_size // scale, latent_w)
+        per_tile = estimator.estimate(tile_latent_h, tile_latent_w, batch)
+        if per_tile <= budget:
+            break
+
+    overlap = max(32, (tile_size // 8) // scale * scale)
+    return {
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "tile_batch_size": max(1, int(budget // per_tile)),
+        "budget_bytes": int(budget),
+        "estimated_tile_bytes": per_tile,
+        "calibrated": estimator.calibrated,
+    }
@@ -0,0 +1,94 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+class NpyBandWriter:
+    """
+    Writes uint8 row bands into a memory-mapped (B, H, W, 3) array on disk.
+    '.npy' gets a proper NumPy header, anything else is a headerless raw file.
+    """
+    def __init__(self, path, batch, height, width):
+        self.path = path
+        self.shape = (batch, height, width, 3)
+        if path.endswith(".npy"):
+            self.array = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=self.shape)
+        else:
+            self.array = np.memmap(path, mode="w+", dtype=np.uint8, shape=self.shape)
+        self.rows_written = 0
+
+    def write_band(self, band):
+        """band: uint8 array of shape (B, rows, W, 3)"""
+        rows = band.shape[1]
+        self.array[:, self.rows_written:self.rows_written + rows] = band
+        self.rows_written += rows
+
+    def close(self):
+        if self.array is not None:
+            self.array.flush()
+            self.array = None  # Drops the mapping; pages are already on disk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PNGBandWriter:
+    """
+    Minimal incremental RGB PNG encoder: rows are deflated and written as IDAT
+    chunks as soon as they arrive, so the full image never sits in memory.
+    """
+    def __init__(self, path, batch, height, width, compress_level=6):
+        if batch != 1:
+            raise ValueError(f"PNG output holds a single image, got a batch of {batch}")
+        self.path = path
+        self.height = height
+        self.width = width
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(path, "wb")
+
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        # 8-bit RGB, deflate, adaptive filtering, no interlace
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def write_band(self, band):
+        """band: uint8 array of shape (1, rows, W, 3)"""
+        rows = band[0]
+        # Every scanline is prefixed with its filter type (0 = None)
+        scanlines = np.zeros((rows.shape[0], 1 + self.width * 3), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self._compressor.compress(scanlines.tobytes())
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        if self._file is None:
+            return
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_band_writer(path, batch, height, width):
+    """
+    Picks the writer from the file extension (.png, .npy, anything else = raw memmap).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".png":
+        return PNGBandWriter(path, batch, height, width)
+    return NpyBandWriter(path, batch, height, width)
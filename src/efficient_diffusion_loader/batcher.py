@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from . import metrics
+from .metrics import Histogram
+
+class DynamicBatcher:
+    """
+    Groups concurrent single requests into batched calls.
+
+    submit(item) returns a Future. A background thread takes the first pending
+    item, then keeps collecting until max_batch_size items are pending or
+    max_wait seconds have passed since that first item arrived, and calls
+    batch_fn([items]) -> [results] (same length, same order). Each result (or
+    the batch's exception) is set on its own item's future.
+
+    Records two histograms: queue wait (submit -> batch start, seconds) and
+    batch size. The request timing of every caller (metrics.request_timing)
+    receives its queue wait and the spans of the batched call it was part of.
+    """
+    def __init__(self, batch_fn, max_batch_size=4, max_wait=0.025, name="batcher"):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be >= 1, got {max_batch_size}")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.queue_wait = Histogram()
+        self.batch_sizes = Histogram(buckets=range(1, max_batch_size + 1))
+        self.batch_seconds = Histogram()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future, time.perf_counter(), metrics.current_timing()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """ Blocking submit: the result for this one item. """
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Whatever is already queued joins even once the window has passed
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Drop requests whose caller already gave up
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            for _, _, submitted, timing in batch:
+                self.queue_wait.observe(start - submitted)
+                if timing is not None:
+                    timing.add("queue_wait", start - submitted)
+                    timing.note("batch_size", len(batch))
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                # Spans of the batched call go to every request in it
+                with metrics.request_timing(metrics.TimingFanout([entry[3] for entry in batch])):
+                    results = self.batch_fn([entry[0] for entry in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                print(f"{self.name}: batch of {len(batch)} failed: {e!r}")
+                for entry in batch:
+                    entry[1].set_exception(e)
+                continue
+            finally:
+                self.batch_seconds.observe(time.perf_counter() - start)
+
+            for entry, result in zip(batch, results):
+                entry[1].set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait": self.max_wait,
+            "pending": self._queue.qsize(),
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "batch_seconds": self.batch_seconds.snapshot(),
+        }
@@ -0,0 +1,182 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from PIL import Image
+
+from . import metrics
+from .preprocessing import canny_edge_map, load_rgb
+
+class SharedArray:
+    """
+    A numpy array in a shared memory block. Pickles as (name, shape, dtype), so
+    handing one to a pool worker costs a few bytes instead of the whole array.
+    The process that is done with it last calls unlink().
+    """
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+        self._shm = None
+
+    @classmethod
+    def copy_of(cls, array):
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        shared = cls(shm.name, array.shape, array.dtype)
+        shared._shm = shm
+        shared.view()[...] = array
+        return shared
+
+    def view(self):
+        """ Zero-copy view; drop it before close(). """
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        shm, self._shm = self._shm, None
+        shm.close()
+        shm.unlink()
+
+    def claim(self):
+        """ Copies the array out and frees the block. """
+        array = self.view().copy()
+        self.unlink()
+        return array
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype)
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+        self._shm = None
+
+# --- WORKER SIDE ---
+# Each task returns (SharedArray of the result, seconds); the parent claims it.
+
+_source = None  # The current batch's base layout, attached once per worker
+
+def _init_worker():
+    import cv2
+    # One process per core already: OpenCV's own threads would only oversubscribe
+    cv2.setNumThreads(1)
+
+def _share(array):
+    shared = SharedArray.copy_of(array)
+    shared.close()
+    return shared
+
+def _source_image(source):
+    global _source
+    if _source is None or _source.name != source.name:
+        if _source is not None:
+            _source.close()
+        _source = source
+    return Image.fromarray(_source.view())
+
+def _augment_task(engine, source, max_objects, seed):
+    start = time.perf_counter()
+    layout = engine.augment(_source_image(source), max_objects=max_objects, seed=seed)
+    return _share(np.asarray(layout)), time.perf_counter() - start
+
+def _canny_task(image_bytes, size, low_threshold, high_threshold):
+    start = time.perf_counter()
+    edges = canny_edge_map(load_rgb(image_bytes), size, low_threshold, high_threshold)
+    return _share(np.asarray(edges)), time.perf_counter() - start
+
+class CPUExecutor:
+    """
+    Runs the CPU-bound numpy / OpenCV steps (layout remixing, Canny edge maps).
+
+    workers=0: inline, on the calling thread (the old behaviour).
+    workers>=1: a spawn-context process pool, off the server's GIL. Arrays go
+    through shared memory; only names, seeds and upload bytes are pickled.
+    Spawned workers import numpy / OpenCV / PIL only, never torch.
+    """
+    def __init__(self, workers=0):
+        self.workers = workers
+        self._pool = None
+        if workers > 0:
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+
+    def warm_up(self):
+        """ Starts every worker now instead of on the first batch. """
+        if self._pool is not None:
+            for future in [self._pool.submit(_init_worker) for _ in range(self.workers)]:
+                future.result()
+        return self
+
+    def canny_edge_map(self, image, size=1024, low_threshold=100, high_threshold=200):
+        """ Upload bytes (or a path / PIL image inline) -> size x size 3-channel edge map """
+        if self._pool is None or not isinstance(image, (bytes, bytearray)):
+            return canny_edge_map(load_rgb(image), size, low_threshold, high_threshold)
+        shared, _ = self._pool.submit(_canny_task, bytes(image), size, low_threshold, high_threshold).result()
+        return Image.fromarray(shared.claim())
+
+    def augment_many(self, engine, base_image, seeds, max_objects=3):
+        """
+        One remixed layout per seed. With a pool they are all submitted now and
+        computed ahead of whoever consumes them; see PrecomputedLayouts.
+        """
+        return PrecomputedLayouts(engine, base_image, seeds, max_objects, self._pool)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+class PrecomputedLayouts:
+    """
+    Remixed layouts of one batch. get(i) returns layout i: waits for the pool
+    task, or computes it inline when there is no pool. close() cancels what has
+    not started and frees what was computed but never claimed.
+    """
+    def __init__(self, engine, base_image, seeds, max_objects=3, pool=None):
+        self.engine = engine
+        self.base_image = base_image
+        self.seeds = list(seeds)
+        self.max_objects = max_objects
+        self._source = None
+        self._futures = None
+        if pool is not None:
+            # The base layout is shared once per batch, not pickled per task
+            self._source = SharedArray.copy_of(np.asarray(base_image))
+            self._futures = [
+                pool.submit(_augment_task, engine, self._source, max_objects, seed) for seed in self.seeds
+            ]
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def get(self, index):
+        if self._futures is None:
+            return self.engine.augment(self.base_image, max_objects=self.max_objects, seed=self.seeds[index])
+        future, self._futures[index] = self._futures[index], None
+        shared, seconds = future.result()
+        # Worker time, reported like an inline layout call
+        metrics.record_stage("layout", seconds)
+        return Image.fromarray(shared.claim())
+
+    def close(self):
+        for future in self._futures or []:
+            if future is None or future.cancel():
+                continue
+            try:
+                future.result()[0].unlink()
+            except Exception:
+                pass
+        self._futures = None
+        if self._source is not None:
+            self._source.unlink()
+            self._source = None
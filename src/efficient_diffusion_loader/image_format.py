@@ -0,0 +1,112 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+from . import metrics
+
+# name -> (default level, (min, max), what the level means); npy takes no level
+_FORMATS = {
+    "png": (6, (0, 9), "compress_level"),
+    "webp": (4, (0, 6), "method"),      # lossless; method = encoder effort
+    "jpeg": (95, (1, 100), "quality"),
+    "npy": (None, None, None),          # raw uint8 H x W x C array
+}
+_EXTENSIONS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg", "npy": ".npy"}
+
+class ImageFormat:
+    """
+    How generated images are written: "png[:level]", "webp[:method]" (lossless),
+    "jpeg[:quality]" or "npy". parse() reads that spec, describe() goes into the manifest.
+    """
+    def __init__(self, name="png", level=None):
+        name = "jpeg" if name.lower() == "jpg" else name.lower()
+        if name not in _FORMATS:
+            raise ValueError(f"Unknown image format '{name}', expected one of {tuple(_FORMATS)}")
+        default, bounds, _ = _FORMATS[name]
+        if level is None:
+            level = default
+        elif bounds is None:
+            raise ValueError(f"'{name}' takes no level")
+        elif not bounds[0] <= level <= bounds[1]:
+            raise ValueError(f"'{name}' level must be in {bounds[0]}..{bounds[1]}, got {level}")
+        self.name = name
+        self.level = level
+
+    @classmethod
+    def parse(cls, spec):
+        name, _, level = str(spec).partition(":")
+        try:
+            return cls(name, int(level) if level else None)
+        except ValueError as e:
+            raise ValueError(f"Bad image format '{spec}': {e}") from None
+
+    @property
+    def extension(self):
+        return _EXTENSIONS[self.name]
+
+    @property
+    def lossless(self):
+        return self.name != "jpeg"
+
+    def encode(self, image):
+        """ PIL image -> file bytes """
+        buffer = BytesIO()
+        if self.name == "png":
+            image.save(buffer, format="PNG", compress_level=self.level)
+        elif self.name == "webp":
+            image.save(buffer, format="WEBP", lossless=True, method=self.level)
+        elif self.name == "jpeg":
+            image.save(buffer, format="JPEG", quality=self.level)
+        else:
+            np.save(buffer, np.asarray(image))
+        return buffer.getvalue()
+
+    @staticmethod
+    def decode(data, name):
+        """ File bytes -> PIL image (name: a file name or format name, for npy) """
+        if name.endswith("npy"):
+            return Image.fromarray(np.load(BytesIO(data)))
+        return Image.open(BytesIO(data))
+
+    def describe(self):
+        entry = {"format": self.name, "extension": self.extension, "lossless": self.lossless}
+        if self.level is not None:
+            entry[_FORMATS[self.name][2]] = self.level
+        return entry
+
+    def __str__(self):
+        return self.name if self.level is None else f"{self.name}:{self.level}"
+
+class ImageEncoder:
+    """
+    Thread pool for image encoding. zlib (PNG), libwebp and libjpeg release the GIL,
+    so encodes overlap each other and whatever the submitting thread does next
+    (e.g. labeling). Workers run in a copy of the submitter's context, so the spans
+    land in its request timing.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="encode")
+
+    def encode(self, image, image_format):
+        """ Encodes on the calling thread (stage workers are already a pool). """
+        start = time.perf_counter()
+        with metrics.timed("encode"):
+            data = image_format.encode(image)
+        # Per-format latency in its own family: the stage histogram keeps one label set
+        metrics.REGISTRY.observe("edgeforge_encode_seconds", time.perf_counter() - start, format=image_format.name)
+        return data
+
+    def submit(self, image, image_format):
+        return self._pool.submit(contextvars.copy_context().run, self.encode, image, image_format)
+
+    def map(self, images, image_format):
+        """ Encodes all images on the pool; results in input order. """
+        return [future.result() for future in [self.submit(image, image_format) for image in images]]
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,200 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised inside a job function once the job has been cancelled."""
+
+class Job:
+    """
+    One background batch. The job function reports through it:
+      job.set_total(n), job.writestr(name, data), job.item_done(index, files),
+      job.check_cancelled() (raises JobCancelled).
+    Results are written under job.directory as they are produced, so finished
+    items can be downloaded while the rest of the batch is still running.
+    """
+    def __init__(self, job_id, params, directory):
+        self.id = job_id
+        self.params = params
+        self.directory = directory
+        self.state = QUEUED
+        self.error = None
+        self.total = params.get("batch_size")
+        self.items = []         # [{"index", "files", "seconds"}] in completion order
+        self.files = []         # every file written, relative to directory
+        self.stages = None      # per-stage stats, set by the job function when it is done
+        self.timing = None      # metrics.RequestTiming of the run, if the job function binds one
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def set_total(self, total):
+        self.total = total
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def writestr(self, name, data):
+        """
+        Same signature as ZipFile.writestr, so batch code can target either.
+        """
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.files.append(name)
+
+    def path(self, name):
+        """
+        Absolute path of a result file, refusing anything outside the job directory.
+        """
+        path = os.path.normpath(os.path.join(self.directory, name))
+        if not path.startswith(os.path.normpath(self.directory) + os.sep):
+            raise ValueError(f"Invalid result name '{name}'")
+        return path
+
+    def item_done(self, index, files):
+        with self._lock:
+            self.items.append({"index": index, "files": list(files), "seconds": time.time() - self.started_at})
+
+    def images_per_sec(self):
+        if self.started_at is None or not self.items:
+            return 0.0
+        end = self.finished_at or time.time()
+        return len(self.items) / max(end - self.started_at, 1e-9)
+
+    def status(self):
+        with self._lock:
+            items = [dict(item) for item in self.items]
+        completed = len(items)
+        now = self.finished_at or time.time()
+        rate = self.images_per_sec()
+        remaining = None
+        if self.state == RUNNING and self.total and rate > 0:
+            remaining = (self.total - completed) / rate
+        return {
+            "id": self.id,
+            "state": self.state,
+            "total": self.total,
+            "completed": completed,
+            "progress": completed / self.total if self.total else 0.0,
+            "images_per_sec": rate,
+            "eta_seconds": remaining,
+            "elapsed_seconds": (now - self.started_at) if self.started_at else 0.0,
+            "queued_seconds": ((self.started_at or now) - self.created_at),
+            "error": self.error,
+            "stages": self.stages,
+            "timing": self.timing.as_dict() if self.timing is not None else None,
+            "items": items,
+        }
+
+class JobManager:
+    """
+    Runs submitted jobs on background worker thread(s), off the server's event loop.
+
+    job_fn(job, **params) does the work; JobManager tracks state, cancellation and
+    results. Finished jobs are kept (with their files) until max_finished newer
+    ones have finished.
+    """
+    def __init__(self, job_fn, workers=1, results_dir=None, max_finished=32):
+        self.job_fn = job_fn
+        self.results_dir = results_dir or tempfile.mkdtemp(prefix="edgeforge_jobs_")
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"edgeforge-job-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, **params):
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, params, os.path.join(self.results_dir, job_id))
+        os.makedirs(job.directory, exist_ok=True)
+        with self._lock:
+            self.jobs[job_id] = job
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Queued jobs never start; running jobs stop at the next item boundary.
+        Returns the job (None if unknown).
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job._cancel.set()
+        with job._lock:
+            if job.state == QUEUED:
+                job.state = CANCELLED
+                job.finished_at = time.time()
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with job._lock:
+                if job.state != QUEUED:
+                    continue  # Cancelled while waiting
+                job.state = RUNNING
+                job.started_at = time.time()
+            try:
+                self.job_fn(job, **job.params)
+                state, error = COMPLETED, None
+            except JobCancelled:
+                state, error = CANCELLED, None
+            except Exception as e:
+                # A stage may surface the cancellation as its own error
+                state, error = (CANCELLED, None) if job.cancel_requested else (FAILED, repr(e))
+                if state == FAILED:
+                    print(f"Job {job.id} failed: {e!r}")
+            with job._lock:
+                job.state = state
+                job.error = error
+                job.finished_at = time.time()
+            print(f"Job {job.id} {state}: {len(job.items)}/{job.total} items, {job.images_per_sec():.2f} images/s")
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            finished = [job for job in self.jobs.values() if job.state in FINISHED_STATES]
+            stale = finished[:max(0, len(finished) - self.max_finished)]
+            for job in stale:
+                del self.jobs[job.id]
+        for job in stale:
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+    def list(self):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [{k: v for k, v in job.status().items() if k not in ("items", "stages", "timing")} for job in jobs]
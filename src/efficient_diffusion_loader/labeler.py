@@ -1,12 +1,31 @@
 from ultralytics import YOLO
 import cv2
 import numpy as np
+from .model_store import get_model_store
+from .startup import MODEL_BUILD_LOCK
+from . import metrics
 
 class AutoLabeler:
-    def __init__(self):
+    def __init__(self, weights="yolov8n.pt", model_store=None):
         print("Loading Auto-Labeler (YOLOv8)...")
+        self.weights = weights
+        self.model = self.load_model(weights, model_store)
+
+    @staticmethod
+    def load_model(weights="yolov8n.pt", model_store=None):
+        """
+        YOLO model from the store's cache, so a model preloaded before fork is reused.
+        Picked up from $EDGEFORGE_MODEL_DIR when present there.
+        """
+        model_store = model_store or get_model_store()
         # Load a pre-trained model (it will download automatically)
-        self.model = YOLO("yolov8n.pt")  # 'n' is nano (fastest)
+        # 'n' is nano (fastest)
+        def build():
+            # Never next to a from_pretrained in another thread (see MODEL_BUILD_LOCK)
+            with MODEL_BUILD_LOCK:
+                return YOLO(model_store.resolve_file(weights))
+
+        return model_store.get_or_create(("YOLO", weights), build)
 
     def label_image(self, image_pil):
         """
@@ -16,18 +35,19 @@ class AutoLabeler:
         img_cv = cv2.cvtColor(np.array(image_pil), cv2.COLOR_RGB2BGR)
         
         # Run inference
-        results = self.model(img_cv, verbose=False)[0]
+        with metrics.timed("label"):
+            results = self.model(img_cv, verbose=False)[0]
         
-        labels = []
-        # Extract bounding boxes
-        for box in results.boxes:
-            # YOLO format: class_id x_center y_center width height (normalized 0-1)
-            cls = int(box.cls[0])
-            x, y, w, h = box.xywhn[0].tolist() # Normalized coordinates
-            conf = float(box.conf[0])
-            
-            # Filter low confidence
-            if conf > 0.4:
-                labels.append(f"{cls} {x:.6f} {y:.6f} {w:.6f} {h:.6f}")
-                
+        # Extract bounding boxes: one device -> host copy for all of them,
+        # not three small ones per box
+        boxes = results.boxes.cpu().numpy()
+
+        # Filter low confidence
+        keep = boxes.conf > 0.4
+
+        # YOLO format: class_id x_center y_center width height (normalized 0-1)
+        labels = [
+            f"{int(cls)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}"
+            for cls, (x, y, w, h) in zip(boxes.cls[keep], boxes.xywhn[keep])
+        ]
         return "\n".join(labels)
\ No newline at end of file
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import time
+from io import BytesIO
+import numpy as np
+import torch
+from PIL import Image
+
+LATENT_FORMAT_VERSION = 1
+LATENT_EXTENSIONS = (".safetensors", ".npz")
+
+def serialize_latents(latents, metadata, fmt="safetensors"):
+    """
+    Scaled latents (B, 4, h, w) + a JSON-able metadata dict -> file bytes.
+    fmt: "safetensors" (metadata in the header) or "npz" (metadata as a JSON string).
+    """
+    latents = latents.detach().cpu().contiguous()
+    metadata = dict(metadata, format_version=LATENT_FORMAT_VERSION, shape=list(latents.shape), dtype=str(latents.dtype))
+    if fmt == "safetensors":
+        from safetensors.torch import save
+        return save({"latents": latents}, metadata={"edgeforge": json.dumps(metadata)})
+    if fmt == "npz":
+        buffer = BytesIO()
+        # numpy has no bfloat16: store those as float32
+        array = latents.float().numpy() if latents.dtype == torch.bfloat16 else latents.numpy()
+        np.savez(buffer, latents=array, metadata=np.array(json.dumps(metadata)))
+        return buffer.getvalue()
+    raise ValueError(f"Unknown latent format '{fmt}', expected 'safetensors' or 'npz'")
+
+def save_latents(path, latents, metadata):
+    """
+    Writes latents + metadata to path; the format follows the extension.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in LATENT_EXTENSIONS:
+        raise ValueError(f"Latent files must end in {' or '.join(LATENT_EXTENSIONS)}, got '{path}'")
+    data = serialize_latents(latents, metadata, fmt=ext[1:])
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write-then-rename: a decode job scanning the directory never sees half a file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+def load_latents(path):
+    """
+    (latents tensor, metadata dict) from a .safetensors or .npz latent file.
+    """
+    if path.lower().endswith(".safetensors"):
+        from safetensors import safe_open
+        with safe_open(path, framework="pt") as f:
+            header = f.metadata() or {}
+            latents = f.get_tensor("latents")
+        return latents, json.loads(header.get("edgeforge", "{}"))
+    if path.lower().endswith(".npz"):
+        with np.load(path) as data:
+            return torch.from_numpy(data["latents"]), json.loads(str(data["metadata"]))
+    raise ValueError(f"Not a latent file: '{path}'")
+
+def find_latents(input_dir):
+    return sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(LATENT_EXTENSIONS)
+    )
+
+def _load_vae(device):
+    from .model_store import get_model_store
+    from .pipeline import MODEL_SPECS
+    return get_model_store().load(*MODEL_SPECS["vae"]).to(device)
+
+def decode_job(input_dir, output_dir, vae=None, device=None, precision=None, tile_size=None, overlap=None,
+               batch_size=4, scale=1.0, stream=False, labeler=None, auto_tune=None):
+    """
+    Bulk-decodes every latent file in input_dir through TiledVAEWrapper into
+    output_dir/images/<name>.png (+ metadata/<name>.json, + labels/<name>.txt with a labeler).
+
+    - Latents of the same shape are decoded batch_size at a time.
+    - scale != 1 resizes the latents (bicubic) before decoding, i.e. a cheap way to
+      render at a different resolution than the one they were denoised at.
+    - stream=True decodes one image at a time straight into the PNG (decode_to_file),
+      for outputs too large to hold in memory.
+    - precision: "float32" / "float16" / "bfloat16" (defaults to float16 on CUDA).
+    - auto_tune: size tiles and overlap from the memory budget. Defaults to True only
+      when neither tile_size nor overlap is given (512 / 64 are then just the starting
+      point); given values are kept as is (e.g. to match the server's tiling).
+
+    Returns the list of written image paths.
+    """
+    from .tiled_vae import TiledVAEWrapper
+
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if precision is None:
+        precision = "float16" if str(device).startswith("cuda") else "float32"
+    if vae is None:
+        vae = _load_vae(device)
+    if auto_tune is None:
+        auto_tune = tile_size is None and overlap is None
+    tile_size = 512 if tile_size is None else tile_size
+    overlap = 64 if overlap is None else overlap
+    tiled_vae = TiledVAEWrapper(vae, tile_size=tile_size, overlap=overlap, auto_tune=auto_tune, precision=precision)
+
+    paths = find_latents(input_dir)
+    for sub in ("images", "metadata") + (("labels",) if labeler is not None else ()):
+        os.makedirs(os.path.join(output_dir, sub), exist_ok=True)
+    print(f"Decode job: {len(paths)} latent files from '{input_dir}' ({precision}, scale {scale}, batch {batch_size})")
+
+    # Group by shape so every batch is one tensor
+    groups = {}
+    for path in paths:
+        latents, metadata = load_latents(path)
+        # Multi-sample files are split into one image per sample
+        for i, sample in enumerate(latents.split(1, dim=0)):
+            stem = os.path.splitext(os.path.basename(path))[0]
+            name = stem if latents.shape[0] == 1 else f"{stem}_{i}"
+            groups.setdefault(tuple(sample.shape), []).append((name, sample, metadata))
+
+    written = []
+    start = time.perf_counter()
+    step = 1 if stream else batch_size
+    for entries in groups.values():
+        for first in range(0, len(entries), step):
+            chunk = entries[first:first + step]
+            latents = torch.cat([sample for _, sample, _ in chunk]).to(device=device, dtype=torch.float32)
+
+            # --- CRITICAL FIX 1: SCALING --- (same as EdgeForgePipeline.decode_latents)
+            scaling = chunk[0][2].get("scaling_factor") or getattr(vae.config, "scaling_factor", 0.13025)
+            latents = latents / scaling
+            if scale != 1.0:
+                latents = torch.nn.functional.interpolate(latents, scale_factor=scale, mode="bicubic", align_corners=False)
+
+            image_paths = [os.path.join(output_dir, "images", f"{name}.png") for name, _, _ in chunk]
+            if stream:
+                tiled_vae.decode_to_file(latents, image_paths[0])
+                images = None
+            else:
+                images = TiledVAEWrapper.to_uint8(tiled_vae.decode_with_blending(latents))
+                for image, image_path in zip(images, image_paths):
+                    Image.fromarray(image).save(image_path, format="PNG")
+
+            decoded_size = [latents.shape[-2] * tiled_vae.scale_factor, latents.shape[-1] * tiled_vae.scale_factor]
+            for i, (name, _, metadata) in enumerate(chunk):
+                metadata = dict(metadata, decoded_precision=precision, decoded_scale=scale, decoded_size=decoded_size)
+                with open(os.path.join(output_dir, "metadata", f"{name}.json"), "w") as f:
+                    json.dump(metadata, f, indent=2)
+                if labeler is not None:
+                    image = Image.fromarray(images[i]) if images is not None else Image.open(image_paths[i]).convert("RGB")
+                    with open(os.path.join(output_dir, "labels", f"{name}.txt"), "w") as f:
+                        f.write(labeler.label_image(image))
+            written.extend(image_paths)
+
+    seconds = time.perf_counter() - start
+    if written:
+        print(f"Decode job: {len(written)} images in {seconds:.1f}s ({len(written) / seconds:.2f} images/s)")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-decode exported EdgeForge latents")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--precision", choices=["float32", "float16", "bfloat16"], default=None)
+    parser.add_argument("--tile-size", type=int, default=None, help="Pixels (default: auto-tuned, starting at 512)")
+    parser.add_argument("--overlap", type=int, default=None, help="Pixels (default: auto-tuned, starting at 64)")
+    parser.add_argument("--auto-tune", action=argparse.BooleanOptionalAction, default=None,
+                        help="Size tiles from free memory (default: only if --tile-size / --overlap are not given)")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--stream", action="store_true", help="Stream each image to disk (huge outputs)")
+    parser.add_argument("--label", action="store_true", help="Also write YOLO labels")
+    args = parser.parse_args()
+
+    labeler = None
+    if args.label:
+        from .labeler import AutoLabeler
+        labeler = AutoLabeler()
+    decode_job(
+        args.input_dir, args.output_dir, device=args.device, precision=args.precision,
+        tile_size=args.tile_size, overlap=args.overlap, batch_size=args.batch_size,
+        scale=args.scale, stream=args.stream, labeler=labeler, auto_tune=args.auto_tune,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
 import cv2
 import numpy as np
 from PIL import Image
-import random
+from . import metrics
+from .seeding import rng
 
 class LayoutAugmenter:
     def __init__(self):
         pass
 
-    def augment(self, pil_image, max_objects=3):
+    def augment(self, pil_image, max_objects=3, seed=None):
         """
         Robustly augments layout. 
         Guarantees the object will be scaled < 1.0 to ensure movement is possible.
+        seed: same seed, same layout (e.g. when layouts are computed ahead in worker processes)
         """
+        with metrics.timed("layout"):
+            return self._augment(pil_image, max_objects, rng(seed))
+
+    def _augment(self, pil_image, max_objects, random):
         img = np.array(pil_image)
         
         # Handle shape (H, W, C)
@@ -0,0 +1,337 @@
+import bisect
+import contextvars
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds: 1ms .. 2min
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    """
+    Thread-safe histogram with fixed upper bounds (Prometheus style: a value lands
+    in the first bucket with value <= bound, anything larger in +Inf).
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = None
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (None if empty).
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound if bound != float("inf") else self.max
+        return self.max
+
+    def snapshot(self):
+        """
+        {"buckets": {"<bound>": count, ..., "+Inf": count}, "count", "sum", "mean", "max"}
+        Bucket counts are per bucket, not cumulative.
+        """
+        with self._lock:
+            labels = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+            return {
+                "buckets": dict(zip(labels, self.counts)),
+                "count": self.count,
+                "sum": self.sum,
+                "mean": self.sum / self.count if self.count else None,
+                "max": self.max,
+            }
+
+
+# --- REGISTRY ---
+# Process-wide metrics, rendered in the Prometheus text format by prometheus_text()
+
+DESCRIPTIONS = {
+    "edgeforge_stage_seconds": "Latency of one pipeline stage call",
+    "edgeforge_encode_seconds": "Image encoding latency per output format",
+    "edgeforge_vae_tile_seconds": "Tiled VAE time per tile (batched calls are split evenly)",
+    "edgeforge_request_seconds": "HTTP handler latency",
+    "edgeforge_images_total": "Images produced",
+    "edgeforge_last_batch_images_per_second": "Throughput of the last finished batch",
+    "edgeforge_vae_peak_device_bytes": "Peak device memory of the last tiled VAE decode",
+}
+
+class _Family:
+    def __init__(self, name, kind, buckets=None):
+        self.name = name
+        self.kind = kind  # "histogram" | "counter" | "gauge"
+        self.buckets = buckets
+        self.children = {}  # sorted label items -> Histogram or [value]
+
+class Registry:
+    """
+    Named histograms, counters and gauges with labels. Thread-safe.
+    """
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _child(self, name, kind, labels, buckets=None):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(name, kind, buckets or LATENCY_BUCKETS)
+            child = family.children.get(key)
+            if child is None:
+                child = family.children[key] = Histogram(family.buckets) if kind == "histogram" else [0.0]
+        return child
+
+    def observe(self, name, value, buckets=None, **labels):
+        self._child(name, "histogram", labels, buckets).observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        child = self._child(name, "counter", labels)
+        with self._lock:
+            child[0] += amount
+
+    def set_gauge(self, name, value, **labels):
+        self._child(name, "gauge", labels)[0] = value
+
+    def reset(self):
+        with self._lock:
+            self._families.clear()
+
+    def snapshot(self):
+        """
+        {name: {"type", "values": [{"labels", ...histogram snapshot or "value"}]}}
+        """
+        with self._lock:
+            families = [(f, list(f.children.items())) for f in self._families.values()]
+        result = {}
+        for family, children in families:
+            values = []
+            for key, child in children:
+                entry = child.snapshot() if family.kind == "histogram" else {"value": child[0]}
+                values.append(dict(entry, labels=dict(key)))
+            result[family.name] = {"type": family.kind, "values": values}
+        return result
+
+    def prometheus_text(self):
+        with self._lock:
+            families = [(f, list(f.children.items())) for f in sorted(self._families.values(), key=lambda f: f.name)]
+        lines = []
+        for family, children in families:
+            lines.append(f"# HELP {family.name} {DESCRIPTIONS.get(family.name, family.name)}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, child in children:
+                if family.kind != "histogram":
+                    lines.append(f"{family.name}{_labels(key)} {child[0]:g}")
+                    continue
+                snapshot = child.snapshot()
+                cumulative = 0
+                for bound, count in snapshot["buckets"].items():
+                    cumulative += count
+                    lines.append(f"{family.name}_bucket{_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{family.name}_sum{_labels(key)} {snapshot['sum']:g}")
+                lines.append(f"{family.name}_count{_labels(key)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+def _labels(items):
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+REGISTRY = Registry()
+
+def process_memory():
+    """
+    Peak resident memory of this process, and peak CUDA memory when torch is in use.
+    """
+    memory = {}
+    try:
+        import resource
+        # ru_maxrss is in kB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        memory["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    except ImportError:
+        pass
+    torch = sys.modules.get("torch")  # Never import torch just to report on it
+    if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+        memory["peak_cuda_bytes"] = torch.cuda.max_memory_allocated()
+    return memory
+
+def prometheus_text(registry=REGISTRY):
+    """
+    The registry plus process memory gauges, in the Prometheus text exposition format.
+    """
+    for name, value in process_memory().items():
+        registry.set_gauge(f"edgeforge_{name}", value)
+    return registry.prometheus_text()
+
+# --- PER-REQUEST TIMING ---
+# A RequestTiming bound to the current context collects the spans of one request.
+# Thread pools started with a copy of the context (run_in_threadpool, StagedPipeline,
+# ZipStream) report into the same block.
+
+class RequestTiming:
+    """
+    Per-request timing block: seconds + calls per stage, per-tile decode times,
+    images produced and peak memory.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = {}
+        self.tile_seconds = []
+        self.values = {}
+        self.images = 0
+        self.trace = None  # profiling.RequestTrace when the request is profiled
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, calls=1):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += calls
+
+    def add_tiles(self, seconds):
+        with self._lock:
+            self.tile_seconds.extend(seconds)
+
+    def add_images(self, count):
+        with self._lock:
+            self.images += count
+
+    def note(self, name, value):
+        """ Keeps the largest value seen (peak memory and the like). """
+        with self._lock:
+            if value is not None and (self.values.get(name) is None or value > self.values[name]):
+                self.values[name] = value
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            for name, value in process_memory().items():
+                self.note(name, value)
+        return self
+
+    def as_dict(self):
+        total = (self.finished or time.perf_counter()) - self.started
+        with self._lock:
+            tiles = sorted(self.tile_seconds)
+            return {
+                "total_seconds": total,
+                "stages": {name: dict(entry) for name, entry in self.stages.items()},
+                "images": self.images,
+                "images_per_sec": self.images / total if total > 0 else 0.0,
+                "tiles": {
+                    "count": len(tiles),
+                    "seconds": sum(tiles),
+                    "mean": sum(tiles) / len(tiles) if tiles else None,
+                    "p50": tiles[len(tiles) // 2] if tiles else None,
+                    "max": tiles[-1] if tiles else None,
+                },
+                **self.values,
+                **({"trace": self.trace.id} if self.trace is not None else {}),
+            }
+
+class TimingFanout:
+    """ Reports into several RequestTimings at once (one batched call serving many requests). """
+    trace = None  # A batched call belongs to no single request's trace
+
+    def __init__(self, timings):
+        self.timings = [timing for timing in timings if timing is not None]
+
+    def __getattr__(self, name):
+        def fan_out(*args, **kwargs):
+            for timing in self.timings:
+                getattr(timing, name)(*args, **kwargs)
+        return fan_out
+
+_current_timing = contextvars.ContextVar("edgeforge_request_timing", default=None)
+
+def current_timing():
+    return _current_timing.get()
+
+def current_trace():
+    """ The RequestTrace of the current request, None unless it is being profiled. """
+    timing = _current_timing.get()
+    return timing.trace if timing is not None else None
+
+@contextmanager
+def request_timing(timing=None):
+    """
+    Binds a RequestTiming (a new one by default) to the current context.
+    """
+    timing = RequestTiming() if timing is None else timing
+    token = _current_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _current_timing.reset(token)
+
+@contextmanager
+def timed(stage, registry=REGISTRY):
+    """
+    Times the block into edgeforge_stage_seconds{stage=...} and the current request's timing
+    (plus a trace span if the request is being profiled). The only label is the stage,
+    so every series of the family has the same label set; anything finer-grained
+    goes into its own metric (e.g. edgeforge_encode_seconds{format=...}).
+    """
+    timing = _current_timing.get()
+    trace = timing.trace if timing is not None else None
+    start = time.perf_counter()
+    try:
+        if trace is None:
+            yield
+        else:
+            with trace.span(stage):
+                yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe("edgeforge_stage_seconds", seconds, stage=stage)
+        if timing is not None:
+            timing.add(stage, seconds)
+
+def record_stage(stage, seconds, registry=REGISTRY):
+    """ Same as timed() for work timed elsewhere (e.g. in a pool process). """
+    registry.observe("edgeforge_stage_seconds", seconds, stage=stage)
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+def record_tiles(seconds, op="decode", registry=REGISTRY):
+    for value in seconds:
+        registry.observe("edgeforge_vae_tile_seconds", value, op=op)
+    timing = _current_timing.get()
+    if timing is not None and op == "decode":
+        timing.add_tiles(seconds)
+
+def record_images(count, registry=REGISTRY, **labels):
+    registry.inc("edgeforge_images_total", count, **labels)
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.add_images(count)
+
+def note(name, value):
+    """ Records a peak-style value (e.g. device bytes) in the current request's timing. """
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.note(name, value)
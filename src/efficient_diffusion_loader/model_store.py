@@ -0,0 +1,278 @@
+import json
+import os
+import struct
+import threading
+import torch
+from .startup import MODEL_BUILD_LOCK
+
+# Shared by EdgeForgePipeline / AutoLabeler unless a store is passed in explicitly
+_DEFAULT_STORE = None
+_DEFAULT_STORE_LOCK = threading.Lock()
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+def mmap_safetensors(path):
+    """
+    {name: tensor} for a .safetensors file, where every tensor is a view into one
+    private, read-only-in-practice mapping of the file. Nothing is copied: the pages
+    come from the OS page cache, which every process mapping the same file shares.
+    """
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+    header.pop("__metadata__", None)
+    data_start = 8 + header_len
+
+    # shared=False -> MAP_PRIVATE: a stray in-place write copies that page instead of
+    # corrupting the file for everyone else
+    storage = torch.UntypedStorage.from_file(path, False, os.path.getsize(path))
+    buffer = torch.empty(0, dtype=torch.uint8).set_(storage)
+
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        raw = buffer[data_start + start:data_start + end]
+        try:
+            tensors[name] = raw.view(dtype).view(info["shape"])
+        except RuntimeError:
+            # Misaligned offset (not written by the safetensors library): copy this one
+            tensors[name] = raw.clone().view(dtype).view(info["shape"])
+    return tensors
+
+# accelerate's init_empty_weights() patches nn.Module.register_parameter for *every*
+# thread until it exits, which breaks modules built concurrently elsewhere (parallel
+# loads, the labeler, ...). _empty_weights patches it only for the duration of one
+# build, under MODEL_BUILD_LOCK, and only acts for the thread that asked for it.
+_EMPTY_INIT = threading.local()
+
+def _meta_register_parameter(original):
+    def register_parameter(module, name, param):
+        original(module, name, param)
+        if param is not None and getattr(_EMPTY_INIT, "active", False):
+            param_cls = type(module._parameters[name])
+            module._parameters[name] = param_cls(module._parameters[name].to("meta"), requires_grad=param.requires_grad)
+    return register_parameter
+
+class _empty_weights:
+    """
+    Builds a module with all parameters on the meta device (no allocation, no init),
+    buffers stay real. Scoped, thread-local counterpart of accelerate.init_empty_weights():
+    holds MODEL_BUILD_LOCK and puts register_parameter back on exit.
+    """
+    def __enter__(self):
+        MODEL_BUILD_LOCK.acquire()
+        self._original = None
+        if not getattr(_EMPTY_INIT, "active", False):  # Nested: the outer block owns the patch
+            self._original = torch.nn.Module.register_parameter
+            torch.nn.Module.register_parameter = _meta_register_parameter(self._original)
+            _EMPTY_INIT.active = True
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self._original is not None:
+                _EMPTY_INIT.active = False
+                torch.nn.Module.register_parameter = self._original
+        finally:
+            MODEL_BUILD_LOCK.release()
+        return False
+
+def get_model_store():
+    """
+    Process-wide store. Local snapshots are looked up under $EDGEFORGE_MODEL_DIR first.
+    """
+    global _DEFAULT_STORE
+    with _DEFAULT_STORE_LOCK:
+        if _DEFAULT_STORE is None:
+            _DEFAULT_STORE = ModelStore()
+        return _DEFAULT_STORE
+
+class ModelStore:
+    """
+    Loads diffusers / transformers models from local safetensors snapshots through
+    memory mapping, and keeps one instance per (class, model id, subfolder, dtype, variant).
+
+    - N worker processes mapping the same snapshot share one copy of the weights in
+      the page cache instead of N private copies.
+    - preload in the parent before forking (gunicorn --preload) and the workers
+      inherit the already built models copy-on-write. Loading never touches CUDA,
+      so it is safe to do before fork.
+
+    Weights are only shared while they stay on the CPU in their on-disk dtype. A
+    dtype conversion or a move to the GPU makes a private copy, as before. That
+    includes the GPU pipeline: EdgeForgePipeline moves the models to CUDA and
+    enable_model_cpu_offload() later moves them back into fresh, private CPU
+    tensors, so there every worker holds its own host copy of the offloaded
+    weights (tests/model_store_benchmark.py, mode "offload"). The mapping still
+    saves the load time and the transient second copy; the cross-worker sharing
+    holds for CPU-resident models (CPU serving, the YOLO labeler, preloading).
+    """
+    def __init__(self, root=None, local_files_only=None):
+        self.root = root if root is not None else os.environ.get("EDGEFORGE_MODEL_DIR")
+        if local_files_only is None:
+            local_files_only = os.environ.get("HF_HUB_OFFLINE", "0") not in ("0", "", "false", "False")
+        self.local_files_only = local_files_only
+
+        self.hits = 0
+        self.misses = 0
+        self._objects = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def snapshot_path(self, model_id, allow_patterns=None):
+        """
+        Local directory of model_id: an existing path, <root>/<model_id>, or the
+        Hugging Face cache (downloading allow_patterns unless local_files_only).
+        """
+        if os.path.isdir(model_id):
+            return model_id
+        if self.root:
+            local = os.path.join(self.root, model_id)
+            if os.path.isdir(local):
+                return local
+
+        from huggingface_hub import snapshot_download
+        return snapshot_download(model_id, allow_patterns=allow_patterns, local_files_only=self.local_files_only)
+
+    def resolve_file(self, filename):
+        """
+        <root>/<filename> if it exists there, else filename unchanged.
+        """
+        if self.root:
+            local = os.path.join(self.root, filename)
+            if os.path.exists(local):
+                return local
+        return filename
+
+    def get_or_create(self, key, factory):
+        """
+        The cached object for key, built with factory() on first use. Concurrent callers
+        for the same key wait for one build; different keys build in parallel.
+        """
+        with self._lock:
+            if key in self._objects:
+                self.hits += 1
+                return self._objects[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._objects:
+                    self.hits += 1
+                    return self._objects[key]
+                self.misses += 1
+            obj = factory()
+            with self._lock:
+                self._objects[key] = obj
+            return obj
+
+    def load(self, model_cls, model_id, subfolder=None, torch_dtype=None, variant=None):
+        """
+        model_cls.from_pretrained(model_id, subfolder=..., torch_dtype=..., variant=...)
+        with memory-mapped weights, cached per store.
+        """
+        key = (model_cls.__name__, model_id, subfolder, str(torch_dtype), variant)
+        return self.get_or_create(key, lambda: self._load(model_cls, model_id, subfolder, torch_dtype, variant))
+
+    def _load(self, model_cls, model_id, subfolder, torch_dtype, variant):
+        # diffusers ModelMixin vs transformers PreTrainedModel
+        is_diffusers = hasattr(model_cls, "load_config")
+        stem = "diffusion_pytorch_model" if is_diffusers else "model"
+        prefix = f"{subfolder}/" if subfolder else ""
+
+        # The variant (e.g. fp16) first, the plain weights only if there is none
+        files = []
+        for suffix in ([f".{variant}.safetensors"] if variant else []) + [".safetensors"]:
+            if suffix == ".safetensors":
+                patterns = [f"{prefix}{stem}.safetensors*", f"{prefix}{stem}-*.safetensors"]
+            else:
+                patterns = [f"{prefix}{stem}*{variant}*"]
+            folder = self.snapshot_path(model_id, allow_patterns=[f"{prefix}config.json"] + patterns)
+            if subfolder:
+                folder = os.path.join(folder, subfolder)
+            files = self._weight_files(folder, stem, suffix)
+            if files:
+                break
+
+        if not files:
+            # No safetensors (e.g. .bin only): regular load, no sharing
+            print(f"ModelStore: no safetensors for {model_id}/{subfolder or ''}, using from_pretrained")
+            return self._from_pretrained(model_cls, model_id, subfolder, torch_dtype)
+
+        state_dict = {}
+        for path in files:
+            state_dict.update(mmap_safetensors(path))
+
+        converted = 0
+        if torch_dtype is not None:
+            for name, tensor in state_dict.items():
+                if tensor.is_floating_point() and tensor.dtype != torch_dtype:
+                    state_dict[name] = tensor.to(torch_dtype)
+                    converted += 1
+        if converted:
+            print(f"ModelStore: {converted} tensors of {model_id}/{subfolder or ''} converted to {torch_dtype} (not shared)")
+
+        if is_diffusers:
+            config = model_cls.load_config(folder)
+            with _empty_weights():
+                model = model_cls.from_config(config)
+            model.register_to_config(_name_or_path=model_id)
+        else:
+            config = model_cls.config_class.from_pretrained(folder)
+            with _empty_weights():
+                model = model_cls(config)
+            model.config._name_or_path = model_id
+
+        # assign=True: parameters become the mapped tensors themselves (no copy)
+        missing, _ = model.load_state_dict(state_dict, strict=False, assign=True)
+        if missing:
+            # Renamed / legacy keys: leave the conversion to the library
+            print(f"ModelStore: {len(missing)} keys of {model_id}/{subfolder or ''} need conversion, using from_pretrained")
+            return self._from_pretrained(model_cls, model_id, subfolder, torch_dtype)
+        if hasattr(model, "tie_weights"):
+            model.tie_weights()
+        if torch_dtype is not None:
+            # Only casts the (small) buffers, tensors already in torch_dtype are kept as is
+            model.to(dtype=torch_dtype)
+        return model.eval()
+
+    def _from_pretrained(self, model_cls, model_id, subfolder, torch_dtype):
+        # Regular (copying) load, still preferring the local snapshot
+        if self.root and os.path.isdir(os.path.join(self.root, model_id)):
+            model_id = os.path.join(self.root, model_id)
+        kwargs = {"subfolder": subfolder} if subfolder else {}
+        # One build at a time process-wide (accelerate patches every thread, see startup.py)
+        with MODEL_BUILD_LOCK:
+            return model_cls.from_pretrained(model_id, torch_dtype=torch_dtype, local_files_only=self.local_files_only, **kwargs)
+
+    @staticmethod
+    def _weight_files(folder, stem, suffix):
+        single = os.path.join(folder, f"{stem}{suffix}")
+        if os.path.exists(single):
+            return [single]
+        index = single + ".index.json"
+        if os.path.exists(index):
+            with open(index) as f:
+                shards = sorted(set(json.load(f)["weight_map"].values()))
+            return [os.path.join(folder, shard) for shard in shards]
+        return []
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+            self._key_locks.clear()
+
+    def stats(self):
+        return {"models": len(self._objects), "hits": self.hits, "misses": self.misses}
@@ -1,87 +1,340 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import torch
-import cv2
-import numpy as np
 from PIL import Image
-from diffusers import StableDiffusionXLControlNetPipeline, ControlNetModel, AutoencoderKL
+from diffusers import StableDiffusionXLControlNetPipeline, ControlNetModel, AutoencoderKL, UNet2DConditionModel
+from transformers import CLIPTextModel, CLIPTextModelWithProjection
 from .tiled_vae import TiledVAEWrapper
+from .prompt_cache import PromptEmbeddingCache
+from .model_store import get_model_store
+from .startup import MODEL_BUILD_LOCK
+from .latents import save_latents
+from .preprocessing import LRUCache, canny_edge_map, content_hash, load_rgb
+from . import metrics
+
+CONTROLNET_ID = "diffusers/controlnet-canny-sdxl-1.0"
+VAE_ID = "stabilityai/sdxl-vae"
+SDXL_ID = "stabilityai/stable-diffusion-xl-base-1.0"
+
+# name -> ModelStore.load(model_cls, model_id, subfolder, torch_dtype, variant)
+MODEL_SPECS = {
+    "controlnet": (ControlNetModel, CONTROLNET_ID, None, torch.float16, "fp16"),
+    "vae": (AutoencoderKL, VAE_ID, None, torch.float32, None),
+    "unet": (UNet2DConditionModel, SDXL_ID, "unet", torch.float16, "fp16"),
+    "text_encoder": (CLIPTextModel, SDXL_ID, "text_encoder", torch.float16, "fp16"),
+    "text_encoder_2": (CLIPTextModelWithProjection, SDXL_ID, "text_encoder_2", torch.float16, "fp16"),
+}
+# What from_pretrained still needs once the models above are passed in
+SDXL_CONFIG_FILES = ["model_index.json", "scheduler/*", "tokenizer/*", "tokenizer_2/*"]
 
 class EdgeForgePipeline:
-    def __init__(self, device="cuda"):
+    def __init__(self, device="cuda", vae_memory_budget=None, vae_precision=None, prompt_cache_size=64,
+                 edge_cache_size=32, control_cache_size=16, model_store=None, pipe=None, num_inference_steps=50, edge_size=1024):
+        """
+        pipe: an already built StableDiffusionXLControlNetPipeline (e.g. the tiny random
+        models in tests/harness.py); nothing is loaded and no CPU offload is set up.
+        edge_size: side of the Canny edge maps, i.e. the generation resolution.
+        """
         self.device = device
+        self.num_inference_steps = num_inference_steps
+        self.edge_size = edge_size
+        # Finished Canny maps keyed by (content hash, size, thresholds)
+        self.edge_cache = LRUCache(max_size=edge_cache_size)
+        # ControlNet conditioning tensors keyed by (content hash, height, width)
+        self.control_cache = LRUCache(max_size=control_cache_size)
         print(f"Loading EdgeForge Pipeline on {device}...")
 
+        # Denoising (prompt encoding and control prep included) and decoding move models
+        # on/off the device (CPU offload hooks), so callers running them from different
+        # threads (see staged.py, the batcher, jobs) take turns
+        self.device_lock = threading.RLock()
+
+        # Seconds spent loading each component (reported by the app's /health)
+        self.load_times = {}
+        # Weights are memory-mapped from local safetensors snapshots, so several worker
+        # processes on one box share a single copy (see model_store.py)
+        self.model_store = model_store or get_model_store()
+
         # 1. Load ControlNet (The 'Structure' enforcer)
         # Using 'Canny' (Edge Detection) allows us to sketch a scene and have AI fill it.
-        controlnet_id = "diffusers/controlnet-canny-sdxl-1.0"
-        self.controlnet = ControlNetModel.from_pretrained(
-            controlnet_id, 
-            torch_dtype=torch.float16
-        ).to(device)
-
         # 2. Load the VAE (The 'Memory' bottleneck)
-        # 2. Load the VAE (The 'Memory' bottleneck)
-        # CRITICAL FIX: Always load SDXL VAE in float32 to prevent black images/NaNs
-        vae_id = "stabilityai/sdxl-vae"
-        self.vae = AutoencoderKL.from_pretrained(
-            vae_id, 
-            torch_dtype=torch.float32 
-        ).to(device)
+        # CRITICAL FIX: Always load SDXL VAE in float32 to prevent black images/NaNs (see MODEL_SPECS)
+        # The SDXL UNet / text encoders for step 4 come along: none of these depend
+        # on each other, so all checkpoints are read at once
+        if pipe is None:
+            models = self.load_models(self.model_store, self.load_times)
+        else:
+            models = {"controlnet": pipe.controlnet, "vae": pipe.vae}
+        self.controlnet = models["controlnet"].to(device)
+        self.vae = models["vae"].to(device)
 
         # 3. Apply your OPTIMIZATION (Module 4)
-        # We wrap the VAE immediately so the pipeline uses fractional decoding
-        self.tiled_vae = TiledVAEWrapper(self.vae, tile_size=512, overlap=64)
+        # We wrap the VAE immediately so the pipeline uses fractional decoding.
+        # auto_tune sizes tiles/batches from free VRAM (or vae_memory_budget bytes);
+        # 512/64 is only the starting point before the first decode.
+        # The weights stay float32, but on GPU tiles run under fp16 autocast and only
+        # tiles that overflow to NaN/inf are re-decoded in float32.
+        if vae_precision is None:
+            vae_precision = "float16" if str(device).startswith("cuda") else "float32"
+        self.tiled_vae = TiledVAEWrapper(
+            self.vae, tile_size=512, overlap=64,
+            memory_budget=vae_memory_budget, auto_tune=True, precision=vae_precision
+        )
 
         # 4. Load Main Pipeline (SDXL)
-        model_id = "stabilityai/stable-diffusion-xl-base-1.0"
-        self.pipe = StableDiffusionXLControlNetPipeline.from_pretrained(
-            model_id,
-            controlnet=self.controlnet,
-            vae=self.vae, # Pass our VAE (which we will hijack during decode)
-            torch_dtype=torch.float16,
-        ).to(device)
-        
-        # Optimize for speed
-        self.pipe.enable_model_cpu_offload() # Standard Diffusers optimization
+        # Only tokenizers + scheduler are still read by from_pretrained
+        model_id = SDXL_ID
+        if pipe is None:
+            start = time.perf_counter()
+            config_path = self.model_store.snapshot_path(model_id, allow_patterns=SDXL_CONFIG_FILES)
+            with MODEL_BUILD_LOCK:
+                self.pipe = StableDiffusionXLControlNetPipeline.from_pretrained(
+                    config_path,
+                    controlnet=self.controlnet,
+                    vae=self.vae, # Pass our VAE (which we will hijack during decode)
+                    unet=models["unet"],
+                    text_encoder=models["text_encoder"],
+                    text_encoder_2=models["text_encoder_2"],
+                    torch_dtype=torch.float16,
+                )
+            self.pipe = self.pipe.to(device)
+            self.load_times["sdxl"] = time.perf_counter() - start
+
+            # Optimize for speed
+            self.pipe.enable_model_cpu_offload() # Standard Diffusers optimization
+        else:
+            self.pipe = pipe.to(device)
 
-    def preprocess_canny(self, image_path):
+        # Shared by every generation call
+        self.negative_prompt = "cartoon, drawing, anime, low quality, blur, distortion, grid, messy"
+
+        # Text embeddings of repeated prompts (and the fixed negative) are reused,
+        # so the two SDXL text encoders only run on cache misses
+        self.prompt_cache = PromptEmbeddingCache(self.pipe, model_id, max_size=prompt_cache_size)
+
+    @staticmethod
+    def load_models(model_store=None, load_times=None):
         """
-        Converts a real image into a 1024x1024 Canny edge map.
+        Loads (or fetches from the store's cache) every weight-bearing component, in parallel
+        (the files are read concurrently, module construction is serialized by the store).
+        Call it once in the parent process before forking workers (preload) and
+        EdgeForgePipeline() in each worker gets the same, already mapped models.
+        Never touches CUDA, so it is fork-safe.
         """
-        image_pil = Image.open(image_path).convert("RGB")
-        
-        # --- CRITICAL FIX 2: RESIZE ---
-        # SDXL works best at 1024x1024. We resize to ensure tensor alignment.
-        image_pil = image_pil.resize((1024, 1024), Image.LANCZOS)
-        
-        image = np.array(image_pil)
-        
-        # Detect edges
-        image = cv2.Canny(image, 100, 200)
-        image = image[:, :, None]
-        image = np.concatenate([image, image, image], axis=2)
-        
-        return Image.fromarray(image)
+        model_store = model_store or get_model_store()
+        load_times = {} if load_times is None else load_times
+
+        def timed_load(name, spec):
+            start = time.perf_counter()
+            model = model_store.load(*spec)
+            load_times[name] = time.perf_counter() - start
+            return model
 
-    def generate(self, prompt, control_image, seed=None):
+        with ThreadPoolExecutor(max_workers=len(MODEL_SPECS)) as pool:
+            futures = {name: pool.submit(timed_load, name, spec) for name, spec in MODEL_SPECS.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    def preprocess_canny(self, image, size=None, low_threshold=100, high_threshold=200, executor=None):
+        """
+        Converts a real image into a 1024x1024 Canny edge map (size x size, default edge_size).
+        `image` can be a file path, encoded bytes (e.g. an upload), a PIL image or an array.
+        Finished edge maps are cached by content hash + parameters, so re-submitting
+        the same layout skips decoding, resizing and Canny entirely.
+        executor: a cpu_pool.CPUExecutor to run cache misses in its worker processes
+        """
+        size = size or self.edge_size
+        with metrics.timed("canny"):
+            key = (content_hash(image), size, low_threshold, high_threshold)
+            edges = self.edge_cache.get(key)
+            if edges is None:
+                if executor is not None:
+                    edges = executor.canny_edge_map(image, size, low_threshold, high_threshold)
+                else:
+                    edges = canny_edge_map(load_rgb(image), size, low_threshold, high_threshold)
+                self.edge_cache.put(key, edges)
+
+            # Callers (e.g. the layout remixer) get their own copy
+            return edges.copy()
+
+    def prepare_control_image(self, image, height=None, width=None):
+        """
+        Turns a control image (PIL, array, path or bytes) into the [0, 1] float tensor (1, 3, H, W)
+        the ControlNet consumes, using the pipeline's own image processor.
+        Tensors are passed through untouched. Results are cached by content hash and
+        target size (None = the image's own size, as diffusers does), so an identical
+        layout is only prepared once per job.
+        """
+        if isinstance(image, torch.Tensor):
+            return image
+
+        key = (content_hash(image), height, width)
+        tensor = self.control_cache.get(key)
+        if tensor is None:
+            # Paths / bytes / arrays go through PIL so the processor sees the same input as before
+            if not isinstance(image, Image.Image):
+                image = load_rgb(image)
+            tensor = self.pipe.control_image_processor.preprocess(image, height=height, width=width).to(dtype=torch.float32)
+            self.control_cache.put(key, tensor)
+        return tensor
+
+    def generate(self, prompt, control_image, seed=None, output_path=None, latents_path=None):
+        """
+        Runs SDXL + ControlNet and decodes with the tiled VAE.
+        With output_path (.png / .npy / .raw) the decode streams row bands straight
+        to disk and the path is returned instead of a PIL image.
+        With latents_path (.safetensors / .npz) nothing is decoded: the scaled latents
+        and their metadata are saved and the path is returned (see latents.decode_job).
+        """
         if seed:
             generator = torch.Generator(device=self.device).manual_seed(seed)
         else:
             generator = None
         
         # 1. Run Diffusion
-        # We need a strong negative prompt for SDXL to look realistic
-        negative_prompt = "cartoon, drawing, anime, low quality, blur, distortion, grid, messy"
-        
-        output = self.pipe(
-            prompt=prompt,
-            negative_prompt=negative_prompt, # Added Negative Prompt
-            image=control_image,
-            controlnet_conditioning_scale=0.5,
-            output_type="latent",
-            generator=generator
-        )
-        latents = output.images 
+        latents = self._denoise(prompt, control_image, generator)
+
+        if latents_path is not None:
+            return self.export_latents(latents, latents_path, prompt, seed, control_image)
 
+        # 2. Decode
+        return self.decode_latents(latents, output_path)
+
+    def fingerprint(self):
+        """
+        Settings besides the request that decide the output image (result cache keys).
+        """
+        return {
+            "sdxl_model": SDXL_ID,
+            "controlnet_model": CONTROLNET_ID,
+            "vae_model": VAE_ID,
+            "negative_prompt": self.negative_prompt,
+            "controlnet_conditioning_scale": 0.5,
+            "num_inference_steps": self.num_inference_steps,
+            "scheduler": type(self.pipe.scheduler).__name__,
+            "vae_precision": str(self.tiled_vae.precision),
+            "device": str(self.device).split(":")[0],
+        }
+
+    def latent_metadata(self, prompt, seed, control_image):
+        """
+        What a later decode job (or a re-run) needs to know about a latent.
+        """
+        metadata = {
+            "prompt": prompt,
+            "negative_prompt": self.negative_prompt,
+            "seed": seed or None,  # None = unseeded, not reproducible
+            "sdxl_model": SDXL_ID,
+            "controlnet_model": CONTROLNET_ID,
+            "vae_model": VAE_ID,
+            "scaling_factor": getattr(self.vae.config, "scaling_factor", 0.13025),
+            "created": time.time(),
+        }
+        if control_image is not None and not isinstance(control_image, torch.Tensor):
+            image = control_image if isinstance(control_image, Image.Image) else load_rgb(control_image)
+            metadata["layout_hash"] = content_hash(control_image)
+            metadata["layout_size"] = list(image.size)
+        return metadata
+
+    def export_latents(self, latents, path, prompt, seed=None, control_image=None):
+        """
+        Saves scaled latents + metadata (.safetensors or .npz) and returns the path.
+        """
+        return save_latents(path, latents, self.latent_metadata(prompt, seed, control_image))
+
+    def generate_many(self, prompts, control_images, seeds, micro_batch=2, latents_dir=None):
+        """
+        Batched counterpart of generate(): runs the diffusion loop over micro-batches
+        of `micro_batch` samples and returns one PIL image per prompt, in order.
+
+        Every sample gets its own generator, so a given (prompt, control image, seed)
+        produces the same image as generate() no matter how samples are grouped, up
+        to float rounding: batched UNet / ControlNet passes round differently, so
+        latents match to ~1e-4 and pixels to within one level (tests/test_pipeline.py).
+        With latents_dir, latents are exported as latents_dir/latents_XXXX.safetensors
+        instead of decoded, and the paths are returned.
+        """
+        if not len(prompts) == len(control_images) == len(seeds):
+            raise ValueError(
+                f"prompts, control_images and seeds must have the same length "
+                f"(got {len(prompts)}, {len(control_images)}, {len(seeds)})"
+            )
+
+        results = []
+        for start in range(0, len(prompts), micro_batch):
+            end = min(start + micro_batch, len(prompts))
+            print(f"Forging micro-batch {start + 1}-{end} of {len(prompts)}...")
+
+            latents = self.denoise_many(prompts[start:end], control_images[start:end], seeds[start:end])
+
+            if latents_dir is not None:
+                for i, sample_latents in enumerate(latents, start=start):
+                    path = os.path.join(latents_dir, f"latents_{i:04d}.safetensors")
+                    results.append(self.export_latents(sample_latents, path, prompts[i], seeds[i], control_images[i]))
+                continue
+
+            # Decode sample by sample: tile batching already fills the device, and the
+            # decode is then the very same call generate() makes on these latents
+            for sample_latents in latents:
+                results.append(self.decode_latents(sample_latents))
+
+        return results
+
+    def denoise_many(self, prompts, control_images, seeds):
+        """
+        One diffusion pass over all samples (no decode). Returns a list of scaled
+        latents, one (1, 4, h, w) tensor per sample; decode them with decode_latents().
+        """
+        generators = []
+        for seed in seeds:
+            generator = torch.Generator(device=self.device)
+            if seed:
+                generator.manual_seed(seed)
+            else:
+                generator.seed()  # Unseeded sample: fresh random state, like generate()
+            generators.append(generator)
+
+        latents = self._denoise(list(prompts), list(control_images), generators)
+        return list(latents.split(1, dim=0))
+
+    def _denoise(self, prompt, control_image, generator):
+        """
+        SDXL + ControlNet denoising loop, returns scaled latents.
+        prompt / control_image / generator may be single items or equal-length lists.
+        """
+        # The whole body takes turns on the device: prompt-cache misses run the text
+        # encoders (moved on/off the GPU by the offload hooks) and control prep puts
+        # tensors on the device, while the batcher, jobs and batches call in from threads
+        with self.device_lock:
+            # We need a strong negative prompt for SDXL to look realistic
+            # (prompt + negative are encoded once and served from the embedding cache)
+            with metrics.timed("prompt_encode"):
+                prompt_kwargs = self.prompt_cache.as_pipe_kwargs(prompt, self.negative_prompt)
+
+            # Conditioning tensors come from the cache; diffusers skips its PIL conversion
+            with metrics.timed("control_prepare"):
+                if isinstance(control_image, list):
+                    control_image = torch.cat([self.prepare_control_image(image) for image in control_image], dim=0)
+                else:
+                    control_image = self.prepare_control_image(control_image)
+
+            with metrics.timed("diffusion"):
+                output = self.pipe(
+                    **prompt_kwargs,
+                    image=control_image,
+                    num_inference_steps=self.num_inference_steps,
+                    controlnet_conditioning_scale=0.5,
+                    output_type="latent",
+                    generator=generator
+                )
+        return output.images 
+
+    def decode_latents(self, latents, output_path=None):
+        """
+        Unscales the latents, runs the tiled VAE decode and converts to a PIL image
+        (or streams to output_path and returns the path).
+        """
         # --- CRITICAL FIX 1: SCALING ---
         # The VAE expects latents to be scaled up. 
         # Standard value is 0.13025, so we divide by it (effectively multiplying).
@@ -91,14 +344,16 @@ class EdgeForgePipeline:
             latents = latents / 0.13025 # Fallback for SDXL default
         # -------------------------------
 
-        # 2. Decode
         print("Decoding with Fractional Batches...")
-        self.vae.to(self.device) 
-        final_image = self.tiled_vae.decode_with_blending(latents)
-        
-        # 3. Post-process
-        final_image = (final_image / 2 + 0.5).clamp(0, 1)
-        final_image = final_image.cpu().permute(0, 2, 3, 1).float().numpy()
-        final_image = (final_image * 255).round().astype("uint8")
+        with self.device_lock, metrics.timed("vae_decode"):
+            self.vae.to(self.device) 
+            if output_path is not None:
+                # Bands are normalized + converted to uint8 on the fly, never the full image
+                return self.tiled_vae.decode_to_file(latents, output_path)
+
+            final_image = self.tiled_vae.decode_with_blending(latents)
         
-        return Image.fromarray(final_image[0])
\ No newline at end of file
+        # 3. Post-process (in place on the decode buffer, no extra float copies)
+        with metrics.timed("to_uint8"):
+            final_image = TiledVAEWrapper.to_uint8(final_image)
+            return Image.fromarray(final_image[0])
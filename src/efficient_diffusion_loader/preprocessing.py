@@ -0,0 +1,107 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import cv2
+import numpy as np
+from PIL import Image
+
+class LRUCache:
+    """
+    Small thread-safe LRU map with hit/miss counters.
+    """
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+def load_rgb(image):
+    """
+    Accepts a file path, encoded image bytes, a PIL image or an (H, W[, C]) uint8 array
+    and returns a PIL RGB image.
+    """
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(BytesIO(image)).convert("RGB")
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image).convert("RGB")
+    if isinstance(image, (str, os.PathLike)):
+        return Image.open(image).convert("RGB")
+    raise TypeError(f"Unsupported image input: {type(image).__name__}")
+
+def content_hash(image):
+    """
+    Stable digest of the image content (encoded bytes are hashed as-is, decoded
+    images by their pixels, shape and mode).
+    """
+    digest = hashlib.sha256()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        digest.update(image)
+    elif isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    elif isinstance(image, Image.Image):
+        digest.update(f"{image.mode}{image.size}".encode())
+        digest.update(image.tobytes())
+    elif isinstance(image, np.ndarray):
+        digest.update(f"{image.dtype}{image.shape}".encode())
+        digest.update(np.ascontiguousarray(image).tobytes())
+    else:
+        raise TypeError(f"Unsupported image input: {type(image).__name__}")
+    return digest.hexdigest()
+
+def canny_edge_map(image_pil, size=1024, low_threshold=100, high_threshold=200):
+    """
+    RGB PIL image -> size x size, 3-channel Canny edge map (PIL).
+    """
+    # --- CRITICAL FIX 2: RESIZE ---
+    # SDXL works best at 1024x1024. We resize to ensure tensor alignment.
+    image_pil = image_pil.resize((size, size), Image.LANCZOS)
+    
+    image = np.array(image_pil)
+    
+    # Detect edges
+    image = cv2.Canny(image, low_threshold, high_threshold)
+    image = image[:, :, None]
+    image = np.concatenate([image, image, image], axis=2)
+    
+    return Image.fromarray(image)
@@ -0,0 +1,224 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# torch.profiler is process-wide: one profiled request at a time
+_torch_profiler_lock = threading.Lock()
+
+# Our spans get their own process lane in the viewer, above torch's CPU / CUDA lanes
+_SPAN_PID = 0
+
+class RequestTrace:
+    """
+    Chrome / Perfetto trace of one request.
+
+    span(name) records EdgeForge spans (pipeline stages, tiled VAE batches) on the
+    thread that ran them. When torch is loaded, start() also runs torch.profiler over
+    every thread (ops + CUDA kernels) and each span becomes a record_function
+    annotation, so the ops group under the stage that issued them.
+    Usage: trace = RequestTrace("generate_batch").start() ... trace.stop(); trace.save(path)
+    """
+    def __init__(self, name, torch_profiler=True):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.torch_profiler = torch_profiler
+        self.notes = {"torch_profiler": "off"}
+        self.events = []
+        self.thread_names = {}
+        self.started_at = time.time()
+        self.seconds = None
+        self._epoch_ns = time.time_ns()
+        self._perf = time.perf_counter()
+        self._profiler = None
+        self._record_function = None
+        self._torch_events = []
+        self._torch_base_ns = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.torch_profiler:
+            self._start_torch()
+        return self
+
+    def _start_torch(self):
+        torch = sys.modules.get("torch")  # Nothing to profile if no model code has imported it
+        if torch is None:
+            self.notes["torch_profiler"] = "torch not loaded"
+            return
+        if not _torch_profiler_lock.acquire(blocking=False):
+            self.notes["torch_profiler"] = "busy: another request is being profiled"
+            return
+        from torch.profiler import ProfilerActivity, profile, record_function
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        kwargs = {}
+        try:
+            from torch._C._profiler import _ExperimentalConfig
+            # The stages run on pipeline worker threads, not the one that starts the profiler
+            kwargs["experimental_config"] = _ExperimentalConfig(profile_all_threads=True)
+        except (ImportError, TypeError):
+            self.notes["threads"] = "profiler thread only (no profile_all_threads in this torch)"
+        try:
+            self._profiler = profile(activities=activities, **kwargs)
+            self._profiler.start()
+        except Exception as e:
+            self._profiler = None
+            _torch_profiler_lock.release()
+            self.notes["torch_profiler"] = f"failed: {e!r}"
+            return
+        self._record_function = record_function
+        self.notes["torch_profiler"] = "+".join(a.name.lower() for a in activities)
+
+    def stop(self):
+        """ Stops the torch profiler (if this trace holds it). Safe to call twice. """
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self._perf
+        profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            return self
+        try:
+            profiler.stop()
+            # export_chrome_trace only writes to a path
+            fd, path = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            try:
+                profiler.export_chrome_trace(path)
+                with open(path) as f:
+                    exported = json.load(f)
+            finally:
+                os.remove(path)
+            self._torch_events = exported.get("traceEvents", [])
+            self._torch_base_ns = exported.get("baseTimeNanoseconds", 0)
+        except Exception as e:
+            self.notes["torch_profiler"] = f"export failed: {e!r}"
+        finally:
+            self._record_function = None
+            _torch_profiler_lock.release()
+        return self
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter()
+        try:
+            if self._record_function is None:
+                yield
+            else:
+                with self._record_function(name):
+                    yield
+        finally:
+            self.add(name, start, time.perf_counter() - start, **args)
+
+    def add(self, name, start, seconds, **args):
+        """ A finished span on the current thread: start from time.perf_counter(). """
+        thread = threading.current_thread()
+        tid = threading.get_native_id()
+        event = {
+            "name": name, "cat": "edgeforge", "ph": "X", "pid": _SPAN_PID, "tid": tid,
+            "ts": (start - self._perf) * 1e6, "dur": seconds * 1e6,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+            self.thread_names.setdefault(tid, thread.name)
+
+    def chrome_trace(self):
+        """ {"traceEvents": [...]} with every timestamp in us from the start of the request. """
+        meta = [{"name": "process_name", "ph": "M", "pid": _SPAN_PID, "args": {"name": f"EdgeForge {self.name}"}}]
+        with self._lock:
+            events = list(self.events)
+            meta += [{"name": "thread_name", "ph": "M", "pid": _SPAN_PID, "tid": tid, "args": {"name": name}}
+                     for tid, name in self.thread_names.items()]
+
+        # torch timestamps are us relative to baseTimeNanoseconds (wall clock)
+        shift = (self._torch_base_ns - self._epoch_ns) / 1000
+        for event in self._torch_events:
+            if "ts" in event:
+                event = dict(event, ts=float(event["ts"]) + shift)
+            events.append(event)
+        return {
+            "traceEvents": meta + events,
+            "displayTimeUnit": "ms",
+            "otherData": dict(self.notes, id=self.id, request=self.name, started_at=self.started_at, seconds=self.seconds),
+        }
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        os.replace(tmp_path, path)
+        return path
+
+class TraceStore:
+    """
+    Keeps the last max_traces request traces on disk (<directory>/<id>.json).
+    A trace is registered when its request starts and readable once it is saved.
+    """
+    def __init__(self, directory=None, max_traces=16):
+        self.directory = directory or tempfile.mkdtemp(prefix="edgeforge-traces-")
+        self.max_traces = max_traces
+        os.makedirs(self.directory, exist_ok=True)
+        self._traces = OrderedDict()  # id -> {"id", "request", "state", ...}
+        self._lock = threading.Lock()
+
+    def register(self, trace):
+        with self._lock:
+            self._traces[trace.id] = {"id": trace.id, "request": trace.name, "state": "recording",
+                                      "started_at": trace.started_at}
+        return trace
+
+    def save(self, trace):
+        """ Stops the trace if needed and writes it out (once: later calls return the same path). """
+        path = os.path.join(self.directory, f"{trace.id}.json")
+        with self._lock:
+            info = self._traces.get(trace.id)
+            if info is not None and info["state"] != "recording":
+                return path
+            # Claimed: a concurrent save() returns early
+            self._traces[trace.id] = dict(info or {"id": trace.id, "request": trace.name, "started_at": trace.started_at},
+                                          state="saving")
+        trace.stop()
+        trace.save(path)
+        with self._lock:
+            self._traces[trace.id] = dict(
+                self._traces.get(trace.id, {"id": trace.id, "request": trace.name, "started_at": trace.started_at}),
+                state="ready", seconds=trace.seconds, bytes=os.path.getsize(path), **trace.notes
+            )
+        self._evict()
+        print(f"Trace {trace.id} ({trace.name}, {trace.seconds:.2f}s) saved to '{path}'")
+        return path
+
+    def _evict(self):
+        with self._lock:
+            ready = [trace_id for trace_id, info in self._traces.items() if info["state"] == "ready"]
+            drop = ready[:max(0, len(ready) - self.max_traces)]
+            for trace_id in drop:
+                del self._traces[trace_id]
+        for trace_id in drop:
+            try:
+                os.remove(os.path.join(self.directory, f"{trace_id}.json"))
+            except OSError:
+                pass
+
+    def get(self, trace_id):
+        with self._lock:
+            info = self._traces.get(trace_id)
+            return dict(info) if info is not None else None
+
+    def path(self, trace_id):
+        """ File of a finished trace, None if unknown or still recording. """
+        info = self.get(trace_id)
+        if info is None or info["state"] != "ready":
+            return None
+        return os.path.join(self.directory, f"{trace_id}.json")
+
+    def list(self):
+        with self._lock:
+            return [dict(info) for info in reversed(self._traces.values())]
@@ -0,0 +1,70 @@
+import torch
+from .preprocessing import LRUCache
+
+class PromptEmbeddingCache:
+    """
+    LRU cache of SDXL encode_prompt() outputs, keyed by (prompt, negative prompt, model id).
+
+    The negative prompt is fixed and the Director draws prompts from a small set of
+    conditions, so most calls in a batch are repeats. On a hit the text encoders are
+    not touched at all; with model CPU offload that means they simply stay offloaded.
+    """
+    def __init__(self, pipe, model_id, max_size=64):
+        self.pipe = pipe
+        self.model_id = model_id
+        # Same LRU map as the edge / control caches (preprocessing.py)
+        self._entries = LRUCache(max_size=max_size)
+
+    @property
+    def max_size(self):
+        return self._entries.max_size
+
+    def _encode(self, prompt, negative_prompt):
+        with torch.no_grad():
+            return self.pipe.encode_prompt(
+                prompt=prompt,
+                device=self.pipe._execution_device,
+                num_images_per_prompt=1,
+                do_classifier_free_guidance=True,
+                negative_prompt=negative_prompt,
+            )
+
+    def get(self, prompt, negative_prompt):
+        """
+        (prompt_embeds, negative_prompt_embeds, pooled_prompt_embeds, negative_pooled_prompt_embeds)
+        for a single prompt, each with batch dimension 1.
+        """
+        key = (prompt, negative_prompt, self.model_id)
+        embeds = self._entries.get(key)
+        if embeds is None:
+            embeds = self._encode(prompt, negative_prompt)
+            self._entries.put(key, embeds)
+        return embeds
+
+    def get_batch(self, prompts, negative_prompt):
+        """
+        Same as get() for a list of prompts, concatenated along the batch dimension.
+        """
+        per_prompt = [self.get(prompt, negative_prompt) for prompt in prompts]
+        return tuple(torch.cat(parts, dim=0) for parts in zip(*per_prompt))
+
+    def as_pipe_kwargs(self, prompt, negative_prompt):
+        """
+        Keyword arguments for the SDXL pipeline call in place of prompt/negative_prompt.
+        """
+        if isinstance(prompt, list):
+            embeds = self.get_batch(prompt, negative_prompt)
+        else:
+            embeds = self.get(prompt, negative_prompt)
+        return {
+            "prompt_embeds": embeds[0],
+            "negative_prompt_embeds": embeds[1],
+            "pooled_prompt_embeds": embeds[2],
+            "negative_pooled_prompt_embeds": embeds[3],
+        }
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
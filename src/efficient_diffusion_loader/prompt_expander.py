@@ -1,5 +1,6 @@
+import hashlib
 import json
-import random
+from .seeding import rng
 
 class PromptExpander:
     def __init__(self):
@@ -28,10 +29,19 @@ class PromptExpander:
 
 
 
-    def generate_variations(self, base_intent, count=5):
+    def fingerprint(self):
+        """
+        Digest of the ontology: cached results made with other modifiers don't match.
+        """
+        ontology = json.dumps([self.failure_modes, self.quality_boosters], sort_keys=True)
+        return hashlib.sha256(ontology.encode()).hexdigest()[:16]
+
+    def generate_variations(self, base_intent, count=5, seed=None):
         """
         Generates 'count' unique variations of the user's intent.
+        With a seed the picks (and seeds) are reproducible.
         """
+        random = rng(seed)
         variations = []
         print(f"Director: Brainstorming {count} scenarios for '{base_intent}'...")
         
@@ -55,10 +65,12 @@ class PromptExpander:
             
         return variations
         
-    def expand(self, user_intent):
+    def expand(self, user_intent, seed=None):
         """
         Translates a vague user intent into a structured EdgeForge directive.
+        With a seed the modifier picks are reproducible (deterministic mode).
         """
+        random = rng(seed)
         print(f"Director: Analyzing intent '{user_intent}'...")
         
         # 1. Decompose Intent (Simple Keyword Matching for MVP)
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .metrics import Histogram
+
+_META = "meta.json"
+
+class ResultCache:
+    """
+    Content-addressed, size-bounded store of finished results on disk.
+
+    Every entry is a directory root/<key[:2]>/<key>/ holding the result files plus
+    meta.json. Entries are written to a temp directory and renamed into place, so
+    readers (other workers included) never see half an entry. When the total size
+    exceeds max_bytes the least recently used entries are removed; recency is the
+    mtime of meta.json, so the LRU order survives restarts.
+    """
+    def __init__(self, root, max_bytes=2 * 1024**3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = Histogram()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def make_key(*parts):
+        """ sha256 of the JSON-encoded parts: equal inputs, equal key """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    @staticmethod
+    def _entry_size(entry_dir):
+        """ Bytes of a complete entry; raises OSError if there is none (no meta.json) """
+        os.stat(os.path.join(entry_dir, _META))
+        return sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+
+    def _scan(self):
+        found = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if shard.startswith(".") or not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                entry_dir = os.path.join(shard_dir, key)
+                try:
+                    used = os.path.getmtime(os.path.join(entry_dir, _META))
+                    size = self._entry_size(entry_dir)
+                except OSError:
+                    continue  # Incomplete or foreign entry
+                found.append((used, key, size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+        if found:
+            print(f"Result cache: {len(found)} entries, {self._bytes / 1024**2:.1f} MB in '{self.root}'")
+        self._evict()
+
+    def _adopt(self, key):
+        """
+        Indexes an entry another worker (or process) stored since our scan.
+        True if the key is now known.
+        """
+        try:
+            size = self._entry_size(self._path(key))
+        except OSError:
+            return False
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._bytes += size
+        return True
+
+    def get(self, key):
+        """
+        (files {name: bytes}, metadata) for a cached key, or None.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            known = key in self._entries
+            if known:
+                self._entries.move_to_end(key)
+        if not known:
+            known = self._adopt(key)
+        result = None
+        if known:
+            entry_dir = self._path(key)
+            try:
+                files = {}
+                for name in os.listdir(entry_dir):
+                    if name != _META:
+                        with open(os.path.join(entry_dir, name), "rb") as f:
+                            files[name] = f.read()
+                with open(os.path.join(entry_dir, _META)) as f:
+                    metadata = json.load(f)
+                os.utime(os.path.join(entry_dir, _META))
+                result = (files, metadata)
+            except OSError:
+                # Evicted meanwhile (or removed by hand): forget it
+                self._drop(key)
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self.lookup_seconds.observe(time.perf_counter() - start)
+        return result
+
+    def put(self, key, files, metadata):
+        """
+        Stores files {name: bytes} + a JSON-able metadata dict under key.
+        """
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        size = 0
+        for name, data in files.items():
+            with open(os.path.join(tmp_dir, name), "wb") as f:
+                f.write(data)
+            size += len(data)
+        with open(os.path.join(tmp_dir, _META), "w") as f:
+            json.dump(dict(metadata, key=key, stored=time.time()), f, indent=2)
+        size += os.path.getsize(os.path.join(tmp_dir, _META))
+
+        entry_dir = self._path(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Same key stored concurrently (same content): keep the first one,
+            # and index it in case another worker wrote it
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            self._adopt(key)
+        else:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = size
+                    self._bytes += size
+        self._evict()
+
+    def _drop(self, key):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._bytes -= size
+        if size is not None:
+            shutil.rmtree(self._path(key), ignore_errors=True)
+        return size is not None
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                # The newest entry is always kept, even if larger than max_bytes
+                if self._bytes <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                key = next(iter(self._entries))
+            if self._drop(key):
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "lookup_seconds": self.lookup_seconds.snapshot(),
+            }
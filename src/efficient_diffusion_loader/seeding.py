@@ -0,0 +1,8 @@
+import random
+
+def rng(seed=None):
+    """
+    random.Random(seed) for reproducible picks (prompts, layouts).
+    Unseeded: the shared module RNG, as before.
+    """
+    return random if seed is None else random.Random(seed)
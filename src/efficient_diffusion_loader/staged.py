@@ -0,0 +1,205 @@
+import contextvars
+import queue
+import threading
+import time
+
+from . import metrics
+
+# End-of-stream marker passed down the queues
+_STOP = object()
+
+class Stage:
+    """
+    One step of a StagedPipeline.
+
+    fn(item) -> result, or with batch_size > 1 fn([items]) -> [results] (same length;
+    the last batch may be smaller). `workers` threads run fn concurrently.
+    """
+    def __init__(self, name, fn, workers=1, batch_size=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.items = 0
+        self.calls = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0         # starved: blocked on an empty input queue
+        self.blocked_seconds = 0.0      # back-pressure: blocked on a full output queue
+        self.queue_samples = []
+
+class StagedPipeline:
+    """
+    Runs items through a chain of stages, each in its own worker thread(s),
+    connected by bounded queues. While the device denoises item k, the CPU stages
+    augment item k+1 and label / encode item k-1, so the total time approaches
+    that of the slowest stage instead of the sum of all stages.
+
+    The queues are bounded (queue_size), so a fast producer can't run ahead and pile
+    up decoded images in memory.
+    """
+    def __init__(self, stages, queue_size=2):
+        if not stages:
+            raise ValueError("StagedPipeline needs at least one stage")
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.total_seconds = None
+        self._error = None
+        self._abort = threading.Event()
+
+    def run(self, items):
+        """
+        Feeds items through every stage and returns the final results in input order.
+        Re-raises the first exception raised by any stage.
+        """
+        # queues[i] feeds stage i; the last one collects the results (unbounded)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages] + [queue.Queue()]
+        self._error = None
+        self._abort.clear()
+        for stage in self.stages:
+            stage.reset()
+
+        # Every worker runs in a copy of the caller's context (e.g. its request timing)
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(self._feed, items, queues[0]), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=contextvars.copy_context().run, args=(self._work, stage, queues[i], queues[i + 1], remaining),
+                    name=f"stage-{stage.name}", daemon=True
+                ))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        results = {}
+        while True:
+            entry = queues[-1].get()
+            if entry is _STOP:
+                break
+            index, value = entry
+            results[index] = value
+        for thread in threads:
+            thread.join()
+        self.total_seconds = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+        return [results[i] for i in sorted(results)]
+
+    def _feed(self, items, out_queue):
+        for index, item in enumerate(items):
+            if self._abort.is_set():
+                break
+            out_queue.put((index, item))
+        out_queue.put(_STOP)
+
+    def _next_batch(self, stage, in_queue):
+        """
+        Up to stage.batch_size entries; (batch, saw_stop).
+        """
+        batch = []
+        while len(batch) < stage.batch_size:
+            waited = time.perf_counter()
+            stage.queue_samples.append(in_queue.qsize())
+            entry = in_queue.get()
+            with stage._lock:
+                stage.wait_seconds += time.perf_counter() - waited
+            if entry is _STOP:
+                # Leave it for the sibling workers of this stage
+                in_queue.put(_STOP)
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _work(self, stage, in_queue, out_queue, remaining):
+        while True:
+            batch, stopped = self._next_batch(stage, in_queue)
+            # After a failure keep draining, so no upstream put() blocks forever
+            if batch and not self._abort.is_set():
+                self._process(stage, batch, out_queue)
+            if stopped:
+                break
+
+        with stage._lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            out_queue.put(_STOP)
+
+    def _process(self, stage, batch, out_queue):
+        indices = [index for index, _ in batch]
+        values = [value for _, value in batch]
+        start = time.perf_counter()
+        try:
+            if stage.batch_size > 1:
+                outputs = stage.fn(values)
+                if len(outputs) != len(values):
+                    raise RuntimeError(f"Stage '{stage.name}' returned {len(outputs)} results for {len(values)} items")
+            else:
+                outputs = [stage.fn(values[0])]
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+            self._abort.set()
+            print(f"Stage '{stage.name}' failed: {e!r}")
+            return
+        busy = time.perf_counter() - start
+        trace = metrics.current_trace()
+        if trace is not None:
+            trace.add(f"stage:{stage.name}", start, busy, items=indices)
+
+        with stage._lock:
+            stage.items += len(values)
+            stage.calls += 1
+            stage.busy_seconds += busy
+
+        for index, output in zip(indices, outputs):
+            waited = time.perf_counter()
+            out_queue.put((index, output))
+            with stage._lock:
+                stage.blocked_seconds += time.perf_counter() - waited
+
+    def stats(self):
+        """
+        Per-stage items, throughput (items/s over the whole run), utilization
+        (busy time / (wall time * workers)) and input queue occupancy.
+        """
+        total = self.total_seconds or 0.0
+        stages = []
+        for stage in self.stages:
+            samples = stage.queue_samples
+            stages.append({
+                "stage": stage.name,
+                "workers": stage.workers,
+                "items": stage.items,
+                "calls": stage.calls,
+                "busy_seconds": stage.busy_seconds,
+                "seconds_per_item": stage.busy_seconds / stage.items if stage.items else 0.0,
+                "throughput": stage.items / total if total else 0.0,
+                "utilization": stage.busy_seconds / (total * stage.workers) if total else 0.0,
+                "starved_seconds": stage.wait_seconds,
+                "blocked_seconds": stage.blocked_seconds,
+                "queue_mean": sum(samples) / len(samples) if samples else 0.0,
+                "queue_max": max(samples) if samples else 0,
+                "queue_capacity": self.queue_size,
+            })
+        return {"total_seconds": total, "stages": stages}
+
+    def report(self):
+        """
+        The stats as a small text table (for the server log).
+        """
+        stats = self.stats()
+        lines = [f"Staged pipeline: {stats['total_seconds']:.2f}s total"]
+        for s in stats["stages"]:
+            lines.append(
+                f"  {s['stage']:<10} {s['items']:>4} items  {s['throughput']:6.2f}/s  "
+                f"busy {s['utilization']:5.0%}  queue {s['queue_mean']:.1f}/{s['queue_capacity']} (max {s['queue_max']})"
+            )
+        return "\n".join(lines)
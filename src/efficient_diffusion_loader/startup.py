@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# from_pretrained (accelerate's init_empty_weights) swaps torch.nn.Module.register_parameter
+# for the whole process while it builds a model, then puts the saved one back. Two builds
+# overlapping in different threads (or a build next to the YOLO constructor) get meta
+# parameters, and the interleaved save/restore can leave the patch installed for good.
+# Every model construction takes this lock; reading checkpoint files stays concurrent.
+MODEL_BUILD_LOCK = threading.RLock()
+
+class ComponentLoader:
+    """
+    Loads independent components (pipeline, labeler, director, ...) concurrently in a
+    thread pool and keeps per-component state + load time for health checks.
+
+    factories: {name: zero-argument callable returning the loaded component}
+    on_loaded: optional callback(name, component), called from the worker thread.
+
+    Model loading is mostly file IO and C++ (safetensors, torch), which releases the
+    GIL, so threads overlap well here. Building the modules themselves is serialized
+    (MODEL_BUILD_LOCK), so factories must take it around from_pretrained and friends.
+    """
+    def __init__(self, factories, max_workers=None, on_loaded=None):
+        self.factories = dict(factories)
+        self.max_workers = max_workers or len(self.factories) or 1
+        self.on_loaded = on_loaded
+
+        self.components = {}
+        self._status = {name: {"state": PENDING, "seconds": None, "error": None} for name in self.factories}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        """
+        Submits every factory and returns immediately (the server can come up meanwhile).
+        """
+        if self._executor is not None:
+            return self
+        self.started_at = time.perf_counter()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="edgeforge-load")
+        for name, factory in self.factories.items():
+            self._futures[name] = self._executor.submit(self._load, name, factory)
+        # Worker threads exit once the queue drains
+        self._executor.shutdown(wait=False)
+        return self
+
+    def _load(self, name, factory):
+        with self._lock:
+            self._status[name]["state"] = LOADING
+        start = time.perf_counter()
+        try:
+            component = factory()
+            if self.on_loaded is not None:
+                self.on_loaded(name, component)
+        except Exception as e:
+            with self._lock:
+                self._status[name].update(state=FAILED, seconds=time.perf_counter() - start, error=repr(e))
+                self._mark_finished()
+            print(f"Failed to load '{name}': {e!r}")
+            raise
+
+        with self._lock:
+            self.components[name] = component
+            self._status[name].update(state=READY, seconds=time.perf_counter() - start)
+            last = self._mark_finished()
+        print(f"Loaded '{name}' in {self._status[name]['seconds']:.2f}s")
+        if last and self.ready:
+            print(f"Factory Ready! 🚀 ({self.finished_at - self.started_at:.1f}s)")
+        return component
+
+    def _mark_finished(self):
+        # Caller holds the lock. True for the component that completes the set.
+        if all(s["state"] in (READY, FAILED) for s in self._status.values()):
+            self.finished_at = time.perf_counter()
+            return True
+        return False
+
+    def wait(self, timeout=None):
+        """
+        Blocks until every component has finished (or failed). Returns self.ready.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for future in self._futures.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            try:
+                future.exception(timeout=remaining)
+            except FutureTimeout:
+                break
+        return self.ready
+
+    def get(self, name):
+        """
+        The loaded component; blocks while it is still loading and re-raises a load error.
+        """
+        return self._futures[name].result()
+
+    @property
+    def ready(self):
+        with self._lock:
+            return bool(self._status) and all(s["state"] == READY for s in self._status.values())
+
+    @property
+    def failed(self):
+        with self._lock:
+            return any(s["state"] == FAILED for s in self._status.values())
+
+    def status(self):
+        """
+        {"state": "loading" | "ready" | "failed", "components": {...}, "elapsed": seconds}
+        """
+        with self._lock:
+            components = {name: dict(s) for name, s in self._status.items()}
+        states = [s["state"] for s in components.values()]
+        if FAILED in states:
+            overall = FAILED
+        elif states and all(state == READY for state in states):
+            overall = READY
+        else:
+            overall = LOADING
+
+        if self.started_at is None:
+            elapsed = None
+        else:
+            elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            "state": overall,
+            "components": components,
+            "loaded": states.count(READY),
+            "total": len(states),
+            "elapsed": elapsed,
+        }
@@ -0,0 +1,90 @@
+from collections import namedtuple
+
+# One decode window. Latent coordinates are used to crop, pixel coordinates to place.
+TileWindow = namedtuple(
+    "TileWindow",
+    ["h_start", "h_end", "w_start", "w_end", "px_h_start", "px_h_end", "px_w_start", "px_w_end"]
+)
+
+class TilePlan:
+    """
+    De-duplicated tiling of a latent grid.
+    Uses the fewest tiles per axis that still keep at least `overlap` latent pixels
+    between neighbours, spread evenly so no two windows collapse onto each other.
+    """
+    def __init__(self, latent_shape, tile_size, overlap, scale_factor=8):
+        if tile_size <= 0:
+            raise ValueError(f"tile_size must be positive, got {tile_size}")
+        if not 0 <= overlap < tile_size:
+            raise ValueError(f"overlap must be in [0, tile_size), got {overlap} for tile_size {tile_size}")
+
+        # Accept (H, W) or a full (B, C, H, W) latent shape
+        self.height, self.width = int(latent_shape[-2]), int(latent_shape[-1])
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.scale_factor = scale_factor
+
+        self.row_starts = self._axis_starts(self.height)
+        self.col_starts = self._axis_starts(self.width)
+
+        self.tiles = []
+        for h_start in self.row_starts:
+            h_end = min(h_start + tile_size, self.height)
+            for w_start in self.col_starts:
+                w_end = min(w_start + tile_size, self.width)
+                self.tiles.append(TileWindow(
+                    h_start, h_end, w_start, w_end,
+                    h_start * scale_factor, h_end * scale_factor,
+                    w_start * scale_factor, w_end * scale_factor,
+                ))
+
+    def _axis_starts(self, dim_size):
+        """
+        Evenly spaced start positions along one axis (always 0 ... dim_size - tile_size).
+        """
+        if dim_size <= self.tile_size:
+            return [0]
+
+        stride = self.tile_size - self.overlap
+        count = -(-(dim_size - self.overlap) // stride)  # ceil division
+        span = dim_size - self.tile_size
+        return [(i * span) // (count - 1) for i in range(count)]
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def __getitem__(self, idx):
+        return self.tiles[idx]
+
+    @property
+    def tile_count(self):
+        return len(self.tiles)
+
+    @property
+    def output_shape(self):
+        """Pixel (H, W) of the decoded image."""
+        return self.height * self.scale_factor, self.width * self.scale_factor
+
+    @property
+    def total_decoded_area(self):
+        """Pixels decoded over all tiles (counts overlaps every time they are decoded)."""
+        return sum((t.px_h_end - t.px_h_start) * (t.px_w_end - t.px_w_start) for t in self.tiles)
+
+    @property
+    def redundancy_ratio(self):
+        """Decoded pixels per output pixel. 1.0 means no overlap at all."""
+        out_h, out_w = self.output_shape
+        return self.total_decoded_area / float(out_h * out_w)
+
+    def tile_shapes(self):
+        """Latent (h, w) of every tile, in plan order."""
+        return [(t.h_end - t.h_start, t.w_end - t.w_start) for t in self.tiles]
+
+    def __repr__(self):
+        return (
+            f"TilePlan({self.height}x{self.width} latent, tile={self.tile_size}, overlap={self.overlap}, "
+            f"tiles={self.tile_count}, redundancy={self.redundancy_ratio:.2f})"
+        )
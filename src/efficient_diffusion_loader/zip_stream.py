@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+import zipfile
+
+# Entries that are already compressed: deflating them only costs CPU
+PRECOMPRESSED = (".png", ".jpg", ".jpeg", ".webp", ".zip", ".gz", ".npz")
+COMPRESSION_MODES = ("stored", "deflated", "auto")
+
+# End-of-archive marker passed to the consumer
+_END = object()
+
+class ArchiveClosed(Exception):
+    """Raised in the producer once the consumer (the HTTP client) has gone away."""
+
+class _QueueWriter:
+    """
+    Write-only, unseekable file object for ZipFile: bytes are grouped into chunks
+    of about chunk_size and handed to the consumer through a bounded queue.
+    """
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.pending = bytearray()
+
+    def write(self, data):
+        self.pending += data
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.stream._consumer_gone.is_set():
+            # Nobody is reading anymore (also keeps ZipFile.__del__ quiet)
+            self.pending = bytearray()
+            return
+        if self.pending:
+            chunk, self.pending = bytes(self.pending), bytearray()
+            self.stream._put(chunk)
+
+class ZipStream:
+    """
+    A ZIP archive produced by one thread and consumed, chunk by chunk, by another.
+
+    The producer calls writestr() / write() like on a ZipFile, then close() (or
+    abort(error)); the consumer iterates the stream, sync or async, e.g.
+    StreamingResponse(zip_stream). Every entry is sent as soon as it is
+    written (local header + data + data descriptor, no seeking back), and the
+    queue holds at most max_chunks chunks, so a slow client stalls the producer
+    instead of piling the archive up in memory.
+
+    compression: "stored", "deflated", or "auto" (store already-compressed files
+    such as PNGs, deflate the rest, e.g. the label .txt files).
+    """
+    def __init__(self, compression="auto", compresslevel=6, chunk_size=1 << 20, max_chunks=8):
+        if compression not in COMPRESSION_MODES:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSION_MODES}")
+        self.compression = compression
+        self.bytes_sent = 0
+        self.entries = 0
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._consumer_gone = threading.Event()
+        self._lock = threading.Lock()
+        self._writer = _QueueWriter(self, chunk_size)
+        # An unseekable file: ZipFile writes sizes and CRCs after each entry's data
+        self._zip = zipfile.ZipFile(
+            self._writer, "w",
+            compression=zipfile.ZIP_STORED if compression == "stored" else zipfile.ZIP_DEFLATED,
+            compresslevel=compresslevel,
+        )
+
+    def _compress_type(self, name):
+        if self.compression == "stored" or (self.compression == "auto" and name.lower().endswith(PRECOMPRESSED)):
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+    def _put(self, item):
+        # Poll, so a producer blocked on a full queue notices a vanished consumer
+        while True:
+            self.check_cancelled()
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def check_cancelled(self):
+        if self._consumer_gone.is_set():
+            raise ArchiveClosed("The archive consumer went away")
+
+    def writestr(self, name, data):
+        """ Same as ZipFile.writestr; the entry is on its way once this returns. """
+        # ZipFile is not thread-safe: entries are written one at a time
+        with self._lock:
+            self._zip.writestr(name, data, compress_type=self._compress_type(name))
+            self._writer.flush()
+            self.entries += 1
+        self.check_cancelled()
+
+    def write(self, filename, arcname=None):
+        """ Adds a file from disk (read in full, one entry at a time). """
+        with open(filename, "rb") as f:
+            data = f.read()
+        self.writestr(arcname or os.path.basename(filename), data)
+
+    def close(self):
+        """ Writes the central directory and ends the stream. """
+        with self._lock:
+            self._zip.close()
+            self._writer.flush()
+        self._put(_END)
+
+    def abort(self, error):
+        """ Ends the stream with an error: the consumer raises it (the download is cut short). """
+        if not self._consumer_gone.is_set():
+            try:
+                self._put(error)
+            except ArchiveClosed:
+                pass
+
+    def _next_chunk(self, timeout=None):
+        """ The next chunk, None at the end (or on timeout with timeout set). """
+        try:
+            chunk = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None, False
+        if chunk is _END:
+            return None, True
+        if isinstance(chunk, BaseException):
+            raise chunk
+        self.bytes_sent += len(chunk)
+        return chunk, False
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk, done = self._next_chunk()
+                if done:
+                    return
+                yield chunk
+        finally:
+            # Normal end, error, or the consumer stopped iterating
+            self._consumer_gone.set()
+
+    async def __aiter__(self):
+        # The server cancels this generator when the client disconnects: the finally
+        # runs right away and the producer stops at its next write
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # Short timeouts: no executor thread stays parked on an abandoned queue
+                chunk, done = await loop.run_in_executor(None, self._next_chunk, 0.1)
+                if done:
+                    return
+                if chunk is not None:
+                    yield chunk
+        finally:
+            self._consumer_gone.set()
+
+    def produce(self, fn, *args, **kwargs):
+        """
+        Runs fn(self, *args, **kwargs) in a background thread, then close()s the
+        archive (or abort()s it with fn's exception). Returns self, ready to iterate.
+        """
+        def run():
+            try:
+                fn(self, *args, **kwargs)
+                self.close()
+            except ArchiveClosed:
+                print("Archive stream: client disconnected, stopped producing")
+            except Exception as e:
+                print(f"Archive stream failed: {e!r}")
+                self.abort(e)
+
+        # Runs in a copy of the caller's context (e.g. its request timing)
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), name="zip-stream", daemon=True).start()
+        return self
@@ -0,0 +1,89 @@
+"""
+EdgeForge AI: /generate dynamic batching check (stub components, no GPU).
+
+Fires concurrent /generate requests at the app with a stub pipeline whose
+generate_many() costs one fixed diffusion pass per call (plus a decode per
+sample) and records the batch size of every call. Checks that:
+
+  - concurrent requests were merged (mean batch size > 1, never above the maximum)
+  - every response carries its own request's image (the stub color encodes the prompt)
+  - batched wall time beats running the same requests one at a time (max batch 1)
+
+and prints the batcher's queue-wait / batch-size histograms from /generate/stats.
+
+    python tests/batcher_benchmark.py
+    python tests/batcher_benchmark.py --requests 32 --max-batch 8 --wait-ms 50
+"""
+import io
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from harness import StubForge, argument_parser, control_png, finish, install_components, serve
+
+def run(server, requests, max_batch, wait_ms, diffusion, decode):
+    import efficient_diffusion_loader as edl
+
+    forge = StubForge(diffusion, decode)
+    install_components(server, forge_pipeline=forge)
+    server.generate_batcher = edl.DynamicBatcher(
+        server._generate_batched, max_batch_size=max_batch, max_wait=wait_ms / 1000, name="generate-batcher"
+    )
+    files = {"control_image": ("edges.png", control_png(), "image/png")}
+    intents = [f"car number {i}" for i in range(requests)]
+
+    with serve(server) as client:
+
+        def call(intent):
+            response = client.post("/generate", data={"intent": intent}, files=files)
+            assert response.status_code == 200, response.text
+            archive = zipfile.ZipFile(io.BytesIO(response.content))
+            pixel = Image.open(io.BytesIO(archive.read("generated_image.png"))).getpixel((0, 0))
+            return pixel[0] == sum(map(ord, intent)) % 256
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=requests) as pool:
+            matched = list(pool.map(call, intents))
+        seconds = time.perf_counter() - start
+        stats = client.get("/generate/stats").json()
+    return {"seconds": seconds, "matched": all(matched), "batch_sizes": forge.batch_sizes, "stats": stats}
+
+def main():
+    parser = argument_parser("Dynamic /generate batching check with a stub pipeline", "bench_batcher.json")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--max-batch", type=int, default=4)
+    parser.add_argument("--wait-ms", type=float, default=25)
+    parser.add_argument("--diffusion", type=float, default=0.2, help="Seconds per stub diffusion call")
+    parser.add_argument("--decode", type=float, default=0.01, help="Seconds per stub decoded image")
+    args = parser.parse_args()
+
+    from app import main as server
+
+    print("--- EdgeForge AI: /generate Dynamic Batching Check ---")
+    single = run(server, args.requests, 1, 0, args.diffusion, args.decode)
+    batched = run(server, args.requests, args.max_batch, args.wait_ms, args.diffusion, args.decode)
+
+    sizes = batched["batch_sizes"]
+    waits = batched["stats"]["queue_wait_seconds"]
+    print(f"Unbatched: {args.requests} requests in {single['seconds']:.2f}s, {len(single['batch_sizes'])} diffusion calls")
+    print(f"Batched:   {args.requests} requests in {batched['seconds']:.2f}s, {len(sizes)} diffusion calls, "
+          f"sizes {sizes}")
+    print(f"Batch size histogram: {batched['stats']['batch_size']['buckets']}")
+    print(f"Queue wait: mean {waits['mean'] * 1000:.1f}ms, max {waits['max'] * 1000:.1f}ms, buckets "
+          f"{ {k: v for k, v in waits['buckets'].items() if v} }")
+
+    failures = []
+    if sum(sizes) != args.requests or max(sizes) > args.max_batch:
+        failures.append(f"batch sizes {sizes} don't add up to {args.requests} within max {args.max_batch}")
+    if sum(sizes) / len(sizes) <= 1:
+        failures.append("no requests were merged")
+    if not (batched["matched"] and single["matched"]):
+        failures.append("a response carried another request's image")
+    if batched["seconds"] >= single["seconds"]:
+        failures.append("batching was not faster than one request at a time")
+    finish(args.output, {"args": vars(args), "unbatched": single, "batched": batched}, failures,
+           f"PASS: {single['seconds'] / batched['seconds']:.2f}x faster, mean batch {sum(sizes) / len(sizes):.1f}")
+
+if __name__ == "__main__":
+    main()
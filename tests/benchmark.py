@@ -3,10 +3,17 @@ import gc
 from diffusers import AutoencoderKL
 from PIL import Image
 import numpy as np
+import os
+import sys
 import time
 
+# Run straight from a checkout: harness puts src/ on sys.path
+from harness import HERE, PeakRSSSampler, build_vae
+from efficient_diffusion_loader.tiled_vae import TiledVAEWrapper 
 
-from tiled_vae import TiledVAEWrapper 
+# The original wrapper at the repository root, measured as the baseline
+sys.path.insert(0, os.path.join(HERE, ".."))
+from TiledVAEWrapper import TiledVAEWrapper as LegacyTiledVAEWrapper
 
 
 
@@ -27,49 +34,109 @@ def measure_vram(func, *args, **kwargs):
     
     return result, used_mem / (1024**3), end_time - start_time # Returns GB
 
-def run_benchmark():
-    print("--- EdgeForge AI: Module 4 Benchmark ---")
+def measure_peak(device, func, *args, **kwargs):
+    """
+    Runs func once and measures it the same way for every path:
+    peak RAM added (sampled RSS) and, on CUDA, peak VRAM added.
+    """
+    with PeakRSSSampler() as rss:
+        if device == "cuda":
+            result, vram_usage, duration = measure_vram(func, *args, **kwargs)
+        else:
+            start_time = time.time()
+            result = func(*args, **kwargs)
+            vram_usage, duration = None, time.time() - start_time
+    return result, vram_usage, rss.added_gb, duration
+
+def report(name, vram_usage, ram_usage, duration):
+    vram = f", Peak VRAM Added: {vram_usage:.2f} GB" if vram_usage is not None else ""
+    print(f"{name}: {duration:.2f} seconds, Peak RAM Added: {ram_usage:.2f} GB{vram}")
+
+def compare(what, value, legacy):
+    print(f"{what} vs. legacy: {value:.2f} GB vs. {legacy:.2f} GB ({100 * (value / legacy - 1):+.0f}%)")
+
+def run_benchmark(device):
+    print(f"--- EdgeForge AI: Module 4 Benchmark ({device}) ---")
     
     # 1. Setup: Load a standard SDXL VAE
-    print("Loading VAE model (SDXL)...")
-    model_id = "stabilityai/sdxl-vae"
-    try:
-        vae = AutoencoderKL.from_pretrained(model_id, torch_dtype=torch.float16).to("cuda")
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        print("Please ensure you have internet access or the model cached.")
-        return
+    # No GPU: a tiny random VAE with the same 8x scale factor (no download), at 2K
+    if device == "cuda":
+        print("Loading VAE model (SDXL)...")
+        model_id = "stabilityai/sdxl-vae"
+        try:
+            vae = AutoencoderKL.from_pretrained(model_id, torch_dtype=torch.float16).to("cuda")
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            print("Please ensure you have internet access or the model cached.")
+            return
+        dtype, target_res = torch.float16, 4096
+    else:
+        print("No GPU: using a tiny random VAE (same 8x scale factor) on the CPU...")
+        vae, dtype, target_res = build_vae(), torch.float32, 2048
 
     # 2. Simulate a Massive Image (4K Resolution)
     # 4096 x 4096 pixels -> Latents are 1/8th size -> 512 x 512
     # Batch size 1, 4 channels (standard for SDXL)
-    target_res = 4096
     latent_res = target_res // 8
     print(f"Simulating Generation of {target_res}x{target_res} image...")
     
     # Create random noise latents (simulating the output of the Diffusion Unet)
-    latents = torch.randn((1, 4, latent_res, latent_res), dtype=torch.float16).to("cuda")
+    latents = torch.randn((1, 4, latent_res, latent_res), dtype=dtype).to(device)
     
     # 3. Test 1: Standard Decode (DANGEROUS - Might OOM)
     # We will skip the actual run to save your GPU, but theoretically calculate it.
     # A 4K float16 tensor takes ~250MB. But the intermediate states in VAE attention 
     # blocks can balloon to 20GB+.
     print(f"\n[Theoretical] Standard Decode estimate: >24 GB VRAM required.")
-    
-    # 4. Test 2: EdgeForge Tiled Decode
+
+    # 4. Test 2: Legacy Tiled Decode (the root TiledVAEWrapper.py: 3-channel weight
+    # buffer, one tile per decode call, out-of-place divide)
+    print(f"\n[Actual] Running Legacy Tiled Decode...")
+    legacy_wrapper = LegacyTiledVAEWrapper(vae, tile_size=512, overlap=32)
+    with torch.no_grad():
+        legacy_image, legacy_vram, legacy_ram, legacy_duration = measure_peak(device, legacy_wrapper.decode_with_blending, latents)
+    del legacy_image
+    gc.collect()
+    report("Legacy", legacy_vram, legacy_ram, legacy_duration)
+
+    # 5. Test 3: EdgeForge Tiled Decode
     print(f"\n[Actual] Running Tiled Decode...")
     
-    # Initialize your wrapper
+    # Initialize your wrapper (tile batch is auto-sized from free VRAM)
     tiled_wrapper = TiledVAEWrapper(vae, tile_size=512, overlap=32)
     
     # Run and measure
-    decoded_image, vram_usage, duration = measure_vram(tiled_wrapper.decode_with_blending, latents)
+    with torch.no_grad():
+        decoded_image, vram_usage, ram_usage, duration = measure_peak(device, tiled_wrapper.decode_with_blending, latents)
     
     print(f"Success!")
-    print(f"Time Taken: {duration:.2f} seconds")
-    print(f"Peak VRAM Added: {vram_usage:.2f} GB")
+    report("EdgeForge", vram_usage, ram_usage, duration)
+    stats = tiled_wrapper.last_decode_stats
+    print(f"Tiles: {stats['tiles']} in {stats['decode_calls']} decode calls ({stats['tile_batch_size']} tiles/batch)")
+    print(f"Host buffers: {stats['host_buffer_bytes'] / 1024**3:.2f} GB")
+    compare("Peak RAM", ram_usage, legacy_ram)
+    if vram_usage is not None:
+        compare("Peak VRAM", vram_usage, legacy_vram)
+
+    # One tile per decode call, like the legacy loop: isolates the host buffer layout
+    # from tile batching (on the CPU the batched activations count towards RSS too)
+    single_wrapper = TiledVAEWrapper(vae, tile_size=512, overlap=32, tile_batch_size=1)
+    with torch.no_grad():
+        _, single_vram, single_ram, single_duration = measure_peak(device, single_wrapper.decode_with_blending, latents)
+    report("EdgeForge, 1 tile/call", single_vram, single_ram, single_duration)
+    compare("Peak RAM", single_ram, legacy_ram)
+    if single_vram is not None:
+        compare("Peak VRAM", single_vram, legacy_vram)
+
+    # Analytic normalization skips the weight map entirely
+    analytic_wrapper = TiledVAEWrapper(vae, tile_size=512, overlap=32, normalization="analytic")
+    with torch.no_grad():
+        _, analytic_vram, analytic_ram, analytic_duration = measure_peak(device, analytic_wrapper.decode_with_blending, latents)
+    analytic_bytes = analytic_wrapper.last_decode_stats["host_buffer_bytes"]
+    print(f"Analytic normalization: host buffers {analytic_bytes / 1024**3:.2f} GB")
+    report("Analytic", analytic_vram, analytic_ram, analytic_duration)
     
-    # 5. Verification: Save the output
+    # 6. Verification: Save the output
     print("\nSaving debug image...")
     # Convert from [-1, 1] range to [0, 255] uint8
     decoded_image = (decoded_image / 2 + 0.5).clamp(0, 1)
@@ -81,7 +148,4 @@ def run_benchmark():
     print("Saved to 'benchmark_4k_output.png'. Check this file for grid seams.")
 
 if __name__ == "__main__":
-    if torch.cuda.is_available():
-        run_benchmark()
-    else:
-        print("Benchmarks require a GPU (CUDA).")
\ No newline at end of file
+    run_benchmark("cuda" if torch.cuda.is_available() else "cpu")
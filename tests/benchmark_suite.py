@@ -0,0 +1,142 @@
+"""
+EdgeForge AI: Tiled VAE benchmark suite (runs offline, CPU or GPU).
+
+Builds a small randomly initialised AutoencoderKL, sweeps resolution / tile size /
+overlap / tile batch / queue depth and writes one JSON record per configuration, so two commits
+can be compared with a plain diff.
+
+    python tests/benchmark_suite.py --output bench_vae.json
+    python tests/benchmark_suite.py --resolutions 512 1024 --tile-sizes 256 --tile-batches 1 8
+    python tests/benchmark_suite.py --resolutions 1024 --tile-sizes 256 --queue-depths 0 1 2 4
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import time
+
+from harness import PeakRSSSampler, build_vae
+
+import torch
+
+from efficient_diffusion_loader.tiled_vae import TiledVAEWrapper
+
+def seam_errors(tiled, reference, plan):
+    """
+    Error of the tiled decode against an untiled decode, over the whole image and
+    over the overlap bands only (where seams would show).
+    """
+    out_h, out_w = plan.output_shape
+    coverage = torch.zeros((out_h, out_w))
+    for tile in plan:
+        coverage[tile.px_h_start:tile.px_h_end, tile.px_w_start:tile.px_w_end] += 1
+    seam = coverage > 1
+
+    error = (tiled - reference).abs().mean(dim=(0, 1))  # (H, W), averaged over batch and channels
+    return {
+        "mae": error.mean().item(),
+        "max_abs_error": (tiled - reference).abs().max().item(),
+        "seam_mae": error[seam].mean().item() if seam.any() else 0.0,
+        "interior_mae": error[~seam].mean().item() if (~seam).any() else 0.0,
+    }
+
+def run_case(vae, resolution, tile_size, overlap, tile_batch, queue_depth, repeats, device):
+    latent_res = resolution // 8
+    generator = torch.Generator().manual_seed(resolution)
+    latents = torch.randn((1, 4, latent_res, latent_res), generator=generator).to(device)
+
+    wrapper = TiledVAEWrapper(vae, tile_size=tile_size, overlap=overlap, tile_batch_size=tile_batch, queue_depth=queue_depth)
+
+    timings = []
+    peak_rss_gb = 0.0
+    for _ in range(repeats):
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        with PeakRSSSampler() as rss:
+            start = time.perf_counter()
+            tiled = wrapper.decode_with_blending(latents)
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            timings.append(time.perf_counter() - start)
+        peak_rss_gb = max(peak_rss_gb, rss.added_gb)
+
+    stats = wrapper.last_decode_stats
+    with torch.no_grad():
+        reference = vae.decode(latents.float()).sample.cpu()
+
+    seconds = min(timings)
+    record = {
+        "resolution": resolution,
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "tile_batch_size": stats["tile_batch_size"],
+        "queue_depth": queue_depth,
+        "tiles": stats["tiles"],
+        "decode_calls": stats["decode_calls"],
+        "redundancy_ratio": round(stats["redundancy_ratio"], 4),
+        "seconds": round(seconds, 4),
+        "tiles_per_sec": round(stats["tiles"] / seconds, 3),
+        "megapixels_per_sec": round(resolution * resolution / 1e6 / seconds, 3),
+        "peak_rss_gb": round(peak_rss_gb, 4),
+        "peak_device_gb": round(stats["peak_device_bytes"] / 1024**3, 4) if stats.get("peak_device_bytes") else None,
+    }
+    record.update({k: round(v, 6) for k, v in seam_errors(tiled, reference, wrapper.plan_tiles(latents.shape)).items()})
+    return record
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled VAE decode benchmark sweep")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--tile-sizes", type=int, nargs="+", default=[128, 256])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--tile-batches", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--queue-depths", type=int, nargs="+", default=[0, 2],
+                        help="Tiles in flight to the host copy thread (0 = serial loop)")
+    parser.add_argument("--vae-width", type=int, default=32, help="Channels per VAE block")
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--output", default="bench_vae.json")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    vae = build_vae(args.vae_width, device)
+    print(f"--- EdgeForge AI: Tiled VAE Benchmark Suite ({device}) ---")
+
+    results = []
+    for resolution, tile_size, overlap, tile_batch, queue_depth in itertools.product(
+        args.resolutions, args.tile_sizes, args.overlaps, args.tile_batches, args.queue_depths
+    ):
+        if overlap >= tile_size or tile_size % 8 or overlap % 8:
+            continue
+        record = run_case(vae, resolution, tile_size, overlap, tile_batch, queue_depth, args.repeats, device)
+        results.append(record)
+        print(
+            f"{resolution}px tile={tile_size} overlap={overlap} batch={tile_batch} queue={queue_depth}: "
+            f"{record['tiles_per_sec']} tiles/s, {record['megapixels_per_sec']} MP/s, "
+            f"seam MAE {record['seam_mae']:.2e}"
+        )
+
+    report = {
+        "revision": git_revision(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "device": str(device),
+        "vae_width": args.vae_width,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {len(results)} results to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+EdgeForge AI: CPU process pool benchmark (no models, runs anywhere).
+
+Runs the CPU-bound steps of a batch (layout remixing of a 1024x1024 edge map,
+Canny edge maps of uploads) inline and on CPUExecutor pools of 1..nproc workers,
+and reports:
+
+  - layouts/s and edge maps/s per worker count (workers=0 is inline)
+  - what crosses the process boundary: shared memory names vs. pickled arrays
+  - that seeded layouts are identical inline and on the pool
+  - that no shared memory block outlives its batch (also after close() mid-batch)
+
+then checks /generate_batch end to end with a stub pipeline on a pool.
+
+    python tests/cpu_pool_benchmark.py
+    python tests/cpu_pool_benchmark.py --layouts 64 --workers 0 1 2 4 8
+"""
+import io
+import json
+import os
+import pickle
+import time
+import zipfile
+
+from harness import StubForge, argument_parser, control_png, finish, install_components, serve
+
+import numpy as np
+from PIL import Image
+
+from efficient_diffusion_loader.cpu_pool import CPUExecutor, SharedArray
+from efficient_diffusion_loader.layout_engine import LayoutAugmenter
+from efficient_diffusion_loader.preprocessing import canny_edge_map, load_rgb
+
+def shm_blocks():
+    """ Shared memory blocks currently alive (Linux: /dev/shm) """
+    try:
+        return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+    except FileNotFoundError:
+        return set()
+
+def upload(size, seed):
+    """ A photo-ish upload: blurred blobs with edges for Canny to find """
+    rng = np.random.default_rng(seed)
+    small = Image.fromarray(rng.integers(0, 256, (24, 24, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    small.resize((size, size), Image.BICUBIC).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def bench_workers(count, base_edges, seeds, uploads):
+    engine = LayoutAugmenter()
+    executor = CPUExecutor(workers=count).warm_up()
+    try:
+        start = time.perf_counter()
+        layouts = executor.augment_many(engine, base_edges, seeds)
+        results = [np.asarray(layouts.get(i)) for i in range(len(layouts))]
+        layouts.close()
+        layout_rate = len(seeds) / (time.perf_counter() - start)
+
+        # Uploads one after another, as requests arrive (the cache sits in front of this)
+        start = time.perf_counter()
+        edges = [np.asarray(executor.canny_edge_map(data)) for data in uploads]
+        canny_rate = len(uploads) / (time.perf_counter() - start)
+    finally:
+        executor.shutdown()
+    return results, edges, layout_rate, canny_rate
+
+def check_close(base_edges, workers):
+    """ close() before every layout was claimed: nothing may leak """
+    executor = CPUExecutor(workers=workers)
+    layouts = executor.augment_many(LayoutAugmenter(), base_edges, range(16))
+    layouts.get(0)
+    layouts.close()
+    executor.shutdown()
+
+def check_endpoint(workers, batch_size):
+    from app import main as server
+
+    server.CPU_WORKERS = workers
+    install_components(server, forge_pipeline=StubForge(0.0, 0.0, size=128, noise=True), layout_engine=LayoutAugmenter())
+    files = {"control_image": ("edges.png", control_png(), "image/png")}
+    failures = []
+    with serve(server) as client:
+        response = client.post("/generate_batch", data={"intent": "a car", "batch_size": batch_size}, files=files)
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        images = [name for name in archive.namelist() if name.startswith("images/")]
+        layout = json.loads(archive.read("timing.json"))["stages"].get("layout", {})
+        print(f"/generate_batch on {workers} workers: {len(images)} images, layout {layout}")
+        if len(images) != batch_size or layout.get("calls") != batch_size:
+            failures.append(f"/generate_batch with {workers} workers: {len(images)} images, layout {layout}")
+    server.cpu_executor.shutdown()
+    server.cpu_executor = None
+    return failures
+
+def main():
+    nproc = os.cpu_count() or 1
+    parser = argument_parser("CPU process pool benchmark", "bench_cpu_pool.json")
+    parser.add_argument("--layouts", type=int, default=32)
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--workers", nargs="+", type=int, default=list(range(0, nproc + 1)))
+    args = parser.parse_args()
+
+    print(f"--- EdgeForge AI: CPU Pool Benchmark ({nproc} CPUs) ---")
+    before = shm_blocks()
+    base_edges = canny_edge_map(load_rgb(upload(args.size, 0)), args.size, 100, 200)
+    uploads = [upload(args.size, seed) for seed in range(1, args.uploads + 1)]
+    seeds = list(range(1000, 1000 + args.layouts))
+
+    # What one layout task would cost to ship back and forth as a pickled array
+    array_bytes = len(pickle.dumps(np.asarray(base_edges)))
+    shared = SharedArray.copy_of(np.asarray(base_edges))
+    handle_bytes = len(pickle.dumps(shared))
+    shared.unlink()
+    print(f"Per array: pickled {array_bytes / 1024**2:.2f} MB vs. shared memory handle {handle_bytes} bytes")
+
+    results, failures = {}, []
+    reference = None
+    print(f"{'workers':>7} {'layouts/s':>10} {'speedup':>8} {'canny/s':>8}")
+    for count in args.workers:
+        layouts, edges, layout_rate, canny_rate = bench_workers(count, base_edges, seeds, uploads)
+        if reference is None:
+            reference = (layouts, edges, layout_rate)
+        elif not all(np.array_equal(a, b) for a, b in zip(layouts + edges, reference[0] + reference[1])):
+            failures.append(f"{count} workers: layouts or edge maps differ from workers={args.workers[0]}")
+        speedup = layout_rate / reference[2]
+        results[count] = {"layouts_per_sec": layout_rate, "speedup": speedup, "canny_per_sec": canny_rate}
+        print(f"{count:>7} {layout_rate:10.1f} {speedup:7.2f}x {canny_rate:8.1f}")
+
+    pooled = max(1, max(args.workers))
+    check_close(base_edges, pooled)
+    failures += check_endpoint(pooled, batch_size=6)
+
+    leaked = shm_blocks() - before
+    if leaked:
+        failures.append(f"{len(leaked)} shared memory blocks leaked: {sorted(leaked)[:4]}")
+
+    finish(args.output, {"args": vars(args), "nproc": nproc, "pickled_bytes": array_bytes,
+                         "handle_bytes": handle_bytes, "results": results}, failures)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+EdgeForge AI: image encoding benchmark (no models, runs anywhere).
+
+Encodes 1024x1024 images (synthetic photo-like content, or crops of a render with
+--source) in every output format and reports, per format:
+
+  - encode time per image (one thread) and bytes per image vs. raw RGB
+  - throughput of the ImageEncoder thread pool at 1..N workers
+  - round trip: lossless formats decode to the exact pixels, JPEG reports its PSNR
+
+then checks /generate_batch end to end with a stub pipeline: the images use the
+requested format's extension, manifest.json records the format, bad specs get a 400.
+
+    python tests/encode_benchmark.py
+    python tests/encode_benchmark.py --images 16 --workers 1 2 4 8 --formats png:1 png:6 jpeg:90
+"""
+import io
+import json
+import os
+import time
+import zipfile
+
+from harness import StubForge, argument_parser, control_png, finish, install_components, serve
+
+import numpy as np
+from PIL import Image
+
+from efficient_diffusion_loader.image_format import ImageEncoder, ImageFormat
+
+DEFAULT_FORMATS = ["png:1", "png:6", "png:9", "webp:0", "webp:4", "jpeg:90", "jpeg:95", "npy"]
+
+def load_images(count, size, source=None):
+    """
+    count distinct size x size images: crops of a render if source is given, else
+    synthetic photo-like content (smooth shapes + detail + sensor noise). Flat or
+    pure-noise images would make every codec look far better or worse than on renders.
+    """
+    if source is not None:
+        render = Image.open(source).convert("RGB")
+        cols, rows = max(1, render.width // size), max(1, render.height // size)
+        return [render.crop(((i % cols) * size, (i // cols % rows) * size,
+                             (i % cols + 1) * size, (i // cols % rows + 1) * size)) for i in range(count)]
+
+    images = []
+    for i in range(count):
+        rng = np.random.default_rng(i)
+        pixels = np.zeros((size, size, 3))
+        for cells, weight in ((8, 160.0), (64, 50.0), (256, 20.0)):
+            layer = Image.fromarray(rng.integers(0, 256, (cells, cells, 3), dtype=np.uint8)).resize((size, size), Image.BICUBIC)
+            pixels += (np.asarray(layer, dtype=np.float64) - 128) * weight / 128
+        pixels += 128 + rng.normal(0, 3, pixels.shape)
+        images.append(Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)))
+    return images
+
+def psnr(a, b):
+    mse = np.mean((np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def bench_format(spec, images, workers):
+    image_format = ImageFormat.parse(spec)
+    raw_bytes = images[0].width * images[0].height * 3
+
+    start = time.perf_counter()
+    encoded = [image_format.encode(image) for image in images]
+    serial = (time.perf_counter() - start) / len(images)
+
+    decoded = [ImageFormat.decode(data, image_format.name).convert("RGB") for data in encoded]
+    if image_format.lossless:
+        exact = all(np.array_equal(np.asarray(a), np.asarray(b)) for a, b in zip(images, decoded))
+        quality = None
+    else:
+        exact = None
+        quality = min(psnr(a, b) for a, b in zip(images, decoded))
+
+    pool = {}
+    for count in workers:
+        encoder = ImageEncoder(workers=count)
+        start = time.perf_counter()
+        pooled = encoder.map(images, image_format)
+        pool[count] = len(images) / (time.perf_counter() - start)
+        encoder.shutdown()
+        if pooled != encoded:
+            exact = False  # Same bytes, same order as the serial encode
+
+    size = sum(map(len, encoded)) / len(encoded)
+    return {
+        "format": str(image_format), "describe": image_format.describe(),
+        "encode_ms": serial * 1000, "bytes": size, "ratio": raw_bytes / size,
+        "images_per_sec": pool, "lossless_exact": exact, "min_psnr": quality,
+    }
+
+def check_endpoint(formats):
+    from app import main as server
+
+    install_components(server, forge_pipeline=StubForge(0.0, 0.0, size=128, noise=True))
+    files = {"control_image": ("edges.png", control_png(), "image/png")}
+    failures = []
+    with serve(server) as client:
+        for spec in formats:
+            image_format = ImageFormat.parse(spec)
+            response = client.post("/generate_batch", data={"intent": "a car", "batch_size": 3, "image_format": spec}, files=files)
+            archive = zipfile.ZipFile(io.BytesIO(response.content))
+            manifest = json.loads(archive.read("manifest.json"))
+            images = [item["image"] for item in manifest["items"]]
+            if manifest["image_format"] != image_format.describe() or len(images) != 3:
+                failures.append(f"{spec}: manifest {manifest['image_format']}")
+            if not all(name.endswith(image_format.extension) and name in archive.namelist() for name in images):
+                failures.append(f"{spec}: archive images {images}")
+            ImageFormat.decode(archive.read(images[0]), images[0]).load()
+
+            response = client.post("/generate", data={"intent": "a car", "image_format": spec}, files=files)
+            names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+            if f"generated_image{image_format.extension}" not in names:
+                failures.append(f"{spec}: /generate returned {names}")
+        for bad in ("gif", "png:12", "jpeg:0", "npy:3"):
+            status = client.post("/generate_batch", data={"intent": "a car", "image_format": bad}, files=files).status_code
+            if status != 400:
+                failures.append(f"image_format={bad} returned {status}, expected 400")
+    return failures
+
+def main():
+    parser = argument_parser("Image encoding benchmark", "bench_encode.json")
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--formats", nargs="+", default=DEFAULT_FORMATS)
+    parser.add_argument("--workers", nargs="+", type=int, default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--source", default=None, help="Crop the images from this render instead")
+    args = parser.parse_args()
+
+    print(f"--- EdgeForge AI: Image Encoding Benchmark ({args.images} x {args.size}², {os.cpu_count()} CPUs) ---")
+    images = load_images(args.images, args.size, args.source)
+    raw_mb = args.size * args.size * 3 / 1024**2
+    print(f"{'format':>8} {'ms/img':>8} {'MB/img':>7} {'ratio':>6}  {'images/s by workers':<28} round trip")
+    results, failures = [], []
+    for spec in args.formats:
+        result = bench_format(spec, images, args.workers)
+        results.append(result)
+        pool = " ".join(f"{w}:{rate:.1f}" for w, rate in result["images_per_sec"].items())
+        check = "exact" if result["lossless_exact"] else (
+            f"PSNR {result['min_psnr']:.1f} dB" if result["min_psnr"] is not None else "MISMATCH")
+        print(f"{spec:>8} {result['encode_ms']:8.1f} {result['bytes'] / 1024**2:7.2f} {result['ratio']:6.2f}  {pool:<28} {check}")
+        if result["lossless_exact"] is False:
+            failures.append(f"{spec}: lossless round trip or pooled encode differs")
+    print(f"(raw RGB: {raw_mb:.2f} MB/img)")
+
+    failures += check_endpoint(args.formats)
+
+    finish(args.output, {"args": vars(args), "results": results}, failures)
+
+if __name__ == "__main__":
+    main()
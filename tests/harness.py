@@ -0,0 +1,269 @@
+"""
+EdgeForge AI: shared pieces of the tests/ scripts (benchmarks and pytest tests).
+
+  - src/ and tests/ go on sys.path, so everything runs straight from a checkout
+  - stub components with known costs, for checks of the API plumbing only
+  - tiny randomly initialised models (a VAE, a full SDXL + ControlNet pipeline),
+    offline and CPU-sized, for checks that must run the real stage code
+  - the app with injected components, and the common --output / PASS / FAIL ending
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+for path in (SRC, HERE):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from PIL import Image
+
+# --- STUB COMPONENTS ---
+# Known, configurable costs: for the API / scheduling checks, not for stage timings
+
+class StubForge:
+    def __init__(self, diffusion, decode, size=64, noise=False):
+        self.diffusion = diffusion
+        self.decode = decode
+        self.size = size
+        self.noise = noise  # random pixels: PNGs as incompressible as real renders
+        self.load_times = {}
+        self.batch_sizes = []  # one entry per generate_many call
+
+    def preprocess_canny(self, image_bytes, executor=None):
+        return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+    def denoise_many(self, prompts, control_images, seeds):
+        time.sleep(self.diffusion)
+        return [seed for seed in seeds]
+
+    def decode_latents(self, latents):
+        time.sleep(self.decode)
+        if self.noise:
+            return Image.frombytes("RGB", (self.size, self.size), os.urandom(self.size * self.size * 3))
+        return Image.new("RGB", (self.size, self.size), (latents % 256, 0, 0))
+
+    def generate_many(self, prompts, control_images, seeds, micro_batch=2, latents_dir=None):
+        # One diffusion pass per call, one decode per sample; the color encodes the prompt
+        self.batch_sizes.append(len(prompts))
+        time.sleep(self.diffusion)
+        time.sleep(self.decode * len(prompts))
+        return [Image.new("RGB", (self.size, self.size), (sum(map(ord, p)) % 256, 0, 0)) for p in prompts]
+
+    def fingerprint(self):
+        return {"stub": True, "size": self.size}
+
+    def latent_metadata(self, prompt, seed, control_image):
+        return {"prompt": prompt, "seed": seed}
+
+class StubDirector:
+    def expand(self, intent, seed=None):
+        return {"prompt": intent, "constraints": {}}
+
+    def fingerprint(self):
+        return "stub"
+
+    def generate_variations(self, intent, count):
+        return [{"prompt": f"{intent} #{i}", "seed": i, "constraints": None} for i in range(count)]
+
+class StubLayout:
+    def augment(self, base_edges, max_objects=3, seed=None):
+        return base_edges
+
+class StubLabeler:
+    def label_image(self, image):
+        return "0 0.5 0.5 0.1 0.1"
+
+def control_png(size=64):
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), (255, 255, 255)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def layout_png(size=256, seed=0):
+    """ A white box outline on black: something for Canny, the remixer and the ControlNet """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    pixels = np.zeros((size, size, 3), dtype=np.uint8)
+    top, left = rng.integers(size // 8, size // 3, 2)
+    pixels[top:size - top, left:size - left] = 255
+    pixels[top + 4:size - top - 4, left + 4:size - left - 4] = 0
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+# --- TINY REAL MODELS ---
+
+def build_vae(width=32, device="cpu", seed=0):
+    """
+    4 down/up blocks = the same 8x scale factor as the SDXL VAE, just narrow.
+    """
+    import torch
+    from diffusers import AutoencoderKL
+    torch.manual_seed(seed)
+    vae = AutoencoderKL(
+        in_channels=3,
+        out_channels=3,
+        down_block_types=("DownEncoderBlock2D",) * 4,
+        up_block_types=("UpDecoderBlock2D",) * 4,
+        block_out_channels=(width,) * 4,
+        layers_per_block=1,
+        latent_channels=4,
+        norm_num_groups=min(32, width),
+    )
+    return vae.to(device).eval()
+
+def _byte_level_tokenizer(directory):
+    """
+    CLIPTokenizer over single bytes (no merges): real tokenization, no download.
+    """
+    from transformers import CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    chars = list(bytes_to_unicode().values())
+    vocab = {"<|startoftext|>": 0, "!": 1, "<|endoftext|>": 2}
+    for token in chars + [c + "</w>" for c in chars]:
+        vocab.setdefault(token, len(vocab))
+    vocab_file, merges_file = os.path.join(directory, "vocab.json"), os.path.join(directory, "merges.txt")
+    with open(vocab_file, "w") as f:
+        json.dump(vocab, f)
+    with open(merges_file, "w") as f:
+        f.write("#version: 0.2\n")
+    return CLIPTokenizer(vocab_file, merges_file, model_max_length=77)
+
+def build_tiny_sdxl(seed=0, vae_width=32):
+    """
+    StableDiffusionXLControlNetPipeline with randomly initialised, CPU-sized UNet,
+    ControlNet, text encoders and VAE (same block layout as the real models).
+    """
+    import torch
+    from diffusers import ControlNetModel, EulerDiscreteScheduler, StableDiffusionXLControlNetPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel, CLIPTextModelWithProjection
+
+    torch.manual_seed(seed)
+    blocks = dict(
+        block_out_channels=(32, 64), layers_per_block=2, down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        attention_head_dim=(2, 4), use_linear_projection=True, addition_embed_type="text_time",
+        addition_time_embed_dim=8, transformer_layers_per_block=(1, 2),
+        projection_class_embeddings_input_dim=80, cross_attention_dim=64,  # 6 * 8 + 32, 32 + 32
+    )
+    unet = UNet2DConditionModel(sample_size=32, in_channels=4, out_channels=4,
+                                up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"), **blocks)
+    controlnet = ControlNetModel(in_channels=4, conditioning_embedding_out_channels=(16, 16, 32, 32), **blocks)
+    text_config = CLIPTextConfig(
+        bos_token_id=0, eos_token_id=2, pad_token_id=1, vocab_size=1000, hidden_size=32, intermediate_size=37,
+        num_attention_heads=4, num_hidden_layers=5, layer_norm_eps=1e-05, hidden_act="gelu", projection_dim=32,
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        tokenizer = _byte_level_tokenizer(directory)
+    scheduler = EulerDiscreteScheduler(beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear",
+                                       steps_offset=1, timestep_spacing="leading")
+    pipe = StableDiffusionXLControlNetPipeline(
+        vae=build_vae(vae_width, seed=seed), text_encoder=CLIPTextModel(text_config).eval(),
+        text_encoder_2=CLIPTextModelWithProjection(text_config).eval(), tokenizer=tokenizer, tokenizer_2=tokenizer,
+        unet=unet.eval(), controlnet=controlnet.eval(), scheduler=scheduler,
+    )
+    pipe.set_progress_bar_config(disable=True)
+    return pipe
+
+def build_tiny_pipeline(device="cpu", seed=0, num_inference_steps=2, edge_size=256, **kwargs):
+    """ The real EdgeForgePipeline around build_tiny_sdxl(), generating edge_size² images """
+    from efficient_diffusion_loader.pipeline import EdgeForgePipeline
+    return EdgeForgePipeline(device=device, pipe=build_tiny_sdxl(seed), num_inference_steps=num_inference_steps,
+                             edge_size=edge_size, **kwargs)
+
+# --- THE APP ---
+
+def install_components(server, forge_pipeline=None, labeler=None, director=None, layout_engine=None):
+    """
+    Replaces the app's component factories; anything not given is a stub.
+    """
+    components = {
+        "forge_pipeline": forge_pipeline or StubForge(0.0, 0.0),
+        "labeler": labeler or StubLabeler(),
+        "director": director or StubDirector(),
+        "layout_engine": layout_engine or StubLayout(),
+    }
+    server.COMPONENT_FACTORIES = {name: (lambda c=c: c) for name, c in components.items()}
+    return components
+
+@contextmanager
+def serve(server):
+    """ In-process TestClient, once every component is loaded """
+    from fastapi.testclient import TestClient
+    with TestClient(server.app) as client:
+        server.model_loader.wait()
+        yield client
+
+def real_components(**kwargs):
+    """
+    Every component running its real stage code: the tiny pipeline, an untrained
+    YOLOv8n (built from its yaml, nothing to download), the real remixer and Director.
+    """
+    import efficient_diffusion_loader as edl
+    return {
+        "forge_pipeline": build_tiny_pipeline(**kwargs),
+        "labeler": edl.AutoLabeler(weights="yolov8n.yaml"),
+        "director": edl.PromptExpander(),
+        "layout_engine": edl.LayoutAugmenter(),
+    }
+
+# --- REPORTING ---
+
+def argument_parser(description, output):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--output", default=output, help="JSON report")
+    return parser
+
+def finish(output, report, failures, summary="PASS"):
+    """
+    Writes the JSON report, prints every failure and exits non-zero if there was one.
+    """
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to '{output}'")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print(summary)
+
+class PeakRSSSampler:
+    """
+    Samples the process RSS in a background thread (Linux /proc) to catch the peak of one call.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _current_rss(self):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self._current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current_rss())
+
+    @property
+    def added_gb(self):
+        return (self.peak - self.baseline) / (1024**3)
@@ -0,0 +1,129 @@
+"""
+EdgeForge AI: async job API check (stub components, no GPU, no model downloads).
+
+Runs the FastAPI app in-process with stub components whose diffusion / decode
+steps sleep for a known time, then checks that:
+
+  - POST /jobs returns an id immediately and GET /jobs/{id} reports per-item
+    progress and a measured images/sec close to the stub's throughput
+  - /health answers quickly while a job (and a blocking /generate_batch) runs
+  - finished items can be downloaded while the job is still running, and the
+    job archive carries a manifest.json with the image format (+ timing.json when done)
+  - POST /jobs/{id}/cancel stops the job before it reaches batch_size
+
+    python tests/job_api_benchmark.py
+    python tests/job_api_benchmark.py --items 16 --diffusion 0.2
+"""
+import io
+import json
+import threading
+import time
+import zipfile
+
+from harness import StubForge, argument_parser, control_png, finish, install_components, serve
+
+def health_latency(client, samples=5):
+    worst = 0.0
+    for _ in range(samples):
+        start = time.perf_counter()
+        assert client.get("/health").status_code == 200
+        worst = max(worst, time.perf_counter() - start)
+        time.sleep(0.05)
+    return worst
+
+def wait_for(client, job_id, condition, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/jobs/{job_id}").json()
+        if condition(status):
+            return status
+        time.sleep(0.02)
+    raise TimeoutError(f"Job {job_id} never reached the expected state: {status}")
+
+def main():
+    parser = argument_parser("Async job API check with stub components", "bench_jobs.json")
+    parser.add_argument("--items", type=int, default=12)
+    parser.add_argument("--diffusion", type=float, default=0.1, help="Seconds per diffusion micro-batch")
+    parser.add_argument("--decode", type=float, default=0.02, help="Seconds per decoded image")
+    parser.add_argument("--max-health", type=float, default=0.5, help="Fail if /health takes longer (s)")
+    args = parser.parse_args()
+
+    from app import main as server
+
+    install_components(server, forge_pipeline=StubForge(args.diffusion, args.decode))
+    form = {"intent": "a red car", "batch_size": args.items}
+    files = {"control_image": ("edges.png", control_png(), "image/png")}
+    failures = []
+
+    print("--- EdgeForge AI: Async Job API Check ---")
+    with serve(server) as client:
+
+        # 1. Submit, follow progress, download while running
+        start = time.perf_counter()
+        response = client.post("/jobs", data=dict(form, image_format="webp"), files=files)
+        submit_seconds = time.perf_counter() - start
+        assert response.status_code == 202, response.text
+        job_id = response.json()["id"]
+        print(f"POST /jobs -> {job_id} in {submit_seconds * 1000:.1f}ms")
+
+        running = wait_for(client, job_id, lambda s: s["completed"] >= 2)
+        busy_health = health_latency(client)
+        partial = client.get(f"/jobs/{job_id}/results").json()
+        first = partial["items"][0]["files"][0]
+        file_ok = client.get(f"/jobs/{job_id}/results/{first}").status_code == 200
+        archive = zipfile.ZipFile(io.BytesIO(client.get(f"/jobs/{job_id}/archive").content))
+        print(f"Running: {running['completed']}/{running['total']} items, {running['images_per_sec']:.2f} images/s, "
+              f"{len(archive.namelist())} files downloadable, /health worst {busy_health * 1000:.1f}ms")
+        if running["state"] != "running":
+            failures.append("job finished before a partial download could be tested (raise --items)")
+        if not file_ok or not archive.namelist():
+            failures.append("finished items were not downloadable while the job was running")
+        if "manifest.json" not in archive.namelist() or json.loads(archive.read("manifest.json"))["image_format"] is None:
+            failures.append("the partial job archive does not record its image format")
+
+        done = wait_for(client, job_id, lambda s: s["state"] in ("completed", "failed", "cancelled"))
+        expected_rate = 1.0 / max(args.diffusion / server.GENERATION_MICRO_BATCH, args.decode)
+        print(f"Finished: {done['state']}, {done['completed']}/{done['total']} items, "
+              f"{done['images_per_sec']:.2f} images/s (stub bottleneck: {expected_rate:.2f}/s)")
+        if done["state"] != "completed" or done["completed"] != args.items:
+            failures.append(f"job ended {done['state']} with {done['completed']}/{args.items} items")
+        if busy_health > args.max_health:
+            failures.append(f"/health took {busy_health:.2f}s during a job")
+        archive = zipfile.ZipFile(io.BytesIO(client.get(f"/jobs/{job_id}/archive").content))
+        names = archive.namelist()
+        manifest = json.loads(archive.read("manifest.json")) if "manifest.json" in names else {}
+        print(f"Archive: {len(names)} files, ends with {names[-2:]}, format {manifest.get('image_format')}")
+        if names[-2:] != ["manifest.json", "timing.json"] or manifest.get("count") != args.items:
+            failures.append(f"the finished job archive ends with {names[-2:]}, manifest count {manifest.get('count')}")
+        elif manifest["image_format"]["format"] != "webp":
+            failures.append(f"the job archive records format {manifest['image_format']}, not webp")
+
+        # 2. Cancel
+        job_id = client.post("/jobs", data=form, files=files).json()["id"]
+        wait_for(client, job_id, lambda s: s["completed"] >= 1)
+        client.post(f"/jobs/{job_id}/cancel")
+        cancelled = wait_for(client, job_id, lambda s: s["state"] in ("completed", "failed", "cancelled"))
+        print(f"Cancelled: {cancelled['state']} after {cancelled['completed']}/{cancelled['total']} items")
+        if cancelled["state"] != "cancelled" or cancelled["completed"] >= args.items:
+            failures.append(f"cancel left the job {cancelled['state']} with {cancelled['completed']} items")
+
+        # 3. The blocking endpoint no longer stalls the event loop
+        batch = {}
+        thread = threading.Thread(target=lambda: batch.update(r=client.post("/generate_batch", data=form, files=files)))
+        thread.start()
+        time.sleep(args.diffusion)
+        batch_health = health_latency(client)
+        thread.join()
+        print(f"/generate_batch: {batch['r'].status_code}, /health worst {batch_health * 1000:.1f}ms meanwhile")
+        if batch_health > args.max_health:
+            failures.append(f"/health took {batch_health:.2f}s during /generate_batch")
+
+    finish(args.output, {
+        "items": args.items, "submit_seconds": submit_seconds,
+        "health_seconds_during_job": busy_health, "health_seconds_during_batch": batch_health,
+        "images_per_sec": done["images_per_sec"], "stub_bottleneck_images_per_sec": expected_rate,
+        "cancelled_after": cancelled["completed"], "stages": done["stages"],
+    }, failures)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+EdgeForge AI: instrumentation check (tiny random models, CPU only, no downloads).
+
+Every component runs its real stage code (tests/harness.py: a tiny SDXL + ControlNet
+pipeline, an untrained YOLOv8n, the real remixer and Director), and checks that:
+
+  - /generate returns a timing block (timing.json in the ZIP and a compact
+    X-EdgeForge-Timing header) with its queue wait and encode spans
+  - /generate_batch ends its archive with timing.json covering every image
+  - a tiled VAE decode reports one timing per tile, summing to the decode calls
+  - /metrics serves Prometheus text with a histogram for every stage the
+    batch ran (canny, layout, diffusion, vae_decode, label, encode, ...), tile timings,
+    image counters, request latency and peak memory
+  - a timed() span costs a few microseconds (so it can stay on in production)
+
+    python tests/metrics_benchmark.py
+"""
+import io
+import json
+import time
+import zipfile
+
+from harness import argument_parser, build_vae, finish, install_components, layout_png, real_components, serve
+
+# Stages a /generate_batch request runs, each timed by its own code
+BATCH_STAGES = ("canny", "layout", "prompt_encode", "control_prepare", "diffusion", "vae_decode",
+                "to_uint8", "label", "encode", "zip_write")
+
+def tiled_decode(tile_size, latent_size):
+    import torch
+    from efficient_diffusion_loader import metrics
+    from efficient_diffusion_loader.tiled_vae import TiledVAEWrapper
+
+    wrapper = TiledVAEWrapper(build_vae(width=16), tile_size=tile_size, overlap=32, tile_batch_size=2)
+    latents = torch.randn(1, 4, latent_size, latent_size)
+    with metrics.request_timing() as timing, torch.no_grad():
+        start = time.perf_counter()
+        wrapper.decode_with_blending(latents)
+        seconds = time.perf_counter() - start
+    return wrapper, timing.finish().as_dict(), seconds
+
+def main():
+    parser = argument_parser("Metrics / timing block check", "bench_metrics.json")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--spans", type=int, default=100000, help="timed() spans for the overhead measurement")
+    args = parser.parse_args()
+
+    from efficient_diffusion_loader import metrics
+    from app import main as server
+
+    install_components(server, **real_components())
+    files = {"control_image": ("edges.png", layout_png(), "image/png")}
+    failures = []
+
+    print("--- EdgeForge AI: Instrumentation Check ---")
+    with serve(server) as client:
+
+        response = client.post("/generate", data={"intent": "a car"}, files=files)
+        header = json.loads(response.headers["X-EdgeForge-Timing"])
+        single = json.loads(zipfile.ZipFile(io.BytesIO(response.content)).read("timing.json"))
+        print(f"/generate: {header}")
+        for stage in ("queue_wait", "encode"):
+            if stage not in single["stages"]:
+                failures.append(f"/generate timing has no {stage} span")
+        if single["images"] != 1 or set(header["stages"]) != set(single["stages"]):
+            failures.append("/generate header and timing.json disagree")
+
+        response = client.post("/generate_batch", data={"intent": "a car", "batch_size": args.batch_size}, files=files)
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        batch = json.loads(archive.read("timing.json"))
+        print(f"/generate_batch: {batch['images']} images, {batch['images_per_sec']:.1f} images/s, "
+              f"stages { {name: round(entry['seconds'], 3) for name, entry in batch['stages'].items()} }")
+        if archive.namelist()[-1] != "timing.json":
+            failures.append("timing.json is not the last archive entry")
+        if batch["images"] != args.batch_size or batch["stages"].get("encode", {}).get("calls") != args.batch_size:
+            failures.append(f"batch timing does not cover {args.batch_size} images: {batch}")
+        missing = [stage for stage in BATCH_STAGES if stage not in batch["stages"]]
+        if missing:
+            failures.append(f"batch timing has no {missing} spans")
+
+        wrapper, decode, seconds = tiled_decode(tile_size=256, latent_size=80)
+        tiles = decode["tiles"]
+        print(f"Tiled decode: {tiles['count']} tiles, {tiles['seconds']:.3f}s of {seconds:.3f}s, "
+              f"p50 {tiles['p50'] * 1000:.1f}ms, max {tiles['max'] * 1000:.1f}ms")
+        if tiles["count"] != wrapper.last_decode_stats["tiles"]:
+            failures.append(f"{tiles['count']} tile timings for {wrapper.last_decode_stats['tiles']} tiles")
+        if not 0 < tiles["seconds"] <= seconds:
+            failures.append("tile times do not fit inside the decode")
+
+        text = client.get("/metrics").text
+        expected = [
+            *(f'edgeforge_stage_seconds_count{{stage="{stage}"}}' for stage in BATCH_STAGES),
+            'edgeforge_encode_seconds_bucket{format="png",le="+Inf"}',
+            'edgeforge_vae_tile_seconds_count{op="decode"}',
+            'edgeforge_images_total{endpoint="generate"} 1',
+            f'edgeforge_images_total{{endpoint="batch"}} {args.batch_size}',
+            'edgeforge_request_seconds_count{endpoint="generate_batch"} 1',
+            "edgeforge_last_batch_images_per_second",
+            "edgeforge_peak_rss_bytes",
+        ]
+        missing = [line for line in expected if line not in text]
+        # One label set per family: only the stage on the stage histogram
+        mixed = [line for line in text.splitlines() if line.startswith("edgeforge_stage_seconds") and "format=" in line]
+        if mixed:
+            failures.append(f"edgeforge_stage_seconds has extra labels: {mixed[0]}")
+        print(f"/metrics: {len(text.splitlines())} lines, {len(expected) - len(missing)}/{len(expected)} expected series")
+        failures.extend(f"/metrics has no {line}" for line in missing)
+
+    registry = metrics.Registry()
+    with metrics.request_timing():
+        start = time.perf_counter()
+        for _ in range(args.spans):
+            with metrics.timed("overhead", registry=registry):
+                pass
+        span_us = (time.perf_counter() - start) / args.spans * 1e6
+    print(f"timed() span: {span_us:.2f}us")
+    if span_us > 50:
+        failures.append(f"a timed() span costs {span_us:.1f}us")
+
+    finish(args.output, {"generate": single, "generate_batch": batch, "tiled_decode": decode, "span_us": span_us}, failures)
+
+if __name__ == "__main__":
+    main()
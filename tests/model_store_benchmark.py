@@ -0,0 +1,190 @@
+"""
+EdgeForge AI: multi-worker host memory benchmark for the model store (offline, CPU).
+
+Saves a full-size SD VAE (random weights) as a local safetensors snapshot, float32
+plus an fp16 variant like the SDXL repos, then starts worker processes one after
+another that each load it and touch every weight, the way N uvicorn workers would.
+Reported per worker:
+
+  anon   private (anonymous) memory added by the load - what N workers multiply
+  file   file-backed pages mapped - shared through the page cache
+  pss    proportional set size added (shared pages divided between the workers)
+
+Modes:
+  from_pretrained   from_pretrained(torch_dtype=float16) in every worker, as the
+                    pipeline did (casts the float32 weights into private memory)
+  store             ModelStore.load(fp16 variant, memory-mapped) in every spawned worker
+  fork              ModelStore.load once in the parent, workers forked afterwards
+  offload           ModelStore.load, then what EdgeForgePipeline does on a GPU: .to("cuda")
+                    and back to the CPU (enable_model_cpu_offload). The weights end up in
+                    fresh private CPU tensors, so nothing stays shared. Without CUDA the
+                    round trip is emulated by copying every weight ("emulated" in the report).
+
+Both load float16 weights, as the SDXL UNet / ControlNet / text encoders are.
+(A float32 checkpoint loaded as float32 is already mapped by diffusers itself.)
+
+Exits non-zero if the second store worker's private memory grows by more than
+--max-ratio of the model size, or if the offload mode is not reported as unshared.
+
+    python tests/model_store_benchmark.py --workers 3
+"""
+import multiprocessing as mp
+import os
+import tempfile
+
+from harness import argument_parser, finish
+
+MODES = ("from_pretrained", "store", "fork", "offload")
+
+def memory_kb():
+    """
+    RssAnon / RssFile from /proc/self/status and Pss from smaps_rollup, in kB.
+    """
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, value = line.split()[:2]
+                values[key.rstrip(":")] = int(value)
+    values["Pss"] = 0
+    if os.path.exists("/proc/self/smaps_rollup"):
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    values["Pss"] = int(line.split()[1])
+    return values
+
+def save_snapshot(model_dir):
+    import torch
+    from diffusers import AutoencoderKL
+    torch.manual_seed(0)
+    vae = AutoencoderKL(
+        down_block_types=("DownEncoderBlock2D",) * 4, up_block_types=("UpDecoderBlock2D",) * 4,
+        block_out_channels=(128, 256, 512, 512), layers_per_block=2, latent_channels=4,
+    )
+    vae.save_pretrained(model_dir)
+    vae.half().save_pretrained(model_dir, variant="fp16")
+    return sum(p.numel() * p.element_size() for p in vae.parameters())
+
+def touch(model):
+    """
+    Reads every weight once (pages them in), without keeping any copy.
+    """
+    import torch
+    total = 0.0
+    with torch.no_grad():
+        for param in model.parameters():
+            total += float(param.sum())
+    return total
+
+def offload_round_trip(model):
+    """
+    GPU -> CPU as the offload hooks do it; True if it only could be emulated.
+    """
+    import torch
+    if torch.cuda.is_available():
+        model.to("cuda")
+        model.to("cpu")
+        return False
+    with torch.no_grad():
+        for param in model.parameters():
+            param.data = param.data.clone()  # The private host copy .to("cpu") leaves behind
+    return True
+
+def worker(mode, model_dir, index, results, release, preloaded=None):
+    import torch
+    from diffusers import AutoencoderKL
+    from efficient_diffusion_loader.model_store import ModelStore
+    torch.set_num_threads(1)
+
+    before = memory_kb()
+    if preloaded is not None:
+        model = preloaded
+    elif mode == "from_pretrained":
+        model = AutoencoderKL.from_pretrained(model_dir, torch_dtype=torch.float16)
+    else:
+        model = ModelStore(local_files_only=True).load(AutoencoderKL, model_dir, torch_dtype=torch.float16, variant="fp16")
+    emulated = offload_round_trip(model) if mode == "offload" else None
+    checksum = touch(model)
+    after = memory_kb()
+
+    results.put({
+        "worker": index,
+        "emulated": emulated,
+        "checksum": checksum,
+        "anon_mb": (after["RssAnon"] - before["RssAnon"]) / 1024,
+        "file_mb": (after["RssFile"] - before["RssFile"]) / 1024,
+        "pss_mb": (after["Pss"] - before["Pss"]) / 1024,
+    })
+    # Stay alive (and mapped) until every worker has reported, like a live server
+    release.wait()
+
+def run_mode(mode, model_dir, workers):
+    preloaded = None
+    if mode == "fork":
+        import torch
+        from diffusers import AutoencoderKL
+        from efficient_diffusion_loader.model_store import ModelStore
+        ctx = mp.get_context("fork")
+        # Preload before fork: mapped in the parent, no CUDA, no compute
+        preloaded = ModelStore(local_files_only=True).load(AutoencoderKL, model_dir, torch_dtype=torch.float16, variant="fp16")
+    else:
+        # uvicorn --workers spawns fresh interpreters
+        ctx = mp.get_context("spawn")
+
+    results, release = ctx.Queue(), ctx.Event()
+    processes, records = [], []
+    for index in range(workers):
+        process = ctx.Process(target=worker, args=(mode, model_dir, index, results, release, preloaded))
+        process.start()
+        processes.append(process)
+        # One after another, so worker k sees the pages of workers < k
+        records.append(results.get(timeout=600))
+
+    release.set()
+    for process in processes:
+        process.join()
+    return records
+
+def main():
+    parser = argument_parser("Model store multi-worker memory benchmark", "bench_model_store.json")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--max-ratio", type=float, default=0.25,
+                        help="Allowed private growth of the 2nd store worker, as a fraction of the model size")
+    args = parser.parse_args()
+
+    print("--- EdgeForge AI: Model Store Memory Benchmark ---")
+    report = {"workers": args.workers, "results": {}}
+    with tempfile.TemporaryDirectory() as model_dir:
+        model_mb = save_snapshot(model_dir) / 1024**2
+        report["model_mb"] = model_mb
+        print(f"Snapshot: {model_mb:.0f} MB of float16 weights")
+
+        for mode in args.modes:
+            records = run_mode(mode, model_dir, args.workers)
+            report["results"][mode] = records
+            for r in records:
+                print(f"{mode:>15} worker {r['worker']}: anon +{r['anon_mb']:.0f} MB, "
+                      f"file +{r['file_mb']:.0f} MB, pss +{r['pss_mb']:.0f} MB")
+
+    failures = []
+    summary = "PASS"
+    store = report["results"].get("store")
+    if store and len(store) > 1:
+        ratio = store[1]["anon_mb"] / model_mb
+        summary = f"PASS: second store worker private growth = {ratio:.1%} of the model (limit {args.max_ratio:.0%})"
+        if ratio > args.max_ratio:
+            failures.append(f"second store worker private growth = {ratio:.1%} of the model (limit {args.max_ratio:.0%})")
+    offload = report["results"].get("offload")
+    if offload and len(offload) > 1:
+        # Expected: the round trip leaves every worker a private copy (see ModelStore)
+        ratio = offload[1]["anon_mb"] / model_mb
+        label = " (emulated, no CUDA)" if offload[1]["emulated"] else ""
+        print(f"offload: second worker private growth = {ratio:.1%} of the model{label}; offloaded weights are not shared")
+        if ratio < 1 - args.max_ratio:
+            failures.append(f"offload mode grew by only {ratio:.1%} of the model: the round trip did not copy")
+    finish(args.output, report, failures, summary=summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+EdgeForge AI: per-request profiling check (tiny random models, CPU only, no downloads).
+
+Checks that:
+
+  - a /generate_batch request without the switch records nothing (no trace header, no file)
+  - with X-EdgeForge-Profile: 1 (or profile=true) the response names a trace that
+    /debug/traces/{id} serves once the batch is done, holding the real pipeline's stage
+    spans, the tiled VAE batches and torch.profiler ops on a common timeline
+  - POST /jobs with profile=true links its trace from the job's timing block
+  - the profiling switch costs nothing when off
+
+    python tests/profiling_benchmark.py
+"""
+import io
+import json
+import sys
+import time
+import zipfile
+
+from harness import argument_parser, install_components, layout_png, real_components, serve
+
+def span_names(trace):
+    return {event["name"] for event in trace["traceEvents"] if event.get("cat") == "edgeforge"}
+
+def main():
+    parser = argument_parser("Per-request profiling check", "bench_profiling_trace.json")
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--edge-size", type=int, default=384, help="Generation resolution (the VAE decodes it in tiles)")
+    parser.add_argument("--spans", type=int, default=100000, help="timed() spans for the overhead measurement")
+    args = parser.parse_args()
+
+    from efficient_diffusion_loader import metrics
+    from efficient_diffusion_loader.profiling import RequestTrace
+    from app import main as server
+
+    components = install_components(server, **real_components(edge_size=args.edge_size))
+    # Several tiles per image, so the decode shows up as tile batches
+    tiled_vae = components["forge_pipeline"].tiled_vae
+    tiled_vae.auto_tune, tiled_vae.tile_batch_size = False, 2
+    tiled_vae._set_tile_geometry(256, 32)
+    files = {"control_image": ("edges.png", layout_png(args.edge_size), "image/png")}
+    form = {"intent": "a car", "batch_size": args.batch_size}
+    failures = []
+
+    def batch(client, headers=None, **extra):
+        start = time.perf_counter()
+        response = client.post("/generate_batch", data=dict(form, **extra), files=files, headers=headers)
+        seconds = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        timing = json.loads(zipfile.ZipFile(io.BytesIO(response.content)).read("timing.json"))
+        return response, timing, seconds
+
+    print("--- EdgeForge AI: Per-Request Profiling Check ---")
+    with serve(server) as client:
+        batch(client)  # Warm-up
+
+        response, timing, plain_seconds = batch(client)
+        if "X-EdgeForge-Trace" in response.headers or "trace" in timing or client.get("/debug/traces").json():
+            failures.append("an unprofiled request recorded a trace")
+
+        response, timing, profiled_seconds = batch(client, headers={"X-EdgeForge-Profile": "1"})
+        trace_id = response.headers.get("X-EdgeForge-Trace")
+        print(f"Unprofiled batch {plain_seconds:.2f}s, profiled {profiled_seconds:.2f}s, trace {trace_id}")
+        if trace_id is None or timing.get("trace") != trace_id:
+            failures.append("the profiled request did not name its trace")
+        else:
+            download = client.get(response.headers["X-EdgeForge-Trace-Url"])
+            trace = download.json()
+            with open(args.output, "w") as f:
+                json.dump(trace, f)
+            events = trace["traceEvents"]
+            spans = [e for e in events if e.get("cat") == "edgeforge"]
+            ops = [e for e in events if e.get("ph") == "X" and e.get("cat") != "edgeforge"]
+            threads = {e["tid"] for e in spans}
+            print(f"Trace: {len(download.content) / 1024:.0f} kB, {len(spans)} spans on {len(threads)} threads, "
+                  f"{len(ops)} torch events, profiler {trace['otherData']['torch_profiler']}")
+            print(f"Spans: {sorted(span_names(trace))}")
+            expected = {"stage:layout", "stage:diffusion", "stage:decode", "stage:label", "stage:encode",
+                        "layout", "diffusion", "vae_decode", "vae_decode_tiles", "label", "encode"}
+            if not expected <= span_names(trace):
+                failures.append(f"trace is missing spans {expected - span_names(trace)}")
+            if not any(e["name"].startswith("aten::") for e in ops):
+                failures.append("trace has no torch.profiler ops")
+            # Both clocks on one timeline: the decode's torch ops fall inside its tile batches
+            def within(event, name):
+                return any(s["ts"] - 1000 <= event["ts"] <= s["ts"] + s["dur"] + 1000 for s in spans if s["name"] == name)
+            convs = [e for e in ops if e["name"] == "aten::conv2d" and within(e, "vae_decode")]
+            inside = sum(within(c, "vae_decode_tiles") for c in convs)
+            print(f"Timeline: {inside}/{len(convs)} decode conv2d ops inside a tile batch span")
+            if not convs or inside < 0.9 * len(convs):
+                failures.append("torch ops and EdgeForge spans are not aligned")
+            print(f"Saved trace to '{args.output}' (open in ui.perfetto.dev)")
+
+        response, timing, _ = batch(client, profile="true")
+        if "X-EdgeForge-Trace" not in response.headers:
+            failures.append("profile=true did not record a trace")
+
+        job = client.post("/jobs", data=dict(form, profile="true"), files=files).json()
+        while client.get(f"/jobs/{job['id']}").json()["state"] not in ("completed", "failed", "cancelled"):
+            time.sleep(0.05)
+        job_trace = (client.get(f"/jobs/{job['id']}").json()["timing"] or {}).get("trace")
+        if job_trace is None or client.get(f"/debug/traces/{job_trace}").status_code != 200:
+            failures.append("the profiled job has no downloadable trace")
+
+        listed = client.get("/debug/traces").json()
+        print(f"/debug/traces: {[(t['request'], t['state']) for t in listed]}")
+        if len(listed) != 3 or client.get("/debug/traces/nope").status_code != 404:
+            failures.append("trace listing / unknown trace lookup is wrong")
+
+    # Off: timed() only checks the request timing for a trace
+    registry = metrics.Registry()
+    costs = {}
+    for label, trace in (("off", None), ("on", RequestTrace("overhead", torch_profiler=False))):
+        with metrics.request_timing() as bound:
+            bound.trace = trace
+            start = time.perf_counter()
+            for _ in range(args.spans):
+                with metrics.timed("overhead", registry=registry):
+                    pass
+            costs[label] = (time.perf_counter() - start) / args.spans * 1e6
+    print(f"timed() span: {costs['off']:.2f}us profiling off, {costs['on']:.2f}us on")
+    if costs["off"] > 50:
+        failures.append(f"a timed() span costs {costs['off']:.1f}us with profiling off")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("PASS")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+EdgeForge AI: deterministic /generate + result cache check (stub pipeline, no GPU).
+
+Uses the real PromptExpander (its modifier picks are what deterministic mode
+seeds) and a stub pipeline that counts its calls. Checks that:
+
+  - a repeated deterministic request is a cache hit, served without a model call
+    and with the same files as the first response
+  - a different seed or intent misses; non-deterministic requests never touch the cache
+  - the cache stays under its size limit by evicting least recently used entries
+  - the hit rate in /generate/stats matches
+
+    python tests/result_cache_benchmark.py
+    python tests/result_cache_benchmark.py --diffusion 1.0
+"""
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+from harness import StubForge, argument_parser, control_png, finish, install_components, serve
+
+def main():
+    parser = argument_parser("Result cache check with a stub pipeline", "bench_result_cache.json")
+    parser.add_argument("--diffusion", type=float, default=0.3, help="Seconds per stub diffusion call")
+    parser.add_argument("--repeats", type=int, default=20, help="Cache hits to time")
+    args = parser.parse_args()
+
+    import efficient_diffusion_loader as edl
+    from app import main as server
+
+    forge = StubForge(args.diffusion, 0.0, size=256, noise=True)
+    install_components(server, forge_pipeline=forge, director=edl.PromptExpander())
+    files = {"control_image": ("edges.png", control_png(), "image/png")}
+    failures = []
+
+    def generate(client, intent, seed=42, deterministic=True):
+        start = time.perf_counter()
+        response = client.post("/generate", data={"intent": intent, "seed": seed, "deterministic": deterministic}, files=files)
+        seconds = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        # timing.json is per request, never part of the cached result
+        contents = {name: archive.read(name) for name in archive.namelist() if name != "timing.json"}
+        return response.headers.get("X-EdgeForge-Cache"), seconds, contents
+
+    print("--- EdgeForge AI: Result Cache Check ---")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        server.result_cache = edl.ResultCache(cache_dir)
+        with serve(server) as client:
+            intent = "a car on the street, hard to see, rain, damage"
+
+            state, miss_seconds, first = generate(client, intent)
+            calls = len(forge.batch_sizes)
+            hits = [generate(client, intent) for _ in range(args.repeats)]
+            hit_seconds = sorted(seconds for _, seconds, _ in hits)[len(hits) // 2]
+            prompt = json.loads(first["generated_image.json"])["prompt"]
+            print(f"Miss: {miss_seconds * 1000:.0f}ms, hit (median of {args.repeats}): {hit_seconds * 1000:.1f}ms")
+            print(f"Prompt: {prompt}")
+            if state != "miss" or any(h[0] != "hit" for h in hits):
+                failures.append(f"expected miss then hits, got {state} / {[h[0] for h in hits]}")
+            if len(forge.batch_sizes) != calls:
+                failures.append("a cache hit called the pipeline")
+            if any(h[2] != first for h in hits):
+                failures.append("a cache hit returned different files")
+
+            # The modifier picks repeat for the same request, and other requests miss
+            server.result_cache.clear()
+            state, _, again = generate(client, intent)
+            if state != "miss" or json.loads(again["generated_image.json"])["prompt"] != prompt:
+                failures.append("the modifier picks were not reproducible from the request")
+            for other in ({"intent": intent, "seed": 7}, {"intent": intent + ", old"}):
+                if generate(client, **other)[0] != "miss":
+                    failures.append(f"{other} should have missed")
+            if generate(client, intent, deterministic=False)[0] is not None:
+                failures.append("a non-deterministic request used the cache")
+
+            stats = client.get("/generate/stats").json()["result_cache"]
+            print(f"Stats: {stats['hits']} hits / {stats['misses']} misses, hit rate {stats['hit_rate']:.0%}, "
+                  f"{stats['entries']} entries, {stats['bytes'] / 1024:.0f} kB")
+            if stats["hits"] != args.repeats or stats["misses"] != 4:
+                failures.append(f"expected {args.repeats} hits / 4 misses, got {stats['hits']} / {stats['misses']}")
+
+        # LRU eviction on a small cache
+        entry = server.result_cache.stats()["bytes"] // server.result_cache.stats()["entries"]
+        cache = edl.ResultCache(os.path.join(cache_dir, "small"), max_bytes=int(entry * 2.5))
+        for i in range(3):
+            cache.put(f"key{i}", {"image.png": b"x" * entry}, {})
+            if i == 1:
+                cache.get("key0")  # key0 is now more recent than key1
+        kept = [key for key in ("key0", "key1", "key2") if cache.get(key) is not None]
+        print(f"Eviction: kept {kept} under {cache.max_bytes / 1024:.0f} kB, {cache.evictions} evicted")
+        if kept != ["key0", "key2"]:
+            failures.append(f"LRU eviction kept {kept}, expected ['key0', 'key2']")
+        # Recency survives a restart
+        reopened = edl.ResultCache(cache.root, max_bytes=cache.max_bytes)
+        if reopened.stats()["entries"] != 2:
+            failures.append("the cache did not reload its entries")
+
+    finish(args.output, {"miss_seconds": miss_seconds, "hit_seconds": hit_seconds, "stats": stats}, failures,
+           summary=f"PASS: hits {miss_seconds / hit_seconds:.0f}x faster than a miss")
+
+if __name__ == "__main__":
+    main()
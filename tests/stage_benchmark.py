@@ -0,0 +1,100 @@
+"""
+EdgeForge AI: staged pipeline benchmark (no models, runs anywhere).
+
+Stub stages sleep for a known latency per item (the sleep releases the GIL, like
+CUDA kernels, zlib and most of YOLO do). Compares running them back to back for
+every item against StagedPipeline, and checks that the staged total approaches
+items x slowest stage instead of items x sum of stages.
+
+    python tests/stage_benchmark.py
+    python tests/stage_benchmark.py --latencies 0.01 0.08 0.04 0.03 0.02 0.005 --items 32
+"""
+import time
+
+from harness import argument_parser, finish
+from efficient_diffusion_loader.staged import Stage, StagedPipeline
+
+STAGE_NAMES = ["layout", "diffusion", "decode", "label", "encode", "write"]
+
+def stub(latency):
+    def fn(item):
+        time.sleep(latency)
+        return item
+    return fn
+
+def stub_batch(latency):
+    # Batched stage: one call per batch, same cost per call as the per-item stub
+    def fn(items):
+        time.sleep(latency)
+        return items
+    return fn
+
+def run_sequential(latencies, items, micro_batch):
+    start = time.perf_counter()
+    for first in range(0, items, micro_batch):
+        chunk = list(range(first, min(first + micro_batch, items)))
+        for i, latency in enumerate(latencies):
+            if i == 1:
+                stub_batch(latency)(chunk)
+            else:
+                for item in chunk:
+                    stub(latency)(item)
+    return time.perf_counter() - start
+
+def run_staged(latencies, items, micro_batch, queue_size):
+    stages = []
+    for i, latency in enumerate(latencies):
+        name = STAGE_NAMES[i] if i < len(STAGE_NAMES) else f"stage{i}"
+        if i == 1:
+            stages.append(Stage(name, stub_batch(latency), batch_size=micro_batch))
+        else:
+            stages.append(Stage(name, stub(latency)))
+    engine = StagedPipeline(stages, queue_size=queue_size)
+    results = engine.run(range(items))
+    assert results == list(range(items)), "Staged pipeline lost or reordered items"
+    return engine
+
+def main():
+    parser = argument_parser("Staged pipeline benchmark with stub stages", "bench_stages.json")
+    parser.add_argument("--latencies", type=float, nargs="+", default=[0.005, 0.06, 0.03, 0.02, 0.015, 0.002],
+                        help="Seconds per call of layout, diffusion (per micro-batch), decode, label, encode, write")
+    parser.add_argument("--items", type=int, default=24)
+    parser.add_argument("--micro-batch", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=2)
+    parser.add_argument("--tolerance", type=float, default=1.3,
+                        help="Fail if staged time > tolerance x (bottleneck time + pipeline fill)")
+    args = parser.parse_args()
+
+    latencies = args.latencies
+    # Per-item cost of every stage (diffusion is paid once per micro-batch)
+    per_item = [latency / args.micro_batch if i == 1 else latency for i, latency in enumerate(latencies)]
+    sum_bound = args.items * sum(per_item)
+    slowest = max(per_item)
+    # The first item still has to pass through every stage once
+    bottleneck_bound = args.items * slowest + sum(latencies)
+
+    print("--- EdgeForge AI: Staged Pipeline Benchmark ---")
+    sequential = run_sequential(latencies, args.items, args.micro_batch)
+    engine = run_staged(latencies, args.items, args.micro_batch, args.queue_size)
+    staged = engine.total_seconds
+
+    print(f"Sequential: {sequential:.3f}s (sum of stages: {sum_bound:.3f}s)")
+    print(f"Staged:     {staged:.3f}s (slowest stage x items + fill: {bottleneck_bound:.3f}s)")
+    print(f"Speedup:    {sequential / staged:.2f}x")
+    print(engine.report())
+
+    ratio = staged / bottleneck_bound
+    failures = [f"staged time is {ratio:.2f}x the bottleneck bound"] if staged > args.tolerance * bottleneck_bound else []
+    finish(args.output, {
+        "latencies": latencies,
+        "items": args.items,
+        "micro_batch": args.micro_batch,
+        "sequential_seconds": sequential,
+        "staged_seconds": staged,
+        "sum_bound": sum_bound,
+        "bottleneck_bound": bottleneck_bound,
+        "stages": engine.stats()["stages"],
+    }, failures, summary=f"PASS: staged time is {ratio:.2f}x the bottleneck bound")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+EdgeForge AI: cold-start benchmark (runs offline, CPU).
+
+Saves small randomly initialised ControlNet / UNet / VAE checkpoints to a temp dir
+and times, each in a fresh interpreter so import costs are paid every time:
+
+  import      `import efficient_diffusion_loader` (lazy) vs importing every public name
+  sequential  the stub components loaded one after another (the old startup hook)
+  parallel    the same components through ComponentLoader
+  server      FastAPI app with stub factories: first /health answer and /ready == 200
+
+    python tests/startup_benchmark.py --output bench_startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+sys.path.insert(0, SRC)
+
+MODES = ("import_lazy", "import_eager", "sequential", "parallel", "server")
+
+def save_stub_models(model_dir, width=64):
+    """
+    Tiny SDXL-shaped checkpoints (same classes the real pipeline loads) written with
+    save_pretrained, so loading them exercises the real from_pretrained code path.
+    """
+    import torch
+    from diffusers import AutoencoderKL, ControlNetModel, UNet2DConditionModel
+
+    torch.manual_seed(0)
+    common = dict(
+        block_out_channels=(width, width * 2), layers_per_block=1, in_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"), attention_head_dim=(2, 4),
+        use_linear_projection=True, addition_embed_type="text_time", addition_time_embed_dim=8,
+        transformer_layers_per_block=(1, 2), projection_class_embeddings_input_dim=80,
+        cross_attention_dim=64, norm_num_groups=8,
+    )
+    ControlNetModel(conditioning_embedding_out_channels=(16, 16, 32, 32), **common).save_pretrained(
+        os.path.join(model_dir, "controlnet"))
+    UNet2DConditionModel(
+        sample_size=32, out_channels=4, up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"), **common
+    ).save_pretrained(os.path.join(model_dir, "unet"))
+    AutoencoderKL(
+        down_block_types=("DownEncoderBlock2D",) * 4, up_block_types=("UpDecoderBlock2D",) * 4,
+        block_out_channels=(width // 2,) * 4, layers_per_block=1, latent_channels=4,
+        norm_num_groups=min(32, width // 2),
+    ).save_pretrained(os.path.join(model_dir, "vae"))
+
+def stub_factories(model_dir):
+    """
+    Same component names as src/app/main.py. Only the checkpoints are stubbed:
+    the heavy imports (diffusers, ultralytics, cv2) are the real ones.
+    """
+    import efficient_diffusion_loader as edl
+    from app.main import CPU_WORKERS
+
+    def forge_pipeline():
+        import torch
+        from diffusers import AutoencoderKL, ControlNetModel, UNet2DConditionModel
+        from efficient_diffusion_loader.startup import MODEL_BUILD_LOCK
+        # Built one after another, like the real pipeline (see MODEL_BUILD_LOCK)
+        with MODEL_BUILD_LOCK:
+            return {
+                "controlnet": ControlNetModel.from_pretrained(os.path.join(model_dir, "controlnet"), torch_dtype=torch.float16),
+                "vae": AutoencoderKL.from_pretrained(os.path.join(model_dir, "vae"), torch_dtype=torch.float32),
+                "unet": UNet2DConditionModel.from_pretrained(os.path.join(model_dir, "unet"), torch_dtype=torch.float16),
+            }
+
+    return {
+        "forge_pipeline": forge_pipeline,
+        # Architecture yaml instead of yolov8n.pt: no download
+        "labeler": lambda: edl.AutoLabeler(weights="yolov8n.yaml"),
+        "director": lambda: edl.PromptExpander(),
+        "layout_engine": lambda: edl.LayoutAugmenter(),
+        "cpu_executor": lambda: edl.CPUExecutor(workers=CPU_WORKERS).warm_up(),
+    }
+
+def meta_parameters(components):
+    """
+    Parameters left on the meta device by builds that overlapped (must stay 0).
+    """
+    import torch
+    modules = []
+    for component in components.values():
+        values = component.values() if isinstance(component, dict) else [getattr(component, "model", component)]
+        modules.extend(value for value in values if isinstance(value, torch.nn.Module))
+    return sum(param.is_meta for module in modules for param in module.parameters())
+
+def run_mode(mode, model_dir):
+    """
+    Runs inside the child interpreter, returns a dict of timings (seconds).
+    """
+    start = time.perf_counter()
+    if mode == "import_lazy":
+        import efficient_diffusion_loader  # noqa: F401
+        return {"seconds": time.perf_counter() - start}
+
+    if mode == "import_eager":
+        import efficient_diffusion_loader as edl
+        for name in edl.__all__:
+            getattr(edl, name)
+        return {"seconds": time.perf_counter() - start}
+
+    if mode == "sequential":
+        components = {}
+        for name, factory in stub_factories(model_dir).items():
+            t0 = time.perf_counter()
+            factory()
+            components[name] = time.perf_counter() - t0
+        return {"seconds": time.perf_counter() - start, "components": components}
+
+    if mode == "parallel":
+        import torch
+        from efficient_diffusion_loader import ComponentLoader
+        register_parameter = torch.nn.Module.register_parameter
+        loader = ComponentLoader(stub_factories(model_dir)).start()
+        loader.wait()
+        status = loader.status()
+        return {
+            "seconds": time.perf_counter() - start,
+            "components": {name: s["seconds"] for name, s in status["components"].items()},
+            # Concurrent from_pretrained calls must neither leak meta parameters nor the patch
+            "meta_parameters": meta_parameters(loader.components),
+            "register_parameter_restored": torch.nn.Module.register_parameter is register_parameter,
+        }
+
+    if mode == "server":
+        sys.path.insert(0, SRC)
+        from fastapi.testclient import TestClient
+        from app import main
+
+        main.COMPONENT_FACTORIES = stub_factories(model_dir)
+        import_seconds = time.perf_counter() - start
+        with TestClient(main.app) as client:
+            first_health = None
+            while True:
+                response = client.get("/ready")
+                if first_health is None:
+                    first_health = time.perf_counter() - start
+                if response.status_code == 200:
+                    break
+                if response.json()["state"] == "failed":
+                    raise RuntimeError(f"Stub load failed: {response.json()}")
+                time.sleep(0.05)
+            ready = time.perf_counter() - start
+            health = client.get("/health").json()
+        return {
+            "seconds": ready,
+            "app_import": import_seconds,
+            "first_health": first_health,
+            "components": {name: s["seconds"] for name, s in health["components"].items()},
+        }
+
+    raise ValueError(f"Unknown mode: {mode}")
+
+def run_child(mode, model_dir):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([SRC, env.get("PYTHONPATH", "")])
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--model-dir", model_dir], env=env
+    )
+    # Model loaders print progress; the result is the last line
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="EdgeForge cold-start benchmark")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--model-width", type=int, default=64, help="Channels of the stub UNet/ControlNet")
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--model-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.model_dir)))
+        return
+
+    print("--- EdgeForge AI: Cold Start Benchmark ---")
+    results = {}
+    with tempfile.TemporaryDirectory() as model_dir:
+        save_stub_models(model_dir, args.model_width)
+        for mode in args.modes:
+            runs = [run_child(mode, model_dir) for _ in range(args.repeats)]
+            best = min(runs, key=lambda r: r["seconds"])
+            results[mode] = {"best": best, "all_seconds": [round(r["seconds"], 4) for r in runs], "all_runs": runs}
+            print(f"{mode:>13}: {best['seconds']:.3f}s (best of {args.repeats})")
+
+    if "sequential" in results and "parallel" in results:
+        speedup = results["sequential"]["best"]["seconds"] / results["parallel"]["best"]["seconds"]
+        print(f"Parallel loading speedup: {speedup:.2f}x")
+
+    with open(args.output, "w") as f:
+        json.dump({"model_width": args.model_width, "results": results}, f, indent=2)
+    print(f"Saved results to '{args.output}'")
+
+    if "parallel" in results:
+        runs = results["parallel"]["all_runs"]
+        broken = [r for r in runs if r["meta_parameters"] or not r["register_parameter_restored"]]
+        if broken:
+            print(f"FAIL: concurrent loads left meta parameters / a patched register_parameter: {broken[0]}")
+            sys.exit(1)
+        print("PASS: concurrent loads built every parameter, register_parameter restored")
+
+if __name__ == "__main__":
+    main()
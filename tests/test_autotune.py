@@ -0,0 +1,95 @@
+"""
+Tile size / overlap / tile batch auto-tuning against a stubbed memory budget and estimator.
+
+    python -m pytest tests/test_autotune.py -q
+"""
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from harness import build_vae
+from efficient_diffusion_loader import autotune, tiled_vae
+from efficient_diffusion_loader.autotune import VAEMemoryEstimator, choose_tile_config
+from efficient_diffusion_loader.tiled_vae import TiledVAEWrapper
+
+MB = 1024**2
+
+class StubEstimator:
+    """ 1 MB per 16 x 16 latent pixels of a tile """
+    scale_factor = 8
+    calibrated = False
+
+    def estimate(self, latent_h, latent_w, batch=1):
+        return batch * latent_h * latent_w * MB // 256
+
+def stub_vae(device="cpu", dtype=torch.float32, name="tiny-vae"):
+    config = SimpleNamespace(_name_or_path=name, block_out_channels=(16, 32), latent_channels=4)
+    return SimpleNamespace(config=config, device=torch.device(device), dtype=dtype)
+
+@pytest.fixture(autouse=True)
+def estimator_cache(monkeypatch):
+    cache = {}
+    monkeypatch.setattr(autotune, "_ESTIMATOR_CACHE", cache)
+    return cache
+
+@pytest.mark.parametrize("budget, tile_size, tile_batch_size", [
+    (1024 * MB, 1024, 16),  # 128² latent tile = 64 MB
+    (100 * MB, 1024, 1),
+    (63 * MB, 768, 1),     # 96² = 36 MB
+    (40 * MB, 768, 1),
+    (35 * MB, 512, 2),     # 64² = 16 MB
+    (5 * MB, 256, 1),      # 32² = 4 MB
+])
+def test_largest_tile_that_fits_the_budget(budget, tile_size, tile_batch_size):
+    config = choose_tile_config(StubEstimator(), (1, 4, 128, 128), budget)
+    assert config["tile_size"] == tile_size
+    assert config["overlap"] == max(32, tile_size // 8)
+    assert config["estimated_tile_bytes"] <= budget
+    assert config["tile_batch_size"] == tile_batch_size
+    assert config["tile_batch_size"] * config["estimated_tile_bytes"] <= budget
+
+def test_batch_fills_the_rest_of_the_budget():
+    config = choose_tile_config(StubEstimator(), (1, 4, 128, 128), 100 * MB, tile_sizes=(256,))
+    assert config["estimated_tile_bytes"] == 4 * MB and config["tile_batch_size"] == 25
+
+def test_short_of_memory_falls_back_to_the_smallest_tile():
+    config = choose_tile_config(StubEstimator(), (1, 4, 128, 128), 64 * 1024)
+    assert config["tile_size"] == 128 and config["overlap"] == 32
+    assert config["tile_batch_size"] == 1
+    assert config["estimated_tile_bytes"] > config["budget_bytes"]
+
+def test_tiles_larger_than_the_image_are_skipped():
+    # 40 x 24 latent = 320 x 192 px: nothing above 320 px is tried
+    config = choose_tile_config(StubEstimator(), (2, 4, 40, 24), 1024 * MB)
+    assert config["tile_size"] == 256
+    assert config["estimated_tile_bytes"] == StubEstimator().estimate(32, 24, batch=2)
+
+def test_estimator_cache_key_is_model_device_and_dtype(estimator_cache):
+    base = VAEMemoryEstimator.for_vae(stub_vae())
+    assert VAEMemoryEstimator.for_vae(stub_vae()) is base
+    others = [
+        VAEMemoryEstimator.for_vae(stub_vae(device="meta")),
+        VAEMemoryEstimator.for_vae(stub_vae(dtype=torch.float16)),
+        VAEMemoryEstimator.for_vae(stub_vae(name="other-vae")),
+    ]
+    assert len({id(estimator) for estimator in [base, *others]}) == 4
+    assert len(estimator_cache) == 4
+    assert {key[1:] for key in estimator_cache} == {("cpu", "torch.float32"), ("meta", "torch.float32"),
+                                                   ("cpu", "torch.float16")}
+
+def test_tune_fits_the_available_memory(monkeypatch):
+    monkeypatch.setattr(tiled_vae, "available_memory", lambda device: 24 * MB)
+    monkeypatch.setattr(VAEMemoryEstimator, "for_vae", classmethod(lambda cls, vae, scale_factor=8: StubEstimator()))
+    wrapper = TiledVAEWrapper(build_vae(16), auto_tune=True)
+    config = wrapper.tune((1, 4, 96, 80))
+    # 768 px tiles (96 x 80 latent) need 30 MB, 512 px tiles 16 MB: one per call, overlap 64 px
+    assert (config["tile_size"], config["overlap"], config["tile_batch_size"]) == (512, 64, 1)
+    assert (wrapper.tile_size, wrapper.overlap) == (512, 64)
+    assert config["tiles"] == len(wrapper.plan_tiles((1, 4, 96, 80))) == 4
+    assert wrapper.tune((1, 4, 96, 80)) is config
+
+def test_tune_never_batches_more_tiles_than_the_plan_has():
+    wrapper = TiledVAEWrapper(build_vae(16), memory_budget=1024**4)
+    config = wrapper.tune((1, 4, 16, 16))
+    assert config["tile_size"] == 128 and config["tiles"] == 1 and config["tile_batch_size"] == 1
@@ -0,0 +1,62 @@
+"""
+Bulk decode of exported latents (latents.decode_job) on the tiny random VAE (CPU, no downloads).
+
+    python -m pytest tests/test_latents.py -q
+"""
+import json
+import os
+
+import pytest
+import torch
+from PIL import Image
+
+from harness import build_vae
+from efficient_diffusion_loader.latents import decode_job, save_latents
+from efficient_diffusion_loader.tiled_vae import TiledVAEWrapper
+
+@pytest.fixture
+def latents_dir(tmp_path):
+    generator = torch.Generator().manual_seed(0)
+    for i in range(3):
+        save_latents(str(tmp_path / f"latents_{i:04d}.safetensors"), torch.randn(1, 4, 24, 16, generator=generator),
+                     {"prompt": f"a car #{i}", "seed": i, "scaling_factor": 0.13025})
+    return tmp_path
+
+@pytest.fixture
+def tiling(monkeypatch):
+    """ (tile_size, overlap) of every decode, and whether tune() ran """
+    seen = {"tiles": [], "tuned": False}
+    decode, tune = TiledVAEWrapper.decode_with_blending, TiledVAEWrapper.tune
+
+    def recording_decode(self, latents, *args, **kwargs):
+        seen["tiles"].append((self.tile_size, self.overlap))
+        return decode(self, latents, *args, **kwargs)
+
+    def recording_tune(self, latent_shape):
+        seen["tuned"] = True
+        return tune(self, latent_shape)
+
+    monkeypatch.setattr(TiledVAEWrapper, "decode_with_blending", recording_decode)
+    monkeypatch.setattr(TiledVAEWrapper, "tune", recording_tune)
+    return seen
+
+def test_decode_job_writes_images_and_metadata(latents_dir, tmp_path):
+    output = tmp_path / "out"
+    written = decode_job(str(latents_dir), str(output), vae=build_vae(16), device="cpu", batch_size=2)
+    assert [os.path.basename(p) for p in written] == [f"latents_{i:04d}.png" for i in range(3)]
+    assert Image.open(written[0]).size == (128, 192)
+    metadata = json.loads((output / "metadata" / "latents_0001.json").read_text())
+    assert metadata["seed"] == 1 and metadata["decoded_size"] == [192, 128]
+
+def test_given_tile_size_is_not_auto_tuned(latents_dir, tmp_path, tiling):
+    decode_job(str(latents_dir), str(tmp_path / "out"), vae=build_vae(16), device="cpu", tile_size=64, overlap=16)
+    assert not tiling["tuned"]
+    assert set(tiling["tiles"]) == {(64, 16)}
+
+def test_auto_tune_by_default_and_on_request(latents_dir, tmp_path, tiling):
+    decode_job(str(latents_dir), str(tmp_path / "default"), vae=build_vae(16), device="cpu")
+    assert tiling["tuned"]
+
+    tiling["tuned"] = False
+    decode_job(str(latents_dir), str(tmp_path / "forced"), vae=build_vae(16), device="cpu", tile_size=64, auto_tune=True)
+    assert tiling["tuned"]
@@ -0,0 +1,64 @@
+"""
+ModelStore memory-mapped loads on a tiny VAE snapshot (CPU, no downloads).
+
+    python -m pytest tests/test_model_store.py -q
+"""
+import threading
+
+import pytest
+import torch
+from diffusers import AutoencoderKL
+
+from harness import build_vae
+from efficient_diffusion_loader.model_store import ModelStore, _empty_weights
+
+@pytest.fixture(scope="module")
+def snapshot(tmp_path_factory):
+    path = tmp_path_factory.mktemp("vae")
+    build_vae(width=16).save_pretrained(path)
+    return str(path)
+
+def test_loads_the_saved_weights(snapshot):
+    reference = AutoencoderKL.from_pretrained(snapshot)
+    model = ModelStore(local_files_only=True).load(AutoencoderKL, snapshot)
+    for (name, expected), actual in zip(reference.state_dict().items(), model.state_dict().values()):
+        assert torch.equal(expected, actual), name
+
+def test_empty_weights_is_scoped_to_its_thread_and_block(snapshot):
+    original = torch.nn.Module.register_parameter
+    inside = threading.Event()
+    leave = threading.Event()
+    built = {}
+
+    def empty_build():
+        with _empty_weights():
+            built["empty"] = torch.nn.Linear(4, 4)
+            inside.set()
+            leave.wait(timeout=10)
+
+    thread = threading.Thread(target=empty_build)
+    thread.start()
+    inside.wait(timeout=10)
+    # Another thread building a module meanwhile gets real parameters
+    built["other"] = torch.nn.Linear(4, 4)
+    leave.set()
+    thread.join()
+
+    assert built["empty"].weight.is_meta
+    assert not built["other"].weight.is_meta
+    assert torch.nn.Module.register_parameter is original
+
+    # Concurrent store loads all come back with real weights, and the patch is gone
+    stores = [ModelStore(local_files_only=True) for _ in range(3)]
+    models = [None] * len(stores)
+
+    def load(i):
+        models[i] = stores[i].load(AutoencoderKL, snapshot)
+
+    threads = [threading.Thread(target=load, args=(i,)) for i in range(len(stores))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(not p.is_meta for model in models for p in model.parameters())
+    assert torch.nn.Module.register_parameter is original
@@ -0,0 +1,111 @@
+"""
+EdgeForgePipeline on the tiny random SDXL + ControlNet models from harness.py (CPU, no downloads).
+
+    python -m pytest tests/test_pipeline.py -q
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+import torch
+
+from harness import build_tiny_pipeline, layout_png
+from efficient_diffusion_loader.latents import load_latents
+
+PROMPTS = ["a red car on a street", "a truck in the fog", "a red car on a street"]
+SEEDS = [11, 12, 13]
+
+@pytest.fixture(scope="module")
+def pipeline():
+    return build_tiny_pipeline()
+
+@pytest.fixture(scope="module")
+def controls(pipeline):
+    return [pipeline.preprocess_canny(layout_png(seed=i)) for i in range(len(PROMPTS))]
+
+def test_batched_denoising_matches_sequential(pipeline, controls, tmp_path):
+    # micro_batch=2: one batch of two samples and one of a single sample
+    batched = pipeline.generate_many(PROMPTS, controls, SEEDS, micro_batch=2, latents_dir=str(tmp_path))
+    for i, (prompt, control, seed) in enumerate(zip(PROMPTS, controls, SEEDS)):
+        path = pipeline.generate(prompt, control, seed=seed, latents_path=str(tmp_path / f"sequential_{i}.safetensors"))
+        sequential, _ = load_latents(path)
+        together, metadata = load_latents(batched[i])
+        assert metadata["seed"] == seed and metadata["prompt"] == prompt
+        assert together.shape == sequential.shape == (1, 4, 32, 32)
+        torch.testing.assert_close(together, sequential, atol=1e-4, rtol=1e-3)
+
+def test_batched_images_match_sequential(pipeline, controls):
+    batched = pipeline.generate_many(PROMPTS[:2], controls[:2], SEEDS[:2], micro_batch=2)
+    for image, prompt, control, seed in zip(batched, PROMPTS, controls, SEEDS):
+        sequential = pipeline.generate(prompt, control, seed=seed)
+        difference = np.abs(np.asarray(image, dtype=np.int16) - np.asarray(sequential, dtype=np.int16))
+        assert image.size == sequential.size == (256, 256)
+        assert difference.max() <= 1
+
+def test_seeds_change_the_sample(pipeline, controls):
+    first, second = pipeline.denoise_many(PROMPTS[:1] * 2, controls[:1] * 2, [1, 2])
+    assert not torch.allclose(first, second)
+
+def test_prompt_cache_serves_repeats(pipeline):
+    cache = pipeline.prompt_cache
+    cache.clear()
+    before = cache.stats()
+    batch = cache.as_pipe_kwargs(PROMPTS, pipeline.negative_prompt)
+    stats = cache.stats()
+    # PROMPTS repeats one prompt; the negative prompt is part of every entry
+    assert stats["misses"] - before["misses"] == 2 and stats["hits"] - before["hits"] == 1
+    assert stats["size"] == 2
+    assert batch["prompt_embeds"].shape[0] == len(PROMPTS)
+    torch.testing.assert_close(batch["prompt_embeds"][0], batch["prompt_embeds"][2])
+
+def test_concurrent_generate_on_cold_caches(pipeline, controls, monkeypatch):
+    """
+    generate() from several threads (batcher, jobs, batches) with nothing cached:
+    prompt encoding, control prep and the denoising loop never overlap across threads,
+    and every thread gets what it would have gotten alone.
+    """
+    prompts = [f"a car, variation {i}" for i in range(3)]
+    seeds = [21, 22, 23]
+    expected = [pipeline.denoise_many([p], [c], [s])[0] for p, c, s in zip(prompts, controls, seeds)]
+
+    spans = []
+    def recorded(name, function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                spans.append((name, threading.get_ident(), start, time.perf_counter()))
+        return wrapper
+
+    monkeypatch.setattr(pipeline.pipe, "encode_prompt", recorded("encode_prompt", pipeline.pipe.encode_prompt))
+    monkeypatch.setattr(pipeline, "prepare_control_image", recorded("control", pipeline.prepare_control_image))
+    pipe_class = type(pipeline.pipe)
+    monkeypatch.setattr(pipe_class, "__call__", recorded("pipe", pipe_class.__call__))
+    pipeline.prompt_cache.clear()
+    pipeline.control_cache.clear()
+
+    results, errors = [None] * len(prompts), []
+    barrier = threading.Barrier(len(prompts))
+    def run(i):
+        try:
+            barrier.wait()
+            generator = torch.Generator().manual_seed(seeds[i])
+            results[i] = pipeline._denoise(prompts[i], controls[i], generator)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(prompts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert {name for name, *_ in spans} == {"encode_prompt", "control", "pipe"}
+    for name, thread, start, end in spans:
+        overlapping = [other for other in spans if other[1] != thread and other[2] < end and start < other[3]]
+        assert not overlapping, f"{name} overlapped {overlapping}"
+    for result, reference in zip(results, expected):
+        torch.testing.assert_close(result, reference, atol=1e-4, rtol=1e-3)
@@ -0,0 +1,43 @@
+"""
+ResultCache shared by several workers: two instances on one root stand in for two
+uvicorn worker processes.
+
+    python -m pytest tests/test_result_cache.py -q
+"""
+import harness  # noqa: F401  (src/ on sys.path)
+from efficient_diffusion_loader.result_cache import ResultCache
+
+FILES = {"image.png": b"\x89PNG" + bytes(256), "labels.txt": b"0 0.5 0.5 0.1 0.1"}
+
+def test_entry_stored_by_another_worker_is_a_hit(tmp_path):
+    first, second = ResultCache(str(tmp_path)), ResultCache(str(tmp_path))
+    key = ResultCache.make_key("a car", 7)
+    assert second.get(key) is None
+
+    first.put(key, FILES, {"seed": 7})
+    files, metadata = second.get(key)
+    assert files == FILES and metadata["seed"] == 7
+    stats = second.stats()
+    assert stats["entries"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["bytes"] == first.stats()["bytes"]
+
+def test_losing_a_concurrent_put_indexes_the_stored_entry(tmp_path):
+    first, second = ResultCache(str(tmp_path)), ResultCache(str(tmp_path))
+    key = ResultCache.make_key("a truck", 3)
+    first.put(key, FILES, {"seed": 3})
+
+    # The second worker computed the same result before it could see the first one's
+    second.put(key, FILES, {"seed": 3, "worker": 2})
+    assert second.stats()["entries"] == 1
+    files, metadata = second.get(key)
+    assert files == FILES and "worker" not in metadata
+
+def test_entry_removed_by_another_worker_is_a_miss(tmp_path):
+    first, second = ResultCache(str(tmp_path)), ResultCache(str(tmp_path))
+    key = ResultCache.make_key("a bus", 1)
+    first.put(key, FILES, {})
+    assert second.get(key) is not None
+
+    first.clear()
+    assert second.get(key) is None
+    assert second.stats()["entries"] == 0 and second.stats()["bytes"] == 0
@@ -0,0 +1,179 @@
+"""
+TilePlan geometry, and TiledVAEWrapper against the untiled VAE on the tiny random VAE
+from harness.py (CPU, no downloads).
+
+A random VAE's GroupNorm / mid-block attention see only their tile, so several
+tiles match the full frame only approximately; a single tile must match exactly.
+
+    python -m pytest tests/test_tiled_vae.py -q
+"""
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from harness import build_vae
+from efficient_diffusion_loader.tile_plan import TilePlan
+from efficient_diffusion_loader.tiled_vae import TiledVAEWrapper
+
+@pytest.fixture(scope="module")
+def vae():
+    return build_vae(width=16)
+
+def smooth_image(height, width, seed=0):
+    """ Smooth random colors in [-1, 1]: closer to a render than pixel noise """
+    generator = torch.Generator().manual_seed(seed)
+    small = torch.rand(1, 3, max(2, height // 16), max(2, width // 16), generator=generator) * 2 - 1
+    return torch.nn.functional.interpolate(small, size=(height, width), mode="bicubic", align_corners=False).clamp(-1, 1)
+
+def relative_error(tiled, reference):
+    return ((tiled - reference).abs().mean() / reference.abs().mean()).item()
+
+def cosine(tiled, reference):
+    return torch.nn.functional.cosine_similarity(tiled.flatten(), reference.flatten(), dim=0).item()
+
+@pytest.mark.parametrize("latent_shape, starts, redundancy", [
+    ((1024, 1024), ([0, 192, 384, 576, 768],) * 2, 1.5625),
+    ((1152, 1152), ([0, 224, 448, 672, 896],) * 2, 1280 / 1152 * 1280 / 1152),
+    ((1000, 1000), ([0, 186, 372, 558, 744],) * 2, 1.6384),
+    ((1000, 1152), ([0, 186, 372, 558, 744], [0, 224, 448, 672, 896]), 1.28 * 1280 / 1152),
+    ((300, 300), ([0, 44],) * 2, (512 / 300) ** 2),
+])
+def test_tile_plan_grid(latent_shape, starts, redundancy):
+    plan = TilePlan(latent_shape, tile_size=256, overlap=32)
+    assert (plan.row_starts, plan.col_starts) == starts
+    assert plan.tile_count == len(starts[0]) * len(starts[1])
+    assert plan.total_decoded_area == plan.tile_count * (256 * 8) ** 2
+    assert plan.redundancy_ratio == pytest.approx(redundancy)
+    assert plan.output_shape == (latent_shape[0] * 8, latent_shape[1] * 8)
+    # No window decoded twice, the last one ends on the border, neighbours keep the overlap
+    windows = [(t.h_start, t.w_start) for t in plan]
+    assert len(set(windows)) == len(windows)
+    for axis_starts, size in zip(starts, latent_shape):
+        assert axis_starts[-1] + 256 == size
+        assert all(256 - (b - a) >= 32 for a, b in zip(axis_starts, axis_starts[1:]))
+
+def test_tile_plan_single_tile():
+    plan = TilePlan((1, 4, 200, 256), tile_size=256, overlap=32)
+    assert plan.tile_count == 1
+    assert plan[0] == (0, 200, 0, 256, 0, 1600, 0, 2048)
+    assert plan.tile_shapes() == [(200, 256)]
+    assert plan.total_decoded_area == 1600 * 2048
+    assert plan.redundancy_ratio == 1.0
+
+@torch.no_grad()
+def test_batched_decode_matches_one_tile_per_call(vae):
+    latents = torch.randn(1, 4, 40, 32, generator=torch.Generator().manual_seed(4))
+    decoded, stats = {}, {}
+    for tile_batch_size in (1, 4):
+        wrapper = TiledVAEWrapper(vae, tile_size=128, overlap=32, tile_batch_size=tile_batch_size)
+        decoded[tile_batch_size] = wrapper.decode_with_blending(latents)
+        stats[tile_batch_size] = wrapper.last_decode_stats
+    # 3 x 3 tiles: one call each, or ceil(9 / 4) calls
+    assert stats[1]["tiles"] == stats[4]["tiles"] == 9
+    assert stats[1]["decode_calls"] == 9 and stats[4]["decode_calls"] == 3
+    # Batched convolutions round differently, so equal to float32 rounding only
+    assert torch.allclose(decoded[4], decoded[1], atol=1e-4, rtol=0)
+
+@pytest.mark.parametrize("normalization", ["accumulate", "analytic"])
+@pytest.mark.parametrize("tile_batch_size, max_difference", [(1, 0), (2, 1)])
+@torch.no_grad()
+def test_decode_to_file_matches_in_memory_decode(vae, tmp_path, normalization, tile_batch_size, max_difference):
+    # 4 tile rows starting at latent rows 0, 9, 18, 28: bands of 72, 72, 80 and 128 of 352 pixel rows
+    latents = torch.randn(1, 4, 44, 32, generator=torch.Generator().manual_seed(5))
+    wrapper = TiledVAEWrapper(vae, tile_size=128, overlap=32, tile_batch_size=tile_batch_size,
+                              normalization=normalization)
+    assert wrapper.plan_tiles(latents.shape).row_starts == [0, 9, 18, 28]
+    expected = TiledVAEWrapper.to_uint8(wrapper.decode_with_blending(latents)).astype(np.int16)
+
+    wrapper.decode_to_file(latents, str(tmp_path / "decoded.npy"))
+    assert wrapper.last_decode_stats["peak_band_rows"] < 352
+    wrapper.decode_to_file(latents, str(tmp_path / "decoded.png"))
+    npy = np.load(tmp_path / "decoded.npy")
+    png = np.asarray(Image.open(tmp_path / "decoded.png"))[None]
+    for streamed in (npy, png):
+        assert streamed.shape == expected.shape == (1, 352, 256, 3)
+        assert np.abs(streamed.astype(np.int16) - expected).max() <= max_difference
+
+@torch.no_grad()
+def test_encode_single_tile_is_full_frame(vae):
+    image = smooth_image(128, 128)
+    wrapper = TiledVAEWrapper(vae, tile_size=128, overlap=32)
+    tiled = wrapper.encode_with_blending(image)
+    assert wrapper.last_encode_stats["tiles"] == 1
+    torch.testing.assert_close(tiled, vae.encode(image).latent_dist.mode(), atol=1e-5, rtol=1e-4)
+
+@torch.no_grad()
+def test_encode_matches_full_frame(vae):
+    image = smooth_image(256, 256)
+    wrapper = TiledVAEWrapper(vae, tile_size=192, overlap=64, tile_batch_size=2)
+    tiled = wrapper.encode_with_blending(image)
+    reference = vae.encode(image).latent_dist.mode()
+    assert wrapper.last_encode_stats["tiles"] == 4
+    assert tiled.shape == reference.shape
+    assert cosine(tiled, reference) > 0.97
+    assert relative_error(tiled, reference) < 0.2
+
+@pytest.mark.parametrize("height, width", [(200, 264), (136, 72)])
+@torch.no_grad()
+def test_encode_shape_not_multiple_of_tile(vae, height, width):
+    image = smooth_image(height, width)
+    wrapper = TiledVAEWrapper(vae, tile_size=128, overlap=32)
+    tiled = wrapper.encode_with_blending(image)
+    reference = vae.encode(image).latent_dist.mode()
+    assert tiled.shape == reference.shape == (1, 4, height // 8, width // 8)
+    assert torch.isfinite(tiled).all()
+    assert cosine(tiled, reference) > 0.9
+
+def test_encode_rejects_sizes_off_the_latent_grid(vae):
+    with pytest.raises(ValueError):
+        TiledVAEWrapper(vae, tile_size=128, overlap=32).encode_with_blending(smooth_image(100, 128))
+
+@pytest.mark.parametrize("tile_batch_size", [1, 3])
+@torch.no_grad()
+def test_queue_depth_does_not_change_results(vae, tile_batch_size):
+    latents = torch.randn(1, 4, 40, 32, generator=torch.Generator().manual_seed(1))
+    image = smooth_image(320, 256)
+    decoded, encoded = {}, {}
+    for depth in (0, 2):
+        wrapper = TiledVAEWrapper(vae, tile_size=128, overlap=32, tile_batch_size=tile_batch_size, queue_depth=depth)
+        decoded[depth] = wrapper.decode_with_blending(latents)
+        encoded[depth] = wrapper.encode_with_blending(image)
+        assert wrapper.last_decode_stats["tiles"] > 1
+    assert torch.equal(decoded[0], decoded[2])
+    assert torch.equal(encoded[0], encoded[2])
+
+@torch.no_grad()
+def test_bfloat16_tiles_match_float32(vae):
+    latents = torch.randn(1, 4, 32, 32, generator=torch.Generator().manual_seed(2))
+    image = smooth_image(256, 256)
+    results = {}
+    for precision in ("float32", "bfloat16"):
+        wrapper = TiledVAEWrapper(vae, tile_size=128, overlap=32, tile_batch_size=2, precision=precision)
+        results[precision] = (wrapper.decode_with_blending(latents), wrapper.encode_with_blending(image))
+        assert wrapper.last_decode_stats["fallback_tiles"] == wrapper.last_encode_stats["fallback_tiles"] == 0
+    for full, reduced in zip(results["float32"], results["bfloat16"]):
+        assert reduced.dtype == torch.float32
+        assert relative_error(reduced, full) < 0.05
+
+@torch.no_grad()
+def test_non_finite_tile_falls_back_to_float32(vae, monkeypatch):
+    """ The first tile of every reduced-precision decode call overflows; float32 calls don't """
+    decode = vae.decode
+
+    def overflowing_decode(latents, *args, **kwargs):
+        output = decode(latents, *args, **kwargs)
+        if torch.is_autocast_enabled("cpu"):
+            output.sample[0] = float("nan")
+        return output
+
+    latents = torch.randn(1, 4, 32, 32, generator=torch.Generator().manual_seed(3))
+    reference = TiledVAEWrapper(vae, tile_size=128, overlap=32, tile_batch_size=2).decode_with_blending(latents)
+
+    monkeypatch.setattr(vae, "decode", overflowing_decode)
+    wrapper = TiledVAEWrapper(vae, tile_size=128, overlap=32, tile_batch_size=2, precision="bfloat16")
+    decoded = wrapper.decode_with_blending(latents)
+    stats = wrapper.last_decode_stats
+    assert stats["fallback_tiles"] == stats["decode_calls"] > 0
+    assert torch.isfinite(decoded).all()
+    assert relative_error(decoded, reference) < 0.05
@@ -0,0 +1,119 @@
+"""
+EdgeForge AI: streaming ZIP check (stub components, no GPU).
+
+Downloads /generate_batch at two batch sizes with stub components that render
+incompressible (random) PNGs, and reports per run:
+
+  first byte   seconds until the first chunk of the archive arrived
+  peak         peak Python heap while the response was produced (tracemalloc)
+
+The app runs under a real uvicorn server in a thread (the TestClient buffers whole
+responses, which would hide the streaming). The archive is streamed, so the first byte arrives after about one item and the
+peak must not grow with batch_size. Also checks that the archive is a valid ZIP
+with every image / label pair, for each compression mode.
+
+    python tests/zip_stream_benchmark.py
+    python tests/zip_stream_benchmark.py --sizes 20 200 --image-size 512
+"""
+import io
+import socket
+import threading
+import time
+import tracemalloc
+import zipfile
+
+from harness import StubForge, argument_parser, control_png, finish, install_components
+
+def start_server(app):
+    import uvicorn
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+def download(client, batch_size, compression, keep=False):
+    """
+    Streams one /generate_batch response; returns (stats, archive bytes or None).
+    """
+    form = {"intent": "a red car", "batch_size": batch_size, "compression": compression}
+    files = {"control_image": ("edges.png", control_png(), "image/png")}
+    kept = io.BytesIO() if keep else None
+    total, first_byte = 0, None
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with client.stream("POST", "/generate_batch", data=form, files=files) as response:
+        assert response.status_code == 200, response.read()
+        for chunk in response.iter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            total += len(chunk)
+            if keep:
+                kept.write(chunk)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stats = {
+        "batch_size": batch_size, "compression": compression, "seconds": seconds,
+        "first_byte_seconds": first_byte, "archive_mb": total / 1024**2, "peak_mb": peak / 1024**2,
+    }
+    return stats, (kept.getvalue() if keep else None)
+
+def main():
+    parser = argument_parser("Streaming ZIP memory / latency check", "bench_zip_stream.json")
+    parser.add_argument("--sizes", type=int, nargs=2, default=[10, 60], help="Small and large batch_size")
+    parser.add_argument("--image-size", type=int, default=384, help="Stub image side (random pixels)")
+    parser.add_argument("--decode", type=float, default=0.01, help="Seconds per stub decode")
+    parser.add_argument("--max-growth", type=float, default=1.5,
+                        help="Fail if peak memory at the large size exceeds this x the small size")
+    args = parser.parse_args()
+
+    import httpx
+    from app import main as server
+
+    install_components(server, forge_pipeline=StubForge(0.0, args.decode, size=args.image_size, noise=True))
+    image_mb = args.image_size ** 2 * 3 / 1024**2
+    failures, runs = [], []
+
+    print("--- EdgeForge AI: Streaming ZIP Check ---")
+    uvicorn_server, url = start_server(server.app)
+    with httpx.Client(base_url=url, timeout=600) as client:
+        server.model_loader.wait()
+
+        for compression in ("stored", "deflated", "auto"):
+            stats, data = download(client, 4, compression, keep=True)
+            archive = zipfile.ZipFile(io.BytesIO(data))
+            names = archive.namelist()
+            bad = archive.testzip()
+            expected = [f"{kind}/train_{i:04d}.{ext}" for i in range(4) for kind, ext in (("images", "png"), ("labels", "txt"))]
+            expected += ["manifest.json", "timing.json"]
+            types = {info.filename.rsplit(".", 1)[1]: info.compress_type for info in archive.infolist()}
+            print(f"{compression:>8}: {len(names)} entries, {stats['archive_mb']:.2f} MB, compress types {types}")
+            if bad is not None or sorted(names) != sorted(expected):
+                failures.append(f"{compression} archive is broken (bad entry {bad}, {len(names)} entries)")
+
+        for batch_size in args.sizes:
+            stats, _ = download(client, batch_size, "stored")
+            runs.append(stats)
+            print(f"batch {batch_size:>4}: {stats['archive_mb']:7.1f} MB archive in {stats['seconds']:.2f}s, "
+                  f"first byte {stats['first_byte_seconds']:.3f}s, peak heap {stats['peak_mb']:.1f} MB")
+    uvicorn_server.should_exit = True
+
+    small, large = runs
+    growth = large["peak_mb"] / small["peak_mb"]
+    print(f"Peak heap x{growth:.2f} for x{large['batch_size'] / small['batch_size']:.0f} the images "
+          f"(a buffered archive would grow by ~{(large['batch_size'] - small['batch_size']) * image_mb:.0f} MB)")
+    if growth > args.max_growth:
+        failures.append(f"peak memory grew x{growth:.2f} with batch_size")
+    if large["first_byte_seconds"] > large["seconds"] / 2:
+        failures.append("the first byte arrived after half the batch was done")
+
+    finish(args.output, {"image_size": args.image_size, "runs": runs, "peak_growth": growth}, failures)
+
+if __name__ == "__main__":
+    main()